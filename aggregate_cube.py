@@ -0,0 +1,329 @@
+# Precomputed counts over the categorical survey columns.
+#
+#   python aggregate_cube.py [--db medical.db]     # rebuild the aggregate tables
+#
+# agg_counts holds one row per (column, value) and agg_dim_counts one row per
+# (column, value, dimension, dimension value). ingest_csv.py rebuilds both
+# whenever the base data changes; AggregateRewriter sends matching COUNT /
+# GROUP BY queries to them instead of scanning medical_info.
+
+import argparse
+import logging
+import re
+import sqlite3
+import sys
+import time
+
+TABLE_NAME = "medical_info"
+
+# Columns worth counting: comorbidities, barriers, insurance and assistance answers
+CUBE_PREFIXES = ("C_", "BARRIER_", "INS_TYPE_", "LIS_")
+CUBE_EXTRA_COLUMNS = ("INS_YN", "SEX", "PCP_YN", "EDUCATION", "COMMUNITY_TYPE", "MARITAL_STATUS", "EMPLOYMENT",
+                      "AHRI_ED_HS")
+
+# Columns the counts are split by
+DIMENSIONS = ("AHRI_REGION", "AHRI_RACE_CAT", "AHRI_AGE_CAT", "INCOME")
+
+logger = logging.getLogger(__name__)
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def cube_columns(conn):
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(TABLE_NAME)})")]
+    selected = [col for col in columns
+                if (col.startswith(CUBE_PREFIXES) or col in CUBE_EXTRA_COLUMNS or col in DIMENSIONS)
+                and not col.endswith("_TXT")]
+    dimensions = [col for col in DIMENSIONS if col in columns]
+    return selected, dimensions
+
+
+def current_data_version(conn):
+    try:
+        row = conn.execute("SELECT value FROM ingest_meta WHERE key = 'data_version'").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return row[0] if row else None
+
+
+def cube_is_current(conn):
+    try:
+        row = conn.execute("SELECT value FROM agg_meta WHERE key = 'data_version'").fetchone()
+    except sqlite3.OperationalError:
+        return False
+    return row is not None and row[0] == str(current_data_version(conn))
+
+
+def build_cube(conn):
+    """(Re)build the aggregate tables in one transaction on a writable connection.
+
+    The tables are stamped with the ingest data_version. A database without
+    one (not loaded by ingest_csv.py) gets no aggregate tables: nothing the
+    build could stamp them with would still match the file afterwards.
+    """
+    started = time.perf_counter()
+    version = current_data_version(conn)
+    if version is None:
+        logger.warning("Not building aggregate tables: no ingest_meta data_version (load the data with ingest_csv.py)")
+        return {"skipped": "no ingest_meta data_version", "seconds": round(time.perf_counter() - started, 3)}
+    columns, dimensions = cube_columns(conn)
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS agg_counts")
+        conn.execute("DROP TABLE IF EXISTS agg_dim_counts")
+        conn.execute("CREATE TABLE agg_counts (column_name TEXT NOT NULL, value, n INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE agg_dim_counts (column_name TEXT NOT NULL, value, "
+                     "dimension TEXT NOT NULL, dim_value, n INTEGER NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS agg_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        # One grouped scan per column into a small temp table, then roll the
+        # per-dimension counts up from it instead of rescanning medical_info
+        conn.execute("DROP TABLE IF EXISTS temp.agg_scan")
+        dim_list = "".join(f", {quote_identifier(dimension)}" for dimension in dimensions)
+        for column in columns:
+            conn.execute(
+                f"CREATE TEMP TABLE agg_scan AS SELECT {quote_identifier(column)} AS value{dim_list}, COUNT(*) AS n "
+                f"FROM {quote_identifier(TABLE_NAME)} GROUP BY {quote_identifier(column)}{dim_list}"
+            )
+            conn.execute("INSERT INTO agg_counts (column_name, value, n) "
+                         "SELECT ?, value, SUM(n) FROM temp.agg_scan GROUP BY value", (column,))
+            for dimension in dimensions:
+                if dimension == column:
+                    continue
+                conn.execute(
+                    f"INSERT INTO agg_dim_counts (column_name, value, dimension, dim_value, n) "
+                    f"SELECT ?, value, ?, {quote_identifier(dimension)}, SUM(n) FROM temp.agg_scan "
+                    f"GROUP BY value, {quote_identifier(dimension)}", (column, dimension)
+                )
+            conn.execute("DROP TABLE temp.agg_scan")
+
+        conn.execute("CREATE INDEX idx_agg_counts ON agg_counts (column_name, value)")
+        conn.execute("CREATE INDEX idx_agg_dim_counts ON agg_dim_counts (column_name, dimension, value, dim_value)")
+        total = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(TABLE_NAME)}").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO agg_meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            [("data_version", str(version)), ("total_rows", str(total)),
+             ("built_at", str(time.time()))]
+        )
+    return {"columns": len(columns), "dimensions": len(dimensions), "rows": total,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+# ---- query rewriting ------------------------------------------------------
+
+_QUERY = re.compile(
+    r"^SELECT\s+(?P<select>.+?)\s+FROM\s+\"?" + TABLE_NAME + r"\"?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+))?$",
+    re.IGNORECASE | re.DOTALL
+)
+_COLUMN = re.compile(r'^(?P<lower>LOWER\(\s*)?"?(?P<name>[A-Za-z_]\w*)"?(?(lower)\s*\))'
+                     r'(?:\s+AS\s+(?P<q>"?)(?P<alias>\w+)(?P=q))?$', re.IGNORECASE)
+_COUNT = re.compile(r'^COUNT\(\s*(?:\*|1|"?CASE_ID"?)\s*\)(?:\s+AS\s+(?P<q>"?)(?P<alias>\w+)(?P=q))?$',
+                    re.IGNORECASE)
+_PREDICATE = re.compile(r"^(?P<lower>LOWER\(\s*)?\"?(?P<name>[A-Za-z_]\w*)\"?(?(lower)\s*\))\s*=\s*'(?P<value>[^']*)'$",
+                        re.IGNORECASE)
+_UNSUPPORTED = re.compile(r"\b(JOIN|DISTINCT|HAVING|UNION|OVER|SELECT\s.+\bSELECT)\b|\(\s*SELECT", re.IGNORECASE | re.DOTALL)
+
+
+def split_top_level(text, separator=","):
+    """Split on ``separator`` outside parentheses and quoted strings."""
+    parts, depth, current, quote = [], 0, [], None
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == separator and depth == 0 and quote is None:
+            parts.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append("".join(current).strip())
+    return parts
+
+
+def _sql_string(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def parse_count_query(sql):
+    """Break a simple COUNT(*) / GROUP BY query over medical_info into its
+    parts, or return None when it's anything more complicated."""
+    sql = " ".join(sql.strip().rstrip(";").split())
+    if _UNSUPPORTED.search(sql):
+        return None
+    match = _QUERY.match(sql)
+    if not match:
+        return None
+
+    selected, count_alias, count_position = [], None, None
+    for position, item in enumerate(split_top_level(match.group("select"))):
+        count = _COUNT.match(item)
+        column = _COLUMN.match(item)
+        if count and count_alias is None:
+            count_alias = count.group("alias") or item
+            count_position = position
+        elif column:
+            selected.append((column.group("name").upper(), bool(column.group("lower")),
+                             column.group("alias") or item))
+        else:
+            return None
+    if count_alias is None:
+        return None
+
+    filters = []
+    if match.group("where"):
+        for predicate in re.split(r"\s+AND\s+", match.group("where"), flags=re.IGNORECASE):
+            predicate_match = _PREDICATE.match(predicate.strip().strip("()").strip())
+            if not predicate_match:
+                return None
+            filters.append((predicate_match.group("name").upper(), bool(predicate_match.group("lower")),
+                            predicate_match.group("value")))
+
+    groups = []
+    if match.group("group"):
+        for item in split_top_level(match.group("group")):
+            column = _COLUMN.match(item)
+            if not column or column.group("alias"):
+                return None
+            groups.append((column.group("name").upper(), bool(column.group("lower"))))
+    # Every selected column has to be grouped, or the query isn't a plain count
+    if sorted((name, lower) for name, lower, _ in selected) != sorted(groups):
+        return None
+
+    return {"selected": selected, "count_alias": count_alias, "count_position": count_position, "filters": filters,
+            "groups": groups, "order": match.group("order"), "limit": match.group("limit")}
+
+
+def numeric_affinity(declared_type):
+    """Whether SQLite gives a column declared ``declared_type`` numeric
+    affinity, so ``column = '1'`` compares as a number."""
+    declared = (declared_type or "").upper()
+    return not any(word in declared for word in ("CHAR", "CLOB", "TEXT", "BLOB")) and bool(declared)
+
+
+def rewrite_count_query(parsed, columns, dimensions, numeric=frozenset()):
+    """Return ``(sql, table)`` answering ``parsed`` from the aggregate tables, or None.
+
+    ``numeric`` names the columns with numeric affinity. The cube's value
+    columns have none, so ``value = '1'`` wouldn't match the stored 1 the
+    way the base table does; filters on those columns aren't rewritten.
+    """
+    if any(name in numeric and not lower for name, lower, _ in parsed["filters"]):
+        return None
+    referenced = list(dict.fromkeys([name for name, _, _ in parsed["selected"]]
+                                    + [name for name, _, _ in parsed["filters"]]))
+    if len(referenced) > 2 or any(name not in columns for name in referenced):
+        return None
+    if len(parsed["filters"]) != len({name for name, _, _ in parsed["filters"]}):
+        return None
+
+    if not referenced:
+        return None
+    if len(referenced) == 1:
+        table = "agg_counts"
+        mapping = {referenced[0]: "value"}
+        conditions = [f"column_name = {_sql_string(referenced[0])}"]
+    else:
+        # Pairs are stored as (any cube column, dimension)
+        first, second = referenced
+        if second in dimensions:
+            column, dimension = first, second
+        elif first in dimensions:
+            column, dimension = second, first
+        else:
+            return None
+        table = "agg_dim_counts"
+        mapping = {column: "value", dimension: "dim_value"}
+        conditions = [f"column_name = {_sql_string(column)}", f"dimension = {_sql_string(dimension)}"]
+
+    def expression(name, lower):
+        return f"LOWER({mapping[name]})" if lower else mapping[name]
+
+    for name, lower, value in parsed["filters"]:
+        conditions.append(f"{expression(name, lower)} = {_sql_string(value)}")
+
+    count_alias = quote_identifier(parsed["count_alias"])
+    select_items = [f"{expression(name, lower)} AS {quote_identifier(alias)}"
+                    for name, lower, alias in parsed["selected"]]
+    # The count goes back where the query had it: "SELECT COUNT(*), SEX" isn't "SELECT SEX, COUNT(*)"
+    if parsed["groups"]:
+        select_items.insert(parsed["count_position"], f"SUM(n) AS {count_alias}")
+    else:
+        select_items.insert(parsed["count_position"], f"COALESCE(SUM(n), 0) AS {count_alias}")
+
+    sql = f"SELECT {', '.join(select_items)} FROM {table} WHERE {' AND '.join(conditions)}"
+    if parsed["groups"]:
+        sql += " GROUP BY " + ", ".join(expression(name, lower) for name, lower in parsed["groups"])
+    if parsed["order"]:
+        order = re.sub(r"COUNT\(\s*(?:\*|1|\"?CASE_ID\"?)\s*\)", count_alias, parsed["order"], flags=re.IGNORECASE)
+        for name, lower, alias in parsed["selected"]:
+            order = re.sub(rf'(?<![\w"])"?{name}"?(?![\w"])', quote_identifier(alias), order, flags=re.IGNORECASE)
+        sql += f" ORDER BY {order}"
+    if parsed["limit"]:
+        sql += f" LIMIT {parsed['limit']}"
+    return sql, table
+
+
+class AggregateRewriter:
+    """Sends simple count queries to the aggregate tables while they match
+    the current data version; stale or missing tables mean no rewrite."""
+
+    def __init__(self, db_pool):
+        self.db_pool = db_pool
+        self._state = (None, None)
+
+    def _cube(self):
+        version = self.db_pool.data_version()
+        if self._state[0] == version:
+            return self._state[1]
+        cube = None
+        if self.db_pool.table_exists("agg_meta"):
+            with self.db_pool.cursor() as cursor:
+                cursor.execute("SELECT value FROM agg_meta WHERE key = 'data_version'")
+                row = cursor.fetchone()
+                if row and row[0] == str(version):
+                    cursor.execute("SELECT DISTINCT column_name FROM agg_counts")
+                    columns = {r[0] for r in cursor.fetchall()}
+                    cursor.execute("SELECT DISTINCT dimension FROM agg_dim_counts")
+                    dimensions = {r[0] for r in cursor.fetchall()}
+                    cursor.execute(f"PRAGMA table_info({quote_identifier(TABLE_NAME)})")
+                    numeric = {r[1].upper() for r in cursor.fetchall() if numeric_affinity(r[2])}
+                    cube = (columns, dimensions, numeric)
+        self._state = (version, cube)
+        return cube
+
+    def rewrite(self, sql):
+        cube = self._cube()
+        if cube is None:
+            return None
+        parsed = parse_count_query(sql)
+        if parsed is None:
+            return None
+        return rewrite_count_query(parsed, *cube)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the aggregate count tables")
+    parser.add_argument("--db", default="medical.db", help="SQLite database file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(format="%(message)s")
+    conn = sqlite3.connect(args.db)
+    try:
+        stats = build_cube(conn)
+    finally:
+        conn.close()
+    print(", ".join(f"{key}={value}" for key, value in stats.items()))
+    return 1 if "skipped" in stats else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,322 @@
+# Async serving mode for /usa-health.
+#
+#   uvicorn asgi_app:app --port 5000
+#   python asgi_app.py --port 5000
+#
+# Questions are translated with awaited OpenAI calls and SQLite work and chart
+# rendering run on a small thread pool; identical questions in flight share
+# one translation and one execution. Streams, jobs and the stats endpoints are
+# served by the Flask app from text_n_graph1.py, mounted underneath.
+
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import FileResponse, JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import text_n_graph1 as text_app
+from assistant_jobs import job_accepted
+from chart_store import etag_matches, mimetype
+from dataset_catalog import DatasetError
+from openai_client import CircuitOpenError
+from request_metrics import metrics, request_finished, request_started, span, start_trace
+from result_paging import PageTokenError, clamp_page_size, decode_page_token
+
+# Requests to /usa-health handled at once, in total and per client address
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', '64'))
+MAX_REQUESTS_PER_CLIENT = int(os.getenv('MAX_REQUESTS_PER_CLIENT', '8'))
+
+# Seconds a refused client is told to wait
+RETRY_AFTER_SECONDS = int(os.getenv('RETRY_AFTER_SECONDS', '2'))
+
+# Threads running SQLite work; each keeps its own pooled connection
+SQL_WORKERS = int(os.getenv('SQL_WORKERS', '8'))
+
+# Only these routes count against the limits; job polling and stats don't
+LIMITED_ROUTES = {("POST", "/usa-health"), ("POST", "/usa-health/batch")}
+
+sql_executor = ThreadPoolExecutor(max_workers=SQL_WORKERS, thread_name_prefix="sql")
+
+
+class SingleFlight:
+    """Runs one task per key; callers arriving while it is in flight await
+    the same result. The task is shielded, so a caller disconnecting doesn't
+    cancel work the others are waiting on."""
+
+    def __init__(self):
+        self._tasks = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def run(self, key, make_coroutine):
+        task = self._tasks.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(make_coroutine())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def summary(self):
+        return {"in_flight": len(self._tasks), "started": self.started, "coalesced": self.coalesced}
+
+
+class ConcurrencyLimitMiddleware:
+    """Refuses requests beyond the global or per-client limit with 429 and
+    Retry-After instead of queueing them, so overload stays bounded. A slot is
+    held for the whole response, including streamed bodies."""
+
+    def __init__(self, app, max_total=MAX_CONCURRENT_REQUESTS, max_per_client=MAX_REQUESTS_PER_CLIENT,
+                 routes=LIMITED_ROUTES):
+        self.app = app
+        self.max_total = max_total
+        self.max_per_client = max_per_client
+        self.routes = routes
+        self.active = 0
+        self.per_client = {}
+        self.rejected = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"].rstrip("/")) not in self.routes:
+            return await self.app(scope, receive, send)
+
+        client = scope["client"][0] if scope.get("client") else "unknown"
+        if self.active >= self.max_total or self.per_client.get(client, 0) >= self.max_per_client:
+            self.rejected += 1
+            scope_of_limit = "server" if self.active >= self.max_total else "client"
+            response = JSONResponse({"error": f"Too many requests in progress ({scope_of_limit} limit), try again later"},
+                                    status_code=429, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+            return await response(scope, receive, send)
+
+        self.active += 1
+        self.per_client[client] = self.per_client.get(client, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active -= 1
+            self.per_client[client] -= 1
+            if not self.per_client[client]:
+                del self.per_client[client]
+
+    def summary(self):
+        return {"active": self.active, "clients": len(self.per_client), "rejected": self.rejected,
+                "max_total": self.max_total, "max_per_client": self.max_per_client}
+
+
+flights = SingleFlight()
+flask_asgi = WSGIMiddleware(text_app.app)
+
+
+class FlaskResponse:
+    """Hands a request whose body was already read on to the Flask app."""
+
+    def __init__(self, body):
+        self.body = body
+
+    async def __call__(self, scope, receive, send):
+        sent = False
+
+        async def replay():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": self.body, "more_body": False}
+
+        await flask_asgi(scope, replay, send)
+
+
+# Run fn on the SQL pool; the copied context carries the request's trace with it
+async def in_thread(fn, *args):
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(sql_executor, call)
+
+
+async def translate(question, dataset=None):
+    payload = text_app.sql_prompt_payload(question, dataset)
+    try:
+        response = await text_app.openai_api.achat_completion(payload, label="question_to_sql")
+        return text_app.clean_sql_reply(response)
+    except httpx.HTTPStatusError as http_err:
+        return {"error": f"HTTP error occurred: {http_err}"}
+    except (httpx.HTTPError, CircuitOpenError) as req_err:
+        return {"error": f"Request error occurred: {req_err}"}
+    except Exception as err:
+        return {"error": f"An error occurred: {err}"}
+
+
+async def chart_spec(question, dataset=None):
+    payload = text_app.chart_spec_payload(question, dataset)
+    try:
+        response = await text_app.openai_api.achat_completion(payload, label="question_to_chart_spec")
+        return json.loads(response["choices"][0]["message"]["content"])
+    except (httpx.HTTPError, CircuitOpenError) as req_err:
+        return {"error": f"Request error occurred: {req_err}"}
+    except Exception as err:
+        return {"error": f"An error occurred: {err}"}
+
+
+async def ask_chart(question, data, request, dataset):
+    fmt, width = text_app.chart_variant_args(data, request.query_params)
+    render_fmt = "svg" if fmt == "svg" else "png"
+    artifact = await in_thread(text_app.stored_chart, question, render_fmt, dataset)
+    source, tier = "store", "cache"
+    if artifact is None:
+        artifact = await in_thread(text_app.template_chart, question, render_fmt, dataset)
+        source, tier = "local", 0
+        if artifact is None:
+            spec = await flights.run(("chart", dataset.name, " ".join(question.lower().split())),
+                                     lambda: chart_spec(question, dataset))
+            artifact = await flights.run(("render", dataset.name, json.dumps(spec, sort_keys=True), render_fmt),
+                                         lambda: in_thread(text_app.render_local_chart, spec, render_fmt, dataset))
+            tier = 1
+        if artifact:
+            await in_thread(text_app.remember_chart, question, artifact, dataset)
+        elif render_fmt != "png":
+            artifact = await in_thread(text_app.stored_chart, question, "png", dataset)
+            source, tier = "store", "cache"
+    if artifact:
+        text_app.router.record("graph", tier)
+        artifact = await in_thread(text_app.chart_store.variant, artifact, fmt, width)
+        headers = text_app.chart_headers(artifact, source, tier=tier)
+        if etag_matches(request.headers.get("if-none-match"), artifact):
+            return Response(status_code=304, headers=headers)
+        return FileResponse(os.path.abspath(artifact.path), media_type=mimetype(artifact), headers=headers)
+
+    # Code Interpreter runs as a background job, exactly as in the Flask app
+    if not dataset.csv_path:
+        return JSONResponse({"error": f"Dataset '{dataset.name}' has no CSV for Code Interpreter charts"},
+                            status_code=400)
+    text_app.router.record("graph", 2)
+    job_id = text_app.jobs.submit(text_app.process_graphical_query, question, dataset)
+    with text_app.app.test_request_context():
+        response, status = job_accepted(job_id)
+    return JSONResponse(response.get_json(), status_code=status,
+                        headers={key: value for key, value in response.headers.items()
+                                 if key in ("Location", "Retry-After")})
+
+
+async def answer(request):
+    body = await request.body()
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        return JSONResponse({"error": "Request body must be JSON"}, status_code=400)
+    question = data.get('query')
+    page_token = data.get('page_token') or request.query_params.get('page_token')
+    if not question and not page_token:
+        return JSONResponse({"error": "No question provided"}, status_code=400)
+    try:
+        dataset = text_app.request_dataset(data, request.query_params)
+    except DatasetError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not page_token and text_app.is_chart_request(question):
+        return await ask_chart(question, data, request, dataset)
+
+    # Streamed results keep their Flask implementation
+    if data.get('stream') or request.query_params.get('stream'):
+        return FlaskResponse(body)
+
+    try:
+        limit = clamp_page_size(data.get('limit') or request.query_params.get('limit'))
+        if page_token:
+            sql_query, offset, page_dataset, after = decode_page_token(page_token)
+            dataset = text_app.catalog.get(page_dataset)
+            cache_tier = "page"
+    except (PageTokenError, DatasetError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    if not page_token:
+        offset, after = 0, None
+        sql_query, cache_tier = await in_thread(text_app.local_sql, question, dataset)
+        if sql_query is None:
+            # Identical questions arriving together share one OpenAI call
+            sql_query = await flights.run(("sql", dataset.name, " ".join(question.lower().split())),
+                                          lambda: translate(question, dataset))
+            if isinstance(sql_query, dict) and "error" in sql_query:
+                return JSONResponse({"error": sql_query["error"]}, status_code=400)
+
+    # ... and one execution of the resulting page
+    execution_result = await flights.run(
+        ("execute", dataset.name, sql_query, limit, offset, json.dumps(after, sort_keys=True)),
+        lambda: in_thread(text_app.execute_query_with_steps, sql_query, limit, offset, dataset, after)
+    )
+    result, status = await in_thread(functools.partial(text_app.text_query_response, dataset=dataset), question,
+                                      sql_query, cache_tier, offset, execution_result)
+    with span("serialize"):
+        return JSONResponse(result, status_code=status)
+
+
+# Requests coalesced onto another's work only see the stages they ran themselves
+async def ask(request):
+    trace = start_trace()
+    started = request_started("/usa-health")
+    status = 500
+    try:
+        response = await answer(request)
+        # Streams are counted by the Flask app they are handed to
+        status = None if isinstance(response, FlaskResponse) else response.status_code
+        if status is not None and trace.spans:
+            response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        request_finished("/usa-health", status, started)
+
+
+async def serving_stats(request):
+    return JSONResponse({"limits": app.summary(), "single_flight": flights.summary()})
+
+
+# Limiter and coalescing counters for /metrics
+def serving_metrics():
+    limits, single_flight = app.summary(), flights.summary()
+    return [
+        ("asgi_requests_active", "gauge", "Requests holding a concurrency slot", [({}, limits["active"])]),
+        ("asgi_rejected_total", "counter", "Requests refused with 429", [({}, limits["rejected"])]),
+        ("single_flight_in_flight", "gauge", "Distinct coalesced tasks running", [({}, single_flight["in_flight"])]),
+        ("single_flight_total", "counter", "Coalescable calls by whether they started work or joined it",
+         [({"result": "started"}, single_flight["started"]), ({"result": "coalesced"}, single_flight["coalesced"])]),
+    ]
+
+
+metrics.add_collector(serving_metrics)
+
+
+@asynccontextmanager
+async def lifespan(_):
+    yield
+    await text_app.openai_api.aclose()
+    sql_executor.shutdown(wait=False)
+
+
+starlette_app = Starlette(
+    routes=[
+        Route('/usa-health', ask, methods=['POST']),
+        Route('/usa-health/serving-stats', serving_stats, methods=['GET']),
+        Mount('/', app=flask_asgi),
+    ],
+    lifespan=lifespan,
+)
+app = ConcurrencyLimitMiddleware(starlette_app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve /usa-health with the async server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
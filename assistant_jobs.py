@@ -0,0 +1,295 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from flask import Response, jsonify, send_file, stream_with_context, url_for
+
+from request_metrics import start_trace
+
+# At most this many assistant runs are followed at the same time
+MAX_IN_FLIGHT_RUNS = int(os.getenv('MAX_IN_FLIGHT_RUNS', '4'))
+
+# Jobs waiting for a free slot beyond this are refused with 503
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', '32'))
+
+# Finished jobs are forgotten after this many seconds
+JOB_TTL_SECONDS = int(os.getenv('JOB_TTL_SECONDS', '3600'))
+
+# A run that has not finished after this long is cancelled
+RUN_TIMEOUT_SECONDS = int(os.getenv('RUN_TIMEOUT_SECONDS', '600'))
+
+# Follow runs through the streaming run events; polling is the fallback
+STREAM_RUNS = os.getenv('ASSISTANT_STREAM_RUNS', '1') == '1'
+
+TERMINAL_RUN_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+# Stream events that change a run's status; step, message and delta events don't
+RUN_STATUS_EVENTS = {f"thread.run.{status}" for status in
+                     ("created", "queued", "in_progress", "cancelling") + tuple(TERMINAL_RUN_STATUSES)}
+
+
+# Poll a run with adaptive backoff: quick first checks so short runs return
+# promptly, growing to max_delay so long runs don't hammer the API.
+def wait_for_run(client, thread_id, run_id, on_event=None, initial_delay=0.5, max_delay=8.0,
+                 timeout=RUN_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+    while run.status not in TERMINAL_RUN_STATUSES:
+        if time.monotonic() + delay > deadline:
+            client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            raise TimeoutError(f"Assistant run {run_id} did not finish within {timeout} seconds")
+        time.sleep(delay)
+        delay = min(delay * 1.6, max_delay)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        if on_event:
+            on_event(f"thread.run.{run.status}")
+    return run
+
+
+# Start a run and block until it reaches a terminal state, using the event
+# stream when available and adaptive polling otherwise. Either way a run still
+# going after ``timeout`` seconds is cancelled.
+def follow_run(client, thread_id, assistant_id, on_event=None, timeout=RUN_TIMEOUT_SECONDS):
+    if STREAM_RUNS:
+        deadline = time.monotonic() + timeout
+        started, run_id = False, None
+        try:
+            # A stalled stream sends no events to check the deadline against;
+            # the read timeout ends the wait for the next one instead
+            with client.beta.threads.runs.stream(thread_id=thread_id, assistant_id=assistant_id,
+                                                 timeout=timeout) as stream:
+                for event in stream:
+                    started = True
+                    if event.event in RUN_STATUS_EVENTS:
+                        run_id = event.data.id
+                    if on_event:
+                        on_event(event.event)
+                    if time.monotonic() > deadline:
+                        break
+                if time.monotonic() <= deadline:
+                    return stream.get_final_run()
+        except Exception as e:
+            # Only fall back when the stream never opened; otherwise a run
+            # already exists and starting another would duplicate the work.
+            if time.monotonic() <= deadline and (started or not isinstance(e, openai.APIError)):
+                raise
+        if time.monotonic() > deadline:
+            if run_id:
+                client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run_id)
+            raise TimeoutError(f"Assistant run on thread {thread_id} did not finish within {timeout} seconds")
+
+    run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=assistant_id)
+    if on_event:
+        on_event(f"thread.run.{run.status}")
+    return wait_for_run(client, thread_id, run.id, on_event=on_event, timeout=timeout)
+
+
+# Run the assistant on a fresh thread and return its messages
+def run_assistant(client, assistant_id, question, on_event=None):
+    thread = client.beta.threads.create()
+    client.beta.threads.messages.create(
+        thread_id=thread.id,
+        role='user',
+        content=question
+    )
+
+    run = follow_run(client, thread.id, assistant_id, on_event=on_event)
+    if run.status != "completed":
+        reason = run.last_error.message if run.last_error else run.status
+        raise RuntimeError(f"Assistant run {run.id} ended with status '{run.status}': {reason}")
+
+    return client.beta.threads.messages.list(thread_id=thread.id)
+
+
+class JobManager:
+    """Runs assistant work on a bounded background executor and keeps the
+    status of each job so clients can poll for it or subscribe to events."""
+
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT_RUNS, max_queued=MAX_QUEUED_JOBS, ttl=JOB_TTL_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="assistant-job")
+        self._max_pending = max_in_flight + max_queued
+        self._ttl = ttl
+        self._jobs = {}
+        self._changed = threading.Condition()
+
+    def submit(self, fn, *args):
+        """Queue ``fn(*args, on_event=...)`` and return the job id, or None
+        when too many jobs are already pending."""
+        with self._changed:
+            self._expire(time.time())
+            pending = sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+            if pending >= self._max_pending:
+                return None
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": "queued",
+                "event": None,
+                "error": None,
+                "result": None,
+                "created_at": now,
+                "updated_at": now,
+                "version": 0,
+                "timings": [],
+            }
+        self._executor.submit(self._run, job_id, fn, args)
+        return job_id
+
+    def get(self, job_id):
+        with self._changed:
+            self._expire(time.time())
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait_for_change(self, job_id, version, timeout):
+        """Block until the job's version moves past ``version`` or ``timeout`` elapses."""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]["version"] > version,
+                timeout=timeout
+            )
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def counts(self):
+        """Number of known jobs per status."""
+        with self._changed:
+            self._expire(time.time())
+            counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            return counts
+
+    def _update(self, job_id, **fields):
+        with self._changed:
+            job = self._jobs[job_id]
+            job.update(fields)
+            job["updated_at"] = time.time()
+            job["version"] += 1
+            self._changed.notify_all()
+
+    def _run(self, job_id, fn, args):
+        self._update(job_id, status="running")
+        # The job's own stages (assistant run, file download) are reported with its status
+        trace = start_trace()
+        last_event = None
+
+        def on_event(event):
+            nonlocal last_event
+            # Every update wakes the status subscribers, so message deltas and
+            # repeated poll results aren't passed on
+            if event in RUN_STATUS_EVENTS and event != last_event:
+                last_event = event
+                self._update(job_id, event=event)
+
+        try:
+            result = fn(*args, on_event=on_event)
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), timings=trace.spans)
+            return
+        if isinstance(result, dict) and "error" in result:
+            self._update(job_id, status="failed", error=result["error"], timings=trace.spans)
+        else:
+            self._update(job_id, status="completed", result=result, timings=trace.spans)
+
+    def _expire(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if job["status"] in ("completed", "failed") and now - job["updated_at"] > self._ttl:
+                del self._jobs[job_id]
+
+
+def _job_payload(job):
+    payload = {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "event": job["event"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+    if job["timings"]:
+        payload["timings"] = job["timings"]
+    if job["status"] == "failed":
+        payload["error"] = job["error"]
+    if job["status"] == "completed":
+        payload["result_url"] = url_for("job_result", job_id=job["job_id"])
+    return payload
+
+
+# Response for a freshly submitted job: 202 with where to find the result
+def job_accepted(job_id):
+    if job_id is None:
+        response = jsonify({"error": "Too many chart requests in progress, try again later"})
+        response.headers["Retry-After"] = "10"
+        return response, 503
+    response = jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("job_status", job_id=job_id),
+        "result_url": url_for("job_result", job_id=job_id),
+        "events_url": url_for("job_events", job_id=job_id),
+    })
+    response.headers["Location"] = url_for("job_status", job_id=job_id)
+    return response, 202
+
+
+# Status, result and server-sent-event endpoints for background jobs
+def register_job_routes(app, jobs, prefix="/usa-health/jobs"):
+
+    @app.route(f"{prefix}/<job_id>", methods=['GET'])
+    def job_status(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown job"}), 404
+        return jsonify(_job_payload(job))
+
+    @app.route(f"{prefix}/<job_id>/result", methods=['GET'])
+    def job_result(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown job"}), 404
+        if job["status"] == "failed":
+            return jsonify({"error": job["error"]}), 400
+        if job["status"] != "completed":
+            response = jsonify(_job_payload(job))
+            response.headers["Retry-After"] = "2"
+            return response, 202
+        # Results are named by their content digest, which makes a stable ETag
+        etag = os.path.splitext(os.path.basename(job["result"]))[0]
+        try:
+            return send_file(os.path.abspath(job["result"]), mimetype='image/png', etag=etag)
+        except FileNotFoundError:
+            # The chart store has evicted the image since the job finished
+            return jsonify({"error": "The result has expired; ask the question again"}), 410
+
+    @app.route(f"{prefix}/<job_id>/events", methods=['GET'])
+    def job_events(job_id):
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown job"}), 404
+
+        def generate(job):
+            while True:
+                yield f"event: status\ndata: {json.dumps(_job_payload(job))}\n\n"
+                if job["status"] in ("completed", "failed"):
+                    return
+                version = job["version"]
+                while True:
+                    job = jobs.wait_for_change(job_id, version, timeout=15)
+                    if job is None:
+                        return
+                    if job["version"] > version:
+                        break
+                    # Keep idle connections open through proxies
+                    yield ": keep-alive\n\n"
+
+        return Response(
+            stream_with_context(generate(job)),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
@@ -0,0 +1,342 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import openai
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Where the registry is kept between restarts
+REGISTRY_PATH = os.getenv('ASSISTANT_REGISTRY_PATH', '.assistant_registry.json')
+
+# Entries not used for this long are deleted remotely and locally
+MAX_AGE_SECONDS = int(os.getenv('ASSISTANT_REGISTRY_MAX_AGE', str(7 * 24 * 3600)))
+
+# How often a cached entry is checked against the API before it is reused
+VERIFY_INTERVAL_SECONDS = int(os.getenv('ASSISTANT_REGISTRY_VERIFY_INTERVAL', '300'))
+
+# How often lookups also garbage-collect expired and superseded entries
+COLLECT_INTERVAL_SECONDS = int(os.getenv('ASSISTANT_REGISTRY_GC_INTERVAL', '3600'))
+
+SECTIONS = {"files": "file_id", "assistants": "assistant_id"}
+
+
+# Hash the dataset contents so that a changed CSV gets a fresh upload
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _text_sha256(*parts):
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+# Exclusive lock on a file, held across processes (both apps share the registry)
+@contextmanager
+def _file_lock(path):
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class AssistantRegistry:
+    """Creates the uploaded dataset file and the Code Interpreter assistant once
+    per (dataset content, instructions) pair and reuses them across requests and
+    restarts.
+
+    The registry is a small JSON document on local disk::
+
+        {"files": {<dataset_hash>: {...}}, "assistants": {<key>: {...}}}
+
+    Several processes may share it: every write first merges in what the others
+    have written, under a lock file next to it. Entries are verified against the
+    API before reuse (at most every ``verify_interval`` seconds) and
+    garbage-collected when they are superseded by a new dataset version or have
+    not been used for ``max_age`` seconds; lookups run the collection at most
+    every ``collect_interval`` seconds.
+
+    No lock is held during API calls. Requests for the same assistant or file
+    wait for each other, so it is only created once.
+    """
+
+    def __init__(self, client, path=REGISTRY_PATH, max_age=MAX_AGE_SECONDS,
+                 verify_interval=VERIFY_INTERVAL_SECONDS, collect_interval=COLLECT_INTERVAL_SECONDS):
+        self.client = client
+        self.path = path
+        self.max_age = max_age
+        self.verify_interval = verify_interval
+        self.collect_interval = collect_interval
+        # Guards the in-memory state and the registry file; never held during API calls
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._hash_cache = {}
+        self._last_collect = 0.0
+        # Keys this process has added/used or removed since it last wrote the file
+        self._dirty = {section: set() for section in SECTIONS}
+        self._removed = {section: set() for section in SECTIONS}
+        self._state = self._load()
+
+    # ---- persistence -----------------------------------------------------
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        for section in SECTIONS:
+            state.setdefault(section, {})
+        return state
+
+    def _save(self):
+        # Called with self._lock held. The file on disk is the shared state:
+        # this process's changes are applied on top of it, so entries another
+        # process added or collected since we last read it aren't lost or revived
+        with _file_lock(f"{self.path}.lock"):
+            merged = self._load()
+            for section, id_field in SECTIONS.items():
+                entries = merged[section]
+                for key in self._removed[section]:
+                    entries.pop(key, None)
+                for key in self._dirty[section]:
+                    ours = self._state[section].get(key)
+                    if ours is None:
+                        continue
+                    theirs = entries.get(key)
+                    if theirs is not None and theirs[id_field] == ours[id_field]:
+                        for field in ("last_used", "verified_at"):
+                            ours[field] = max(ours.get(field, 0), theirs.get(field, 0))
+                    entries[key] = ours
+                self._dirty[section].clear()
+                self._removed[section].clear()
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(merged, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self._state = merged
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _set_entry(self, section, key, entry):
+        with self._lock:
+            self._state[section][key] = entry
+            self._dirty[section].add(key)
+            self._removed[section].discard(key)
+
+    def _touch(self, section, key, now, verified=False):
+        with self._lock:
+            entry = self._state[section].get(key)
+            if entry is None:
+                return
+            entry["last_used"] = now
+            if verified:
+                entry["verified_at"] = now
+            self._dirty[section].add(key)
+
+    # ---- remote helpers --------------------------------------------------
+
+    def _dataset_hash(self, csv_path):
+        # Re-hashing a large CSV on every request is wasteful, so the digest is
+        # cached until the file's size or mtime changes.
+        stat = os.stat(csv_path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._hash_cache.get(csv_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        digest = file_sha256(csv_path)
+        self._hash_cache[csv_path] = (signature, digest)
+        return digest
+
+    def _file_exists(self, file_id):
+        try:
+            self.client.files.retrieve(file_id)
+            return True
+        except openai.NotFoundError:
+            return False
+
+    def _assistant_exists(self, assistant_id):
+        try:
+            self.client.beta.assistants.retrieve(assistant_id)
+            return True
+        except openai.NotFoundError:
+            return False
+
+    def _delete_file(self, file_id):
+        try:
+            self.client.files.delete(file_id)
+        except openai.NotFoundError:
+            pass
+
+    def _delete_assistant(self, assistant_id):
+        try:
+            self.client.beta.assistants.delete(assistant_id)
+        except openai.NotFoundError:
+            pass
+
+    def _is_fresh(self, entry, now):
+        return now - entry.get("verified_at", 0) < self.verify_interval
+
+    def _reusable(self, section, key, exists, now):
+        """The id stored under ``key`` if it can still be used, asking the API
+        when it hasn't been verified for a while; None otherwise."""
+        id_field = SECTIONS[section]
+        with self._lock:
+            entry = self._state[section].get(key)
+            if entry is None:
+                # Another process sharing the file may have created it meanwhile
+                self._save()
+                entry = self._state[section].get(key)
+            entry = dict(entry) if entry else None
+        if entry is None:
+            return None
+        fresh = self._is_fresh(entry, now)
+        if not fresh and not exists(entry[id_field]):
+            return None
+        self._touch(section, key, now, verified=not fresh)
+        return entry[id_field]
+
+    # ---- public API ------------------------------------------------------
+
+    def dataset_version(self, csv_path):
+        """Content hash of the dataset, the same one its uploaded file is keyed by."""
+        return self._dataset_hash(csv_path)
+
+    def get_file_id(self, csv_path):
+        now = time.time()
+        file_id = self._get_file_id(csv_path, self._dataset_hash(csv_path), now)
+        with self._lock:
+            self._save()
+        return file_id
+
+    def _get_file_id(self, csv_path, dataset_hash, now):
+        with self._key_lock(f"file:{dataset_hash}"):
+            file_id = self._reusable("files", dataset_hash, self._file_exists, now)
+            if file_id is not None:
+                return file_id
+
+            with open(csv_path, "rb") as f:
+                uploaded = self.client.files.create(file=f, purpose='assistants')
+            self._set_entry("files", dataset_hash, {
+                "file_id": uploaded.id,
+                "source": os.path.abspath(csv_path),
+                "created_at": now,
+                "last_used": now,
+                "verified_at": now,
+            })
+            return uploaded.id
+
+    def get_assistant_id(self, csv_path, instructions, name, model="gpt-4o"):
+        """Return an assistant id for ``csv_path`` and ``instructions``,
+        uploading the dataset and creating the assistant only when needed."""
+        now = time.time()
+        dataset_hash = self._dataset_hash(csv_path)
+        config_hash = _text_sha256(instructions, name, model)
+        key = f"{dataset_hash}:{config_hash}"
+
+        with self._key_lock(key):
+            assistant_id = self._reusable("assistants", key, self._assistant_exists, now)
+            created = assistant_id is None
+            if created:
+                file_id = self._get_file_id(csv_path, dataset_hash, now)
+                assistant = self.client.beta.assistants.create(
+                    instructions=instructions,
+                    name=name,
+                    model=model,
+                    tools=[{"type": "code_interpreter"}],
+                    tool_resources={"code_interpreter": {"file_ids": [file_id]}}
+                )
+                assistant_id = assistant.id
+                self._set_entry("assistants", key, {
+                    "assistant_id": assistant_id,
+                    "file_id": file_id,
+                    "dataset_hash": dataset_hash,
+                    "config_hash": config_hash,
+                    "source": os.path.abspath(csv_path),
+                    "created_at": now,
+                    "last_used": now,
+                    "verified_at": now,
+                })
+            else:
+                self._touch("files", dataset_hash, now)
+
+        with self._lock:
+            self._save()
+            # A new assistant usually supersedes an old one, so collect right away
+            collect = created or now - self._last_collect >= self.collect_interval
+        if collect:
+            self.garbage_collect(current={key})
+        return assistant_id
+
+    def garbage_collect(self, current=()):
+        """Delete superseded and expired assistants and files (except the
+        assistants keyed in ``current``)."""
+        now = time.time()
+        with self._lock:
+            self._last_collect = now
+            self._save()
+            doomed = self._collect(now, current)
+            self._save()
+        # The entries are already gone from the registry; the API calls come after
+        for section, remote_id in doomed:
+            if section == "assistants":
+                self._delete_assistant(remote_id)
+            else:
+                self._delete_file(remote_id)
+
+    def _collect(self, now, current=()):
+        # Called with self._lock held; returns the (section, id) pairs to delete remotely
+        assistants = self._state["assistants"]
+        files = self._state["files"]
+        doomed = []
+
+        # The newest dataset hash per source file; anything older is superseded
+        latest = {}
+        for entry in files.values():
+            source = entry.get("source")
+            if source and entry["created_at"] >= latest.get(source, (0, None))[0]:
+                latest[source] = (entry["created_at"], entry["file_id"])
+        latest_file_ids = {file_id for _, file_id in latest.values()}
+
+        for key, entry in list(assistants.items()):
+            if key in current:
+                continue
+            expired = now - entry.get("last_used", 0) > self.max_age
+            superseded = entry["file_id"] not in latest_file_ids
+            if expired or superseded:
+                doomed.append(("assistants", entry["assistant_id"]))
+                del assistants[key]
+                self._removed["assistants"].add(key)
+
+        in_use = {entry["file_id"] for entry in assistants.values()}
+        for dataset_hash, entry in list(files.items()):
+            if entry["file_id"] in in_use:
+                continue
+            expired = now - entry.get("last_used", 0) > self.max_age
+            if expired or entry["file_id"] not in latest_file_ids:
+                doomed.append(("files", entry["file_id"]))
+                del files[dataset_hash]
+                self._removed["files"].add(dataset_hash)
+        return doomed
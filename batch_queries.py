@@ -0,0 +1,73 @@
+# Batched /usa-health questions.
+#
+#   POST /usa-health/batch  {"queries": ["How many ...?", ...], "limit": 100}
+#
+# A batch is answered in three steps: the questions are translated at once on
+# a bounded pool (identical questions only once), identical SQL is run only
+# once, and every distinct query runs on one pooled connection inside a single
+# read transaction, so the whole batch sees one snapshot of the data.
+# Results come back in the order the questions were sent.
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from request_metrics import metrics, span
+from sql_cache import normalize_question
+
+# Most questions one batch may carry
+MAX_BATCH_QUESTIONS = int(os.getenv('MAX_BATCH_QUESTIONS', '100'))
+
+# Translations running at once, shared by all batches
+TRANSLATE_WORKERS = int(os.getenv('BATCH_TRANSLATE_WORKERS', '8'))
+
+translate_pool = ThreadPoolExecutor(max_workers=TRANSLATE_WORKERS, thread_name_prefix="translate")
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(data, max_questions=MAX_BATCH_QUESTIONS):
+    """The list of questions in a batch request body; raises BatchError when it isn't one."""
+    if not isinstance(data, dict):
+        raise BatchError("The request body must be a JSON object with a 'queries' list")
+    questions = data.get('queries')
+    if not isinstance(questions, list) or not questions:
+        raise BatchError("'queries' must be a non-empty list of questions")
+    if len(questions) > max_questions:
+        raise BatchError(f"A batch may carry at most {max_questions} questions, got {len(questions)}")
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        raise BatchError("Every entry in 'queries' must be a non-empty question")
+    return questions
+
+
+def translate_all(questions, translate, pool=None):
+    """``translate(question)`` for every question, run concurrently on the
+    shared pool; questions that normalize the same are translated once."""
+    pool = pool or translate_pool
+    unique = {}
+    for question in questions:
+        unique.setdefault(normalize_question(question), question)
+    # Each task runs in a copy of the request's context, so its spans join the request trace
+    futures = {key: pool.submit(contextvars.copy_context().run, translate, question)
+               for key, question in unique.items()}
+    with span("batch_translate", questions=len(questions), distinct=len(unique)):
+        translated = {key: future.result() for key, future in futures.items()}
+    metrics.inc("batch_questions_total", len(questions), "Questions received in batches")
+    metrics.inc("batch_translations_saved_total", len(questions) - len(unique),
+                "Batch questions that reused another question's translation")
+    return [translated[normalize_question(question)] for question in questions]
+
+
+def execute_all(queries, execute, db_pool):
+    """``execute(sql)`` once per distinct SQL string (None entries are
+    skipped), all inside one read transaction on this thread's pooled
+    connection. Returns the results in the order of ``queries``."""
+    distinct = list(dict.fromkeys(query for query in queries if query is not None))
+    with span("batch_execute", queries=len(distinct)):
+        with db_pool.snapshot():
+            results = {query: execute(query) for query in distinct}
+    metrics.inc("batch_executions_saved_total", sum(query is not None for query in queries) - len(distinct),
+                "Batch queries answered by running identical SQL once")
+    return [results.get(query) for query in queries]
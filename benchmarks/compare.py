@@ -0,0 +1,70 @@
+# Compare two benchmark result files from benchmarks/run.py.
+#
+#   python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json [--threshold 10]
+#
+# Prints p50/p95/p99 latency and throughput side by side for every dataset
+# size, concurrency level and path present in both files, and exits with
+# status 1 when p95 latency or throughput got worse by more than the threshold.
+
+import argparse
+import json
+import sys
+
+
+def _levels(report):
+    levels = {}
+    for dataset in report["datasets"]:
+        for level in dataset["serve"]["levels"]:
+            for path, stats in level["paths"].items():
+                levels[(dataset["rows"], level["concurrency"], path)] = dict(stats, throughput=level["throughput_rps"])
+    return levels
+
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(old_report, new_report, threshold):
+    old_levels, new_levels = _levels(old_report), _levels(new_report)
+    print(f"old: {old_report['meta']['commit']} ({old_report['meta']['created_at']})")
+    print(f"new: {new_report['meta']['commit']} ({new_report['meta']['created_at']})")
+    print(f"{'rows':>8} {'conc':>5} {'path':<6} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'req/s':>15}")
+
+    regressions = []
+    for key in sorted(set(old_levels) & set(new_levels)):
+        old, new = old_levels[key], new_levels[key]
+        cells = []
+        for field in ("p50_ms", "p95_ms", "p99_ms", "throughput"):
+            change = _change(old.get(field), new.get(field))
+            cells.append(f"{old.get(field)}->{new.get(field)}" + (f" {change:+.0f}%" if change is not None else ""))
+        print(f"{key[0]:>8} {key[1]:>5} {key[2]:<6} " + " ".join(f"{cell:>17}" for cell in cells))
+
+        p95_change = _change(old.get("p95_ms"), new.get("p95_ms"))
+        throughput_change = _change(old.get("throughput"), new.get("throughput"))
+        if p95_change is not None and p95_change > threshold:
+            regressions.append(f"{key}: p95 {p95_change:+.0f}%")
+        if throughput_change is not None and throughput_change < -threshold:
+            regressions.append(f"{key}: throughput {throughput_change:+.0f}%")
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed slowdown, percent")
+    args = parser.parse_args(argv)
+    with open(args.old, encoding="utf-8") as f:
+        old_report = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new_report = json.load(f)
+    return 1 if compare(old_report, new_report, args.threshold) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
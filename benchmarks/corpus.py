@@ -0,0 +1,71 @@
+# Fixed question corpus for the benchmarks, with the SQL and chart specs the
+# stub replays in place of the model. Values are written the way ingest_csv.py
+# stores them (C_/BARRIER_/LIS_ answers lowercased, other columns as given).
+
+TEXT_QUESTIONS = [
+    ("How many patients have diabetes?",
+     "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'yes'"),
+    ("How many patients are there in each region?",
+     "SELECT AHRI_REGION, COUNT(*) FROM medical_info GROUP BY AHRI_REGION"),
+    ("How many patients with hypertension live in the South?",
+     "SELECT COUNT(*) FROM medical_info WHERE C_HYPERTEN = 'yes' AND AHRI_REGION = 'South'"),
+    ("Break down fear of mammogram results by race category",
+     "SELECT AHRI_RACE_CAT, BARRIER_FEARRESULTS, COUNT(*) FROM medical_info "
+     "GROUP BY AHRI_RACE_CAT, BARRIER_FEARRESULTS"),
+    ("What is the average age of patients who received SSI?",
+     "SELECT AVG(AGE) FROM medical_info WHERE LIS_SSI = 'yes'"),
+    ("What is the average comorbidity score per income bracket?",
+     "SELECT INCOME, AVG(AHRI_CCI_SCORE) FROM medical_info GROUP BY INCOME ORDER BY 2 DESC"),
+    ("List the case ids of patients older than 85 with kidney disease",
+     "SELECT CASE_ID, AGE FROM medical_info WHERE AGE > 85 AND C_CKD = 'yes' ORDER BY AGE DESC"),
+    ("How many uninsured patients postponed care due to cost?",
+     "SELECT COUNT(*) FROM medical_info WHERE INS_YN = 'No' AND CARECOST_POSTPONE = 'Yes'"),
+    ("How often did cost keep patients from a mammogram, by age group?",
+     "SELECT AHRI_AGE_CAT, BARRIER_NOAFFORD, COUNT(*) FROM medical_info "
+     "GROUP BY AHRI_AGE_CAT, BARRIER_NOAFFORD ORDER BY AHRI_AGE_CAT"),
+    ("What share of patients in each community type had a mammogram in the past 12 months?",
+     "SELECT COMMUNITY_TYPE, ROUND(100.0 * SUM(MMG_STATUS = 'I have had a mammogram in the past 12 months') "
+     "/ COUNT(*), 1) AS pct FROM medical_info GROUP BY COMMUNITY_TYPE"),
+    ("Show every patient record from the Northeast",
+     "SELECT * FROM medical_info WHERE AHRI_REGION = 'Northeast'"),
+    ("How likely are patients to get a mammogram in the next 6 months on average, by education?",
+     "SELECT EDUCATION, AVG(MMG_FREQ_6MO) FROM medical_info WHERE MMG_FREQ_6MO IS NOT NULL GROUP BY EDUCATION"),
+]
+
+# Chart questions; a None spec means the stub reports the chart as
+# unsupported, so the request goes to the Code Interpreter job path
+CHART_QUESTIONS = [
+    ("Plot the number of patients per region",
+     {"supported": True, "sql": "SELECT AHRI_REGION, COUNT(*) AS n FROM medical_info GROUP BY AHRI_REGION",
+      "chart_type": "bar", "x": "AHRI_REGION", "y": "n", "title": "Patients per region"}),
+    ("Draw a pie chart of income brackets",
+     {"supported": True, "sql": "SELECT INCOME, COUNT(*) AS n FROM medical_info GROUP BY INCOME",
+      "chart_type": "pie", "x": "INCOME", "y": "n", "title": "Income"}),
+    ("Chart pain concerns by race category as stacked bars",
+     {"supported": True, "sql": "SELECT AHRI_RACE_CAT, BARRIER_PAIN, COUNT(*) AS n FROM medical_info "
+                                "GROUP BY AHRI_RACE_CAT, BARRIER_PAIN",
+      "chart_type": "stacked_bar", "x": "AHRI_RACE_CAT", "y": "n", "group": "BARRIER_PAIN",
+      "title": "Pain concerns by race"}),
+    ("Plot a histogram of patient ages",
+     {"supported": True, "sql": "SELECT AGE FROM medical_info", "chart_type": "histogram", "x": "AGE",
+      "title": "Age distribution"}),
+    ("Visualize the correlation between comorbidities and barriers as a heatmap with annotations", None),
+]
+
+
+# Replies for openai_stub.StubState.chat_replies: matched against the prompt,
+# which contains the question verbatim
+def stub_replies():
+    replies = {question: sql for question, sql in TEXT_QUESTIONS}
+    replies.update({question: spec or {"supported": False} for question, spec in CHART_QUESTIONS})
+    return replies
+
+
+# The questions in request order: every text question, then every chart one
+def questions(paths=("text", "graph")):
+    corpus = []
+    if "text" in paths:
+        corpus += [("text", question) for question, _ in TEXT_QUESTIONS]
+    if "graph" in paths:
+        corpus += [("graph", question) for question, _ in CHART_QUESTIONS]
+    return corpus
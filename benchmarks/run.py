@@ -0,0 +1,326 @@
+# End-to-end benchmark of /usa-health on synthetic data, fully offline.
+#
+#   python -m benchmarks.run                                         # 5k rows, concurrency 1, 4, 16
+#   python -m benchmarks.run --rows 5000,100000,1000000 --server asgi
+#   python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json
+#
+# For each dataset size the data is generated and ingested in one subprocess
+# and served in another, so peak RSS is reported per stage. The app talks to
+# openai_stub.py, which replays the SQL and chart specs in benchmarks/corpus.py
+# after a configurable delay; the corpus is then sent to /usa-health at each
+# concurrency level. Results go to benchmarks/results/<time>-<commit>.json.
+
+import argparse
+import csv
+import json
+import logging
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = os.path.join(REPO_ROOT, "benchmarks", "work")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# Where the assistant path looks for the dataset it uploads (see text_n_graph1.py)
+ASSISTANT_DATASET = os.path.join("data", "BrCA Dataset_N5030_lab.csv")
+ASSISTANT_DATASET_ROWS = 5030
+
+# A job still running after this long counts as failed
+JOB_TIMEOUT_SECONDS = 120
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def percentiles(seconds):
+    if not seconds:
+        return {"count": 0}
+    ordered = sorted(seconds)
+
+    def at(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2), "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+# ---- stage: prepare ---------------------------------------------------------
+
+def prepare(args):
+    from benchmarks.synthetic_data import generate_csv
+    from ingest_csv import ingest
+
+    csv_path = f"synthetic_{args.rows}.csv"
+    result = {"rows": args.rows}
+    if args.regenerate or not os.path.exists(csv_path):
+        result["generate_seconds"] = round(generate_csv(csv_path, args.rows, seed=args.seed), 3)
+    if args.regenerate and os.path.exists("medical.db"):
+        os.remove("medical.db")
+
+    existing = 0
+    if os.path.exists("medical.db"):
+        conn = sqlite3.connect("medical.db")
+        try:
+            existing = conn.execute("SELECT COUNT(*) FROM medical_info").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        finally:
+            conn.close()
+    if existing != args.rows:
+        result["ingest"] = ingest(csv_path, "medical.db", rebuild=True)
+    else:
+        result["ingest"] = "reused"
+
+    # A small copy of the data for the assistant path to upload
+    os.makedirs(os.path.dirname(ASSISTANT_DATASET), exist_ok=True)
+    with open(csv_path, newline="", encoding="utf-8") as source, \
+            open(ASSISTANT_DATASET, "w", newline="", encoding="utf-8") as target:
+        csv.writer(target).writerows(islice(csv.reader(source), ASSISTANT_DATASET_ROWS + 1))
+
+    result["db_bytes"] = os.path.getsize("medical.db")
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+# ---- stage: serve -----------------------------------------------------------
+
+def _start_server(app_kind):
+    if app_kind == "asgi":
+        import uvicorn
+        import asgi_app
+
+        server = uvicorn.Server(uvicorn.Config(asgi_app.app, host="127.0.0.1", port=0, log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            time.sleep(0.05)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}", lambda: setattr(server, "should_exit", True)
+
+    from werkzeug.serving import make_server
+    import text_n_graph1
+
+    server = make_server("127.0.0.1", 0, text_n_graph1.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def _send(client, path, question):
+    """POST one question; chart jobs are followed until they finish."""
+    started = time.perf_counter()
+    response = client.post("/usa-health", json={"query": question})
+    status, outcome = response.status_code, None
+    if status == 200:
+        is_json = response.headers.get("content-type", "").startswith("application/json")
+        outcome = response.json().get("cache") if is_json else f"{response.headers.get('X-Chart-Source')}_chart"
+    elif status == 202:
+        status_url = response.json()["status_url"]
+        deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            job = client.get(status_url).json()
+            if job["status"] in ("completed", "failed"):
+                break
+        status = 200 if job["status"] == "completed" else 500
+        outcome = "assistant"
+    return path, status, time.perf_counter() - started, outcome
+
+
+def drive(base_url, corpus, concurrency, total):
+    import httpx
+
+    items = [corpus[i % len(corpus)] for i in range(total)]
+    client = httpx.Client(base_url=base_url, timeout=JOB_TIMEOUT_SECONDS,
+                          limits=httpx.Limits(max_connections=concurrency * 2))
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda item: _send(client, *item), items))
+    finally:
+        client.close()
+    wall = time.perf_counter() - started
+
+    by_path = defaultdict(lambda: {"latencies": [], "errors": 0, "rejected": 0, "outcomes": defaultdict(int)})
+    for path, status, seconds, outcome in results:
+        entry = by_path[path]
+        if status in (429, 503):
+            entry["rejected"] += 1
+        elif status >= 400:
+            entry["errors"] += 1
+        else:
+            entry["latencies"].append(seconds)
+            entry["outcomes"][outcome] += 1
+    completed = sum(len(entry["latencies"]) for entry in by_path.values())
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(completed / wall, 2) if wall else None,
+        "paths": {path: dict(percentiles(entry["latencies"]), errors=entry["errors"], rejected=entry["rejected"],
+                             outcomes=dict(entry["outcomes"]))
+                  for path, entry in by_path.items()},
+    }
+
+
+def serve(args):
+    from openai_stub import start_stub_server
+    from benchmarks.corpus import questions, stub_replies
+
+    stub, state, stub_url = start_stub_server()
+    state.chat_seconds = args.chat_latency
+    state.run_seconds = args.assistant_seconds
+    state.chat_replies = stub_replies()
+
+    # The app reads these at import time
+    most = max(args.concurrency)
+    os.environ.update({
+        "OPENAI_BASE_URL": stub_url,
+        "OPENAI_API_KEY": "benchmark",
+        "MAX_CONCURRENT_REQUESTS": str(most * 2),
+        "MAX_REQUESTS_PER_CLIENT": str(most * 2),
+        "MAX_QUEUED_JOBS": str(most * 2),
+    })
+    import text_n_graph1 as text_app
+    from request_metrics import metrics
+    from sql_cache import SQLCache
+
+    base_url, stop = _start_server(args.server)
+    corpus = questions(args.paths)
+    levels = []
+    try:
+        for concurrency in args.concurrency:
+            if not args.warm or not levels:
+                # Cold caches: every level pays for translation and rendering again
+                cache_path = f"sql_cache_bench_{concurrency}.db"
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(cache_path + suffix):
+                        os.remove(cache_path + suffix)
+                text_app.catalog.default.sql_cache = SQLCache(cache_path)
+                text_app.chart_store.clear()
+            metrics.reset()
+            text_app.openai_api.stats.reset()
+            text_app.router.reset()
+
+            level = drive(base_url, corpus, concurrency, max(args.requests, len(corpus)))
+            # Estimated from the app's stage histograms (see request_metrics.py)
+            level["stages"] = metrics.histogram_summary("stage_seconds", "stage")
+            level["openai"] = text_app.openai_api.summary()
+            level["sql_cache"] = text_app.catalog.default.sql_cache.summary()
+            level["router"] = text_app.router.summary()
+            level["peak_rss_mb"] = peak_rss_mb()
+            levels.append(level)
+            print(f"  rows={args.rows} concurrency={concurrency}: {level['throughput_rps']} req/s, "
+                  + ", ".join(f"{path} p95={stats.get('p95_ms')}ms" for path, stats in level["paths"].items()),
+                  file=sys.stderr)
+    finally:
+        stop()
+        stub.shutdown()
+    return {"rows": args.rows, "server": args.server, "levels": levels}
+
+
+# ---- driver -----------------------------------------------------------------
+
+def _csv_ints(value):
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def _run_stage(stage, args, rows):
+    result_file = os.path.join(WORK_DIR, f"result_{stage}_{rows}.json")
+    command = [sys.executable, "-m", "benchmarks.run", "--stage", stage, "--rows", str(rows),
+               "--concurrency", ",".join(str(c) for c in args.concurrency), "--requests", str(args.requests),
+               "--paths", ",".join(args.paths), "--server", args.server, "--chat-latency", str(args.chat_latency),
+               "--assistant-seconds", str(args.assistant_seconds), "--seed", str(args.seed),
+               "--result-file", result_file]
+    command += ["--regenerate"] if args.regenerate else []
+    command += ["--warm"] if args.warm else []
+    subprocess.run(command, cwd=REPO_ROOT, check=True)
+    with open(result_file, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"server": args.server, "concurrency": args.concurrency, "requests": args.requests,
+                     "paths": args.paths, "chat_latency": args.chat_latency,
+                     "assistant_seconds": args.assistant_seconds, "warm": args.warm, "seed": args.seed},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark /usa-health against synthetic data and the OpenAI stub")
+    parser.add_argument("--rows", default="5000", help="comma-separated dataset sizes, e.g. 5000,100000,1000000")
+    parser.add_argument("--concurrency", type=_csv_ints, default=[1, 4, 16], help="comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=60, help="requests per concurrency level")
+    parser.add_argument("--paths", type=lambda v: v.split(","), default=["text", "graph"])
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="stub chat completion delay, seconds")
+    parser.add_argument("--assistant-seconds", type=float, default=1.0, help="stub Code Interpreter run time")
+    parser.add_argument("--warm", action="store_true", help="keep SQL and chart caches between levels")
+    parser.add_argument("--regenerate", action="store_true", help="rebuild the synthetic data even if present")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="result file (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--stage", choices=("prepare", "serve"), help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.stage:
+        args.rows = int(args.rows)
+        logging.basicConfig(level=logging.WARNING)
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        work_dir = os.path.join(WORK_DIR, str(args.rows))
+        os.makedirs(work_dir, exist_ok=True)
+        os.chdir(work_dir)
+        result = prepare(args) if args.stage == "prepare" else serve(args)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    os.makedirs(WORK_DIR, exist_ok=True)
+    report = {"meta": _metadata(args), "datasets": []}
+    for rows in _csv_ints(args.rows):
+        print(f"Preparing {rows} rows...", file=sys.stderr)
+        dataset = {"rows": rows, "prepare": _run_stage("prepare", args, rows)}
+        print(f"Serving {rows} rows with {args.server}...", file=sys.stderr)
+        dataset["serve"] = _run_stage("serve", args, rows)
+        report["datasets"].append(dataset)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{report['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# Synthetic survey data with the medical_info schema, for benchmarking at
+# sizes the real 5030-row CSV can't reach.
+#
+#   python -m benchmarks.synthetic_data --rows 100000 --out benchmarks/work/synthetic_100000.csv
+#
+# Every column in medical_schema.COLUMN_DESCRIPTIONS is generated: yes/no
+# answers with per-column prevalence, Likert barriers skewed towards "Never",
+# demographic categories with census-like weights, and the AHRI_* columns
+# derived from the answers they summarize. Output is deterministic per seed.
+
+import argparse
+import csv
+import sys
+import time
+
+import numpy as np
+
+from medical_schema import COLUMN_DESCRIPTIONS
+
+CHUNK_ROWS = 50000
+
+YES_NO = ("Yes", "No")
+
+LIKERT = ("Never", "Rarely", "Sometimes", "Often", "Always")
+LIKERT_WEIGHTS = (0.55, 0.2, 0.14, 0.07, 0.04)
+
+# Columns with a fixed set of answers: (values, weights)
+CATEGORICAL = {
+    "SEX": (("Female", "Male"), (0.97, 0.03)),
+    "AHRI_REGION": (("South", "Midwest", "West", "Northeast"), (0.38, 0.21, 0.24, 0.17)),
+    "INCOME": (("Less than $25,000", "$25,000 - $49,999", "$50,000 - $74,999", "$75,000 - $99,999",
+                "$100,000 - $149,999", "$150,000 or more", "Prefer not to answer"),
+               (0.16, 0.19, 0.17, 0.13, 0.15, 0.12, 0.08)),
+    "EDUCATION": (("Less than high school", "High school graduate or GED", "Some college",
+                   "Associate degree", "Bachelor's degree", "Graduate degree"),
+                  (0.05, 0.2, 0.21, 0.11, 0.25, 0.18)),
+    "COMMUNITY_TYPE": (("Rural (country)", "Suburban (suburbs)", "Urban (city)"), (0.2, 0.48, 0.32)),
+    "MARITAL_STATUS": (("Married", "Living with partner", "Single, never married", "Divorced", "Widowed",
+                        "Separated"), (0.5, 0.07, 0.15, 0.15, 0.1, 0.03)),
+    "EMPLOYMENT": (("Employed full time", "Employed part time", "Unemployed", "Retired", "Homemaker",
+                    "Unable to work", "Other (please specify)"), (0.4, 0.12, 0.06, 0.28, 0.06, 0.06, 0.02)),
+    "PCP_TYPE": (("Physician (MD/DO)", "Nurse practitioner", "Physician assistant", "Other"),
+                 (0.78, 0.14, 0.06, 0.02)),
+    "PCP_GENDER": (("Female", "Male", "Not sure"), (0.55, 0.42, 0.03)),
+    "MENO_STATUS": (("Pre-menopause", "Peri-menopause / menopause transition", "Post-menopause", "Not sure"),
+                    (0.25, 0.15, 0.55, 0.05)),
+    "MENO_FOLLOWON": (("Spontaneous (\"natural\")", "Surgery", "Chemotherapy or radiation therapy", "Other"),
+                      (0.7, 0.2, 0.07, 0.03)),
+    "HRT": (("Yes, I am currently on HRT", "Yes, I have been on HRT but am not currently", "No, never",
+             "Not sure"), (0.1, 0.2, 0.65, 0.05)),
+    "MMG_STATUS": (("I have had a mammogram in the past 12 months", "I have had a mammogram, but not in the past 12 months",
+                    "I have never had a mammogram"), (0.62, 0.3, 0.08)),
+    "MMG_IMPORTANCE": (tuple(str(n) for n in range(1, 10)), (0.01, 0.01, 0.02, 0.03, 0.05, 0.08, 0.15, 0.2, 0.45)),
+    "MMG_RESULTS": (("Normal", "Abnormal", "Do not remember", "Do not know"), (0.82, 0.1, 0.05, 0.03)),
+    "MMG_TYPE": (("Digital mammography in 2D", "Digital mammography in 3D (tomosynthesis)", "Not sure"),
+                 (0.35, 0.4, 0.25)),
+    "MMG_FREQ": (("Likely in next 3 months", "Likely in next 6 months", "Likely in next 9 months",
+                  "Likely in next 12 months", "Likely in next 24 months", "Not in the next 24 months"),
+                 (0.2, 0.2, 0.15, 0.3, 0.1, 0.05)),
+    "MMG_TRANSPORT_TYPE": (("Drove myself", "Someone drove me", "Public transportation", "Walked",
+                            "Ride share or taxi", "Other (please specify)"), (0.78, 0.1, 0.05, 0.02, 0.03, 0.02)),
+    "MMG_TRANSPORT_TIME": (("Less than 15 minutes", "15-30 minutes", "31-60 minutes", "More than 1 hour"),
+                           (0.35, 0.42, 0.17, 0.06)),
+    "MMG_TIMEOFF_WK_PAID": (("Paid time off", "Not paid time off", "Not sure"), (0.55, 0.35, 0.1)),
+    "INS_RX_COST": (("Yes", "No", "Other"), (0.18, 0.8, 0.02)),
+    "C_CKD_FOLLOWON": (("Mild", "Moderate", "Severe (on dialysis, status post kidney transplant, uremia)"),
+                       (0.6, 0.3, 0.1)),
+    "C_DB_FOLLOWON": (("Diet controlled", "Uncomplicated", "End-organ damage"), (0.2, 0.65, 0.15)),
+    "C_LD_FOLLOWON": (("Mild", "Moderate to severe"), (0.75, 0.25)),
+}
+
+# Yes-rate for yes/no columns whose prevalence is well known; others get a
+# seeded rate between 2% and 30%
+PREVALENCE = {
+    "RACE1_WH": 0.62, "RACE1_BL": 0.28, "RACE1_AS": 0.05, "HLS_YN": 0.12,
+    "C_HYPERTEN": 0.45, "C_HYPERLIPID": 0.37, "C_DB": 0.18, "C_AR": 0.3, "C_CN": 0.2, "C_NONE": 0.28,
+    "C_CN_FOLLOWON1": 0.8,
+    "INS_YN": 0.93, "INS_TYPE_EMP": 0.45, "INS_TYPE_MEDICARE": 0.3, "INS_TYPE_MEDICAID": 0.12,
+    "PCP_YN": 0.86, "PCP_RACE_WH": 0.6, "CARECOST_NONE": 0.7, "LIS_NONE": 0.7, "MMG_TIMEOFF_WK_YN": 0.35,
+}
+
+# Answers that only exist when the parent answer is "Yes"
+FOLLOW_ON_PARENT = {
+    "C_CN_FOLLOWON1": "C_CN", "C_CN_FOLLOWON2": "C_CN", "C_CN_FOLLOWON3": "C_CN",
+    "C_CKD_FOLLOWON": "C_CKD", "C_DB_FOLLOWON": "C_DB", "C_LD_FOLLOWON": "C_LD",
+    "HLS_LA": "HLS_YN", "HLS_ME": "HLS_YN", "HLS_PR": "HLS_YN", "HLS_OT": "HLS_YN",
+}
+
+FREE_TEXT = ("MMG_ADVICE", "MMG_EASIER", "MMG_ANYTHINGELSE", "PCP_TYPE_OT")
+FREE_TEXT_ANSWERS = ("none", "no", "make it cheaper", "evening appointments", "closer clinic",
+                     "less pain", "reminders from my doctor", "n/a")
+
+# 1-100 likelihood scales, 0-7 hours and 0-2400 minutes
+NUMERIC_RANGES = {"MMG_TIMEOFF_NEEDED": (0, 8), "MMG_REASONABLE_TIME": (0, 2401)}
+
+
+def _column_kind(column):
+    if column in CATEGORICAL:
+        return "categorical"
+    if column in ("CASE_ID", "AGE") or column.startswith("AHRI_"):
+        return "derived"
+    if column.endswith("_TXT") or column in FREE_TEXT:
+        return "text"
+    if column.startswith("BARRIER_") and column != "BARRIER_OT":
+        return "likert"
+    if column.startswith("MMG_FREQ_") or column in NUMERIC_RANGES:
+        return "number"
+    return "yes_no"
+
+
+def _yes_no(rng, rate, n):
+    return np.where(rng.random(n) < rate, YES_NO[0], YES_NO[1]).astype(object)
+
+
+def _age_category(ages):
+    bins = [(18, 39, "18-39"), (40, 49, "40-49"), (50, 64, "50-64"), (65, 74, "65-74"), (75, 200, "75+")]
+    categories = np.empty(len(ages), dtype=object)
+    for low, high, label in bins:
+        categories[(ages >= low) & (ages <= high)] = label
+    return categories
+
+
+def generate_chunk(rng, start_id, n, rates):
+    """Return ``{column: array}`` for ``n`` rows starting at CASE_ID ``start_id``."""
+    data = {}
+    for column in COLUMN_DESCRIPTIONS:
+        kind = _column_kind(column)
+        if kind == "categorical":
+            values, weights = CATEGORICAL[column]
+            data[column] = rng.choice(np.array(values, dtype=object), size=n, p=np.array(weights) / sum(weights))
+        elif kind == "likert":
+            data[column] = rng.choice(np.array(LIKERT, dtype=object), size=n, p=LIKERT_WEIGHTS)
+        elif kind == "text":
+            answered = rng.random(n) < 0.05
+            data[column] = np.where(answered, rng.choice(np.array(FREE_TEXT_ANSWERS, dtype=object), size=n), "")
+        elif kind == "number":
+            low, high = NUMERIC_RANGES.get(column, (1, 101))
+            values = rng.integers(low, high, size=n).astype(object)
+            values[rng.random(n) < 0.1] = ""
+            data[column] = values
+        elif kind == "yes_no":
+            data[column] = _yes_no(rng, rates[column], n)
+
+    for column, parent in FOLLOW_ON_PARENT.items():
+        data[column] = np.where(data[parent] == "Yes", data[column], "").astype(object)
+
+    ages = np.clip(rng.normal(56, 11, size=n).round(), 25, 90).astype(int)
+    data["CASE_ID"] = np.arange(start_id, start_id + n).astype(object)
+    data["AGE"] = ages.astype(object)
+    data["AHRI_AGE_CAT"] = _age_category(ages)
+    data["AHRI_RACE_CAT"] = np.where(
+        (data["RACE1_BL"] == "Yes") & (data["RACE1_WH"] == "No"), "Black alone",
+        np.where((data["RACE1_WH"] == "Yes") & (data["RACE1_BL"] == "No"), "White alone", "Other")
+    ).astype(object)
+    comorbidities = [column for column in COLUMN_DESCRIPTIONS
+                     if column.startswith("C_") and "FOLLOWON" not in column and column != "C_NONE"]
+    score = sum((data[column] == "Yes").astype(int) for column in comorbidities)
+    data["AHRI_CCI_SCORE"] = np.minimum(score, 10).astype(object)
+    data["AHRI_ED_HS"] = np.where(np.isin(data["EDUCATION"], ["Less than high school",
+                                                             "High school graduate or GED"]),
+                                  "HS or less", "More than HS").astype(object)
+    return data
+
+
+def generate_csv(path, rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """Write ``rows`` synthetic rows to ``path`` and return the seconds taken."""
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    header = list(COLUMN_DESCRIPTIONS)
+    rates = {column: PREVALENCE.get(column, float(rng.uniform(0.02, 0.3))) for column in header}
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for start in range(0, rows, chunk_rows):
+            n = min(chunk_rows, rows - start)
+            data = generate_chunk(rng, start + 1, n, rates)
+            writer.writerows(zip(*(data[column] for column in header)))
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic medical_info survey data")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--out", required=True, help="CSV file to write")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    seconds = generate_csv(args.out, args.rows, seed=args.seed)
+    print(f"rows={args.rows}, seconds={seconds:.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
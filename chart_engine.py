@@ -0,0 +1,225 @@
+import hashlib
+import io
+import json
+import os
+import threading
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+
+from request_metrics import span  # noqa: E402
+from sql_guard import QueryGuardError, guarded_query  # noqa: E402
+
+CHART_TYPES = ("bar", "stacked_bar", "line", "pie", "histogram", "scatter")
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Beyond this many rows a chart is unreadable and the spec is probably wrong
+MAX_ROWS = int(os.getenv('CHART_MAX_ROWS', '20000'))
+
+# Largest number of slices/bars drawn before the rest are folded into "other"
+MAX_CATEGORIES = 30
+
+# Prompt describing the spec; the model answers {"supported": false} when it can't
+CHART_SPEC_INSTRUCTIONS = (
+    "You turn chart requests into a JSON chart spec over an SQLite table. Reply with JSON only: "
+    '{"supported": true, "sql": "<one SELECT statement>", "chart_type": "bar|stacked_bar|line|pie|histogram|scatter", '
+    '"x": "<result column>", "y": "<numeric result column or null for histogram>", '
+    '"group": "<result column or null>", "title": "<short title>", "x_label": "...", "y_label": "..."}. '
+    "Aggregate in SQL (COUNT, AVG, GROUP BY) so the result is small. Values in the table are lowercase. "
+    'If the request needs anything other than one query and one of these chart types, reply {"supported": false}.'
+)
+
+_render_lock = threading.Lock()
+
+
+class ChartSpecError(ValueError):
+    pass
+
+
+def validate_spec(spec):
+    """Check a model-produced spec and return a normalized copy."""
+    if not isinstance(spec, dict) or not spec.get("supported", True):
+        raise ChartSpecError("Request can't be expressed as a chart spec")
+    sql = (spec.get("sql") or "").strip().rstrip(";")
+    if not sql.lower().startswith(("select", "with")) or ";" in sql:
+        raise ChartSpecError("Chart spec needs a single SELECT statement")
+    chart_type = (spec.get("chart_type") or "").lower()
+    if chart_type not in CHART_TYPES:
+        raise ChartSpecError(f"Unsupported chart type '{chart_type}'")
+    if not spec.get("x"):
+        raise ChartSpecError("Chart spec has no x field")
+    if chart_type not in ("histogram",) and not spec.get("y"):
+        raise ChartSpecError(f"A {chart_type} chart needs a y field")
+    if chart_type == "stacked_bar" and not spec.get("group"):
+        raise ChartSpecError("A stacked_bar chart needs a group field")
+    return {
+        "sql": sql,
+        "chart_type": chart_type,
+        "x": spec["x"],
+        "y": spec.get("y") or None,
+        "group": spec.get("group") or None,
+        "title": spec.get("title") or "",
+        "x_label": spec.get("x_label") or spec["x"],
+        "y_label": spec.get("y_label") or (spec.get("y") or "count"),
+    }
+
+
+def spec_key(spec, fmt, data_version):
+    payload = json.dumps({"spec": spec, "format": fmt, "data": str(data_version)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _column_index(names, field):
+    lowered = [name.lower() for name in names]
+    try:
+        return lowered.index(field.lower())
+    except ValueError:
+        raise ChartSpecError(f"Query result has no column '{field}' (columns: {', '.join(names)})")
+
+
+def _label(value):
+    return "(blank)" if value is None else str(value)
+
+
+def _numeric(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fold_categories(labels, values):
+    if len(labels) <= MAX_CATEGORIES:
+        return labels, values
+    ranked = sorted(zip(labels, values), key=lambda item: item[1] or 0, reverse=True)
+    kept = ranked[:MAX_CATEGORIES - 1]
+    other = sum(v or 0 for _, v in ranked[MAX_CATEGORIES - 1:])
+    return [l for l, _ in kept] + ["other"], [v for _, v in kept] + [other]
+
+
+def _draw(ax, spec, names, rows):
+    chart_type = spec["chart_type"]
+    x_index = _column_index(names, spec["x"])
+
+    if chart_type == "histogram":
+        # Rows arrive pre-counted as (value, count); see render_chart
+        points = [(_numeric(row[0]), row[1]) for row in rows]
+        points = [(v, n) for v, n in points if v is not None]
+        if not points:
+            raise ChartSpecError("Histogram column has no numeric values")
+        ax.hist([v for v, _ in points], weights=[n for _, n in points],
+                bins=min(30, max(5, len(points))), color="#4c72b0", edgecolor="white")
+        return
+
+    y_index = _column_index(names, spec["y"])
+    if chart_type in ("stacked_bar",) or (chart_type in ("bar", "line") and spec["group"]):
+        group_index = _column_index(names, spec["group"])
+        x_labels = list(dict.fromkeys(_label(row[x_index]) for row in rows))
+        groups = list(dict.fromkeys(_label(row[group_index]) for row in rows))
+        if len(x_labels) > MAX_CATEGORIES or len(groups) > MAX_CATEGORIES:
+            raise ChartSpecError("Too many categories for a grouped chart")
+        table = {(_label(row[x_index]), _label(row[group_index])): _numeric(row[y_index]) or 0 for row in rows}
+        positions = range(len(x_labels))
+        bottom = [0.0] * len(x_labels)
+        width = 0.8 / len(groups)
+        for n, group in enumerate(groups):
+            heights = [table.get((x, group), 0) for x in x_labels]
+            if chart_type == "stacked_bar":
+                ax.bar(positions, heights, bottom=bottom, label=group)
+                bottom = [b + h for b, h in zip(bottom, heights)]
+            elif chart_type == "bar":
+                ax.bar([p + n * width - 0.4 + width / 2 for p in positions], heights, width=width, label=group)
+            else:
+                ax.plot(list(positions), heights, marker="o", label=group)
+        ax.set_xticks(list(positions))
+        ax.set_xticklabels(x_labels, rotation=45, ha="right")
+        ax.legend(title=spec["group"], fontsize="small")
+        return
+
+    if chart_type == "scatter":
+        points = [(_numeric(row[x_index]), _numeric(row[y_index])) for row in rows]
+        points = [(x, y) for x, y in points if x is not None and y is not None]
+        ax.scatter([x for x, _ in points], [y for _, y in points], s=8, alpha=0.6)
+        return
+
+    labels = [_label(row[x_index]) for row in rows]
+    values = [_numeric(row[y_index]) for row in rows]
+    if chart_type == "pie":
+        labels, values = _fold_categories(labels, values)
+        ax.pie([v or 0 for v in values], labels=labels, autopct="%1.1f%%", startangle=90)
+        ax.axis("equal")
+    elif chart_type == "bar":
+        labels, values = _fold_categories(labels, values)
+        ax.bar(labels, [v or 0 for v in values], color="#4c72b0")
+        ax.tick_params(axis="x", labelrotation=45)
+    else:
+        ax.plot(labels, values, marker="o")
+        ax.tick_params(axis="x", labelrotation=45)
+
+
+def render_chart(spec, db_pool, store, fmt="png", rewriter=None, column_store=None):
+    """Run the spec's query and render it, returning ``(artifact, cached)``.
+
+    Rendered images are kept in ``store`` (chart_store.ChartStore) keyed by
+    the spec, format, database files and data version, so a repeated chart is served
+    without touching SQLite. ``column_store`` (column_store.ColumnStore) or
+    ``rewriter`` (aggregate_cube.AggregateRewriter) may answer count queries
+    from memory or the precomputed tables instead."""
+    if fmt not in FORMATS:
+        raise ChartSpecError(f"Unsupported image format '{fmt}'")
+    key = spec_key(spec, fmt, (db_pool.database_paths(), db_pool.data_version()))
+    artifact = store.get(key)
+    if artifact is not None:
+        return artifact, True
+
+    sql = spec["sql"]
+    # Histograms count the query's rows, which the column store doesn't hand back
+    answered = None
+    if column_store is not None and spec["chart_type"] != "histogram":
+        answered = column_store.execute(sql)
+    if answered is not None:
+        names, rows = answered[0], answered[1][:MAX_ROWS + 1]
+    else:
+        rewrite = rewriter.rewrite(sql) if rewriter is not None else None
+        if rewrite:
+            sql = rewrite[0]
+        try:
+            with db_pool.cursor() as cursor:
+                if spec["chart_type"] == "histogram":
+                    # Count distinct values in SQLite so raw rows never reach Python
+                    probe = f"SELECT * FROM ({sql}) LIMIT 0"
+                    with guarded_query(cursor, probe):
+                        cursor.execute(probe)
+                        names = [column[0] for column in cursor.description]
+                    x_column = names[_column_index(names, spec["x"])].replace('"', '""')
+                    sql = f'SELECT "{x_column}", COUNT(*) FROM ({sql}) GROUP BY 1'
+                with guarded_query(cursor, sql):
+                    with span("sql_execute"):
+                        cursor.execute(sql)
+                        names = [column[0] for column in cursor.description]
+                    with span("sql_fetch") as fetched:
+                        rows = cursor.fetchmany(MAX_ROWS + 1)
+                        fetched["rows"] = len(rows)
+        except QueryGuardError as e:
+            raise ChartSpecError(str(e)) from e
+    if len(rows) > MAX_ROWS:
+        raise ChartSpecError(f"Chart query returned more than {MAX_ROWS} rows")
+    if not rows:
+        raise ChartSpecError("Chart query returned no rows")
+
+    # pyplot keeps global state, so figures are drawn one at a time
+    with span("chart_draw", chart_type=spec["chart_type"]), _render_lock:
+        fig, ax = plt.subplots(figsize=(10, 6))
+        try:
+            _draw(ax, spec, names, rows)
+            if spec["chart_type"] != "pie":
+                ax.set_xlabel(spec["x_label"])
+                ax.set_ylabel(spec["y_label"])
+            ax.set_title(spec["title"])
+            fig.tight_layout()
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format=fmt, dpi=100)
+        finally:
+            plt.close(fig)
+    return store.put(key, buffer.getvalue(), fmt), False
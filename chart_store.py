@@ -0,0 +1,230 @@
+# Content-addressed store for chart images.
+#
+# Image files are named by the SHA-256 of their bytes under ARTIFACT_DIR, so
+# the same chart is kept once however many keys lead to it, and the digest
+# doubles as the HTTP ETag. A small SQLite index maps keys to files: a chart
+# spec (see chart_engine.render_chart), a normalized question plus the dataset
+# version (artifact_key), or a resized/converted variant of another file.
+# Entries unused for ARTIFACT_MAX_AGE are dropped, and once the files pass
+# ARTIFACT_MAX_BYTES the least recently used go first.
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from PIL import Image
+
+from sql_cache import normalize_question
+
+ARTIFACT_DIR = os.getenv('ARTIFACT_DIR', 'static/artifacts')
+
+# Total size of stored images, and how long an unused entry is kept
+MAX_BYTES = int(os.getenv('ARTIFACT_MAX_BYTES', str(512 * 1024 * 1024)))
+MAX_AGE_SECONDS = int(os.getenv('ARTIFACT_MAX_AGE', str(7 * 24 * 3600)))
+
+# Requested widths are clamped to this range; images are only ever scaled down
+MIN_WIDTH = 32
+MAX_WIDTH = 4096
+
+MIMETYPES = {"png": "image/png", "webp": "image/webp", "svg": "image/svg+xml"}
+
+# Quality for WebP variants (Pillow's 0-100 scale)
+WEBP_QUALITY = int(os.getenv('ARTIFACT_WEBP_QUALITY', '85'))
+
+# Unreferenced files younger than this may be about to be linked by a put()
+# in another thread or process, so eviction leaves them alone
+ORPHAN_GRACE_SECONDS = 60
+
+Artifact = namedtuple("Artifact", "digest ext path size")
+
+
+def artifact_key(question, data_version, fmt="png"):
+    """Key for the chart answering ``question`` on one version of the data."""
+    payload = "\x00".join(("question", normalize_question(question), str(data_version), fmt))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def mimetype(artifact):
+    return MIMETYPES[artifact.ext]
+
+
+def etag_matches(if_none_match, artifact):
+    """Whether an If-None-Match header value names this artifact (or is ``*``)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")]
+    return "*" in tags or artifact.digest in tags
+
+
+def clamp_width(width):
+    """Parse a requested width; None (or anything unparseable) keeps full size."""
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return None
+    return max(MIN_WIDTH, min(width, MAX_WIDTH))
+
+
+class ChartStore:
+    """Keyed, size-bounded store of chart image files. Safe to share between
+    threads; several processes may share one directory."""
+
+    def __init__(self, root=ARTIFACT_DIR, max_bytes=MAX_BYTES, max_age=MAX_AGE_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "key TEXT PRIMARY KEY, digest TEXT NOT NULL, ext TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_artifacts_digest ON artifacts (digest)")
+        self._conn.commit()
+
+    def _path(self, digest, ext):
+        return os.path.join(self.root, f"{digest}.{ext}")
+
+    def get(self, key):
+        """Return the Artifact stored under ``key``, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, ext, size, last_used FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and (now - row[3] > self.max_age or not os.path.exists(self._path(row[0], row[1]))):
+                self._conn.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._conn.execute("UPDATE artifacts SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.stats["hits"] += 1
+        return Artifact(row[0], row[1], self._path(row[0], row[1]), row[2])
+
+    def by_digest(self, digest, ext):
+        """The stored file with this digest, for serving it by URL."""
+        path = self._path(digest, ext)
+        if len(digest) != 64 or ext not in MIMETYPES or not os.path.exists(path):
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE artifacts SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            self._conn.commit()
+        return Artifact(digest, ext, path, os.path.getsize(path))
+
+    def put(self, key, data, ext):
+        """Store ``data`` (image bytes) under ``key`` and return its Artifact."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest, ext)
+        try:
+            # A fresh mtime keeps an unreferenced file from being removed as
+            # an orphan before link() below points a key at it
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return self.link(key, Artifact(digest, ext, path, len(data)))
+
+    def link(self, key, artifact):
+        """Point ``key`` at an already stored file as well."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO artifacts (key, digest, ext, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET digest = excluded.digest, ext = excluded.ext, size = excluded.size, "
+                "created_at = excluded.created_at, last_used = excluded.last_used",
+                (key, artifact.digest, artifact.ext, artifact.size, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+        return artifact
+
+    def variant(self, artifact, fmt=None, width=None):
+        """``artifact`` converted to ``fmt`` and/or scaled down to ``width``
+        pixels, made once and then served from the store. SVG can't be
+        rasterized here, so SVG charts are always returned as they are."""
+        fmt = fmt if fmt in MIMETYPES else artifact.ext
+        if artifact.ext == "svg" or (fmt == artifact.ext and width is None) or fmt == "svg":
+            return artifact
+        key = f"variant:{artifact.digest}:{fmt}:{width or ''}"
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with Image.open(artifact.path) as image:
+            image.load()
+        if width is not None and width < image.width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            image.save(buffer, format="WEBP", quality=WEBP_QUALITY, method=4)
+        else:
+            image.save(buffer, format="PNG", optimize=True)
+        return self.put(key, buffer.getvalue(), fmt)
+
+    def _evict(self, now):
+        evicted = self._conn.execute("DELETE FROM artifacts WHERE last_used < ?", (now - self.max_age,)).rowcount
+
+        # A file is freed only when every key pointing at it goes, so files
+        # are evicted whole, least recently used first
+        files = self._conn.execute(
+            "SELECT digest, MAX(size), MAX(last_used) FROM artifacts GROUP BY digest ORDER BY MAX(last_used)"
+        ).fetchall()
+        total = sum(size for _, size, _ in files)
+        for digest, size, _ in files:
+            if total <= self.max_bytes:
+                break
+            evicted += self._conn.execute("DELETE FROM artifacts WHERE digest = ?", (digest,)).rowcount
+            total -= size
+        if evicted:
+            self.stats["evicted"] += evicted
+            self._remove_orphans()
+
+    def _remove_orphans(self, grace=ORPHAN_GRACE_SECONDS):
+        referenced = {f"{digest}.{ext}" for digest, ext in
+                      self._conn.execute("SELECT DISTINCT digest, ext FROM artifacts")}
+        cutoff = time.time() - grace
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return
+        for name in names:
+            stem, _, ext = name.partition(".")
+            if ext in MIMETYPES and len(stem) == 64 and name not in referenced:
+                path = os.path.join(self.root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Drop every entry and stored file, and reset the counters."""
+        with self._lock:
+            self._conn.execute("DELETE FROM artifacts")
+            self._conn.commit()
+            self._remove_orphans(grace=float("-inf"))
+            self.stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    def summary(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), (SELECT COALESCE(SUM(size), 0) FROM "
+                "(SELECT MAX(size) AS size FROM artifacts GROUP BY digest)) FROM artifacts"
+            ).fetchone()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, entries=entries, bytes=size, max_bytes=self.max_bytes,
+                    hit_ratio=round(self.stats["hits"] / lookups, 4) if lookups else 0.0)
@@ -0,0 +1,490 @@
+# In-memory column store for the survey table.
+#
+#   python column_store.py medical.db [--out column_store/default]    # write the snapshot ahead of time
+#
+# Nearly every column of medical_info is a short list of repeated answers
+# (yes/no, Likert options, region and income buckets). ColumnStore keeps the
+# table column by column: each categorical column as NumPy integer codes into
+# its own small vocabulary, each numeric column as a typed array. Snapshots
+# are written to disk per data version and memory-mapped, so a restart on
+# unchanged data loads in milliseconds. A new data version is loaded in the
+# background; until it is ready, queries go to SQLite as before.
+#
+# ColumnStore.execute answers the COUNT(*) / WHERE col = 'value' / GROUP BY
+# queries that aggregate_cube.parse_count_query recognises with vectorised
+# NumPy code; anything else returns None and runs on SQLite.
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+import numpy as np
+
+from aggregate_cube import parse_count_query, quote_identifier, split_top_level
+from request_metrics import metrics, span
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "medical_info"
+
+# Load the column store for single-file datasets ("1"); datasets.json can turn it on or off per dataset
+COLUMN_STORE = os.getenv('COLUMN_STORE', '') not in ('', '0', 'false', 'no')
+
+# Directory the memory-mapped snapshots are kept in, one subdirectory per dataset
+COLUMN_STORE_DIR = os.getenv('COLUMN_STORE_DIR', 'column_store')
+
+# Text columns with more distinct values than this (free-text answers, ids) aren't loaded
+MAX_CATEGORIES = int(os.getenv('COLUMN_STORE_MAX_CATEGORIES', '4096'))
+
+# Rows read from SQLite per fetchmany() while loading
+LOAD_BATCH_ROWS = 50000
+
+_COUNT_EXPRESSION = re.compile(r'^COUNT\(\s*(?:\*|1|"?CASE_ID"?)\s*\)$', re.IGNORECASE)
+_ORDER_ITEM = re.compile(r"^(?P<expr>.+?)(?:\s+(?P<direction>ASC|DESC))?$", re.IGNORECASE | re.DOTALL)
+
+# SQLite's LOWER() only folds ASCII letters
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def _code_dtype(size):
+    if size <= 1 << 8:
+        return np.uint8
+    if size <= 1 << 16:
+        return np.uint16
+    return np.uint32
+
+
+def _sort_key(value):
+    # SQLite orders NULL first, then numbers, then text
+    if value is None:
+        return (0, 0)
+    if isinstance(value, str):
+        return (2, value)
+    return (1, value)
+
+
+class Column:
+    """One column: ``kind`` is "category" (``values`` are codes into
+    ``vocabulary``, code 0 being NULL), "integer" (int64, with a ``nulls``
+    mask when there are NULLs) or "real" (float64, NaN for NULL)."""
+
+    def __init__(self, name, kind, values, vocabulary=None, nulls=None):
+        self.name = name
+        self.kind = kind
+        self.values = values
+        self.vocabulary = vocabulary
+        self.nulls = nulls
+        self._lowered = None
+
+    def null_mask(self):
+        if self.kind == "real":
+            return np.isnan(self.values)
+        return self.nulls
+
+    def codes(self, lower=False):
+        """``(codes, vocabulary)`` for grouping by this column (LOWER(column) when ``lower``)."""
+        if self.kind == "category":
+            if not lower:
+                return self.values, self.vocabulary
+            if self._lowered is None:
+                lowered = {None: 0}
+                remap = np.array([lowered.setdefault(value if value is None else value.translate(_ASCII_LOWER),
+                                                     len(lowered)) for value in self.vocabulary],
+                                 dtype=_code_dtype(len(self.vocabulary)))
+                self._lowered = (remap, list(lowered))
+            remap, vocabulary = self._lowered
+            return remap[self.values], vocabulary
+        if lower:
+            return None
+        nulls = self.null_mask()
+        present = self.values[~nulls] if nulls is not None else self.values
+        distinct = np.unique(present)
+        codes = np.searchsorted(distinct, self.values) + 1
+        if nulls is not None:
+            codes[nulls] = 0
+        return codes, [None] + distinct.tolist()
+
+    def matches(self, value, lower=False):
+        """Boolean mask of the rows where ``column = 'value'``; None for numeric columns."""
+        if self.kind != "category":
+            return None
+        if lower:
+            wanted = [code for code, item in enumerate(self.vocabulary)
+                      if item is not None and item.translate(_ASCII_LOWER) == value]
+        else:
+            wanted = [code for code, item in enumerate(self.vocabulary) if item == value]
+        if not wanted:
+            return np.zeros(len(self.values), dtype=bool)
+        if len(wanted) == 1:
+            return self.values == wanted[0]
+        return np.isin(self.values, wanted)
+
+    def nbytes(self):
+        return int(self.values.nbytes + (self.nulls.nbytes if self.nulls is not None else 0))
+
+
+class ColumnTable:
+    """A loaded snapshot of one table at one data version."""
+
+    def __init__(self, data_version, rows, columns):
+        self.data_version = data_version
+        self.rows = rows
+        # SQLite column names are case-insensitive, and parse_count_query upper-cases them
+        self.columns = {column.name.upper(): column for column in columns}
+
+    def count(self, parsed):
+        """``(column names, rows)`` for a query from parse_count_query, or None when a
+        column it uses isn't loaded or it needs something the store can't do."""
+        mask = None
+        for name, lower, value in parsed["filters"]:
+            column = self.columns.get(name)
+            hit = column.matches(value, lower) if column is not None else None
+            if hit is None:
+                return None
+            mask = hit if mask is None else mask & hit
+
+        names = []
+        for name, lower, alias in parsed["selected"]:
+            column = self.columns[name] if name in self.columns else None
+            if column is None:
+                return None
+            # Plain column references are reported under the declared name, like SQLite does
+            plain = not lower and alias.strip('"').upper() == name
+            names.append(column.name if plain else alias)
+        names.insert(parsed["count_position"], parsed["count_alias"])
+
+        if not parsed["groups"]:
+            total = int(np.count_nonzero(mask)) if mask is not None else self.rows
+            return names, [(total,)]
+
+        combined, vocabularies, size = None, [], 1
+        for name, lower in parsed["groups"]:
+            coded = self.columns[name].codes(lower)
+            if coded is None:
+                return None
+            codes, vocabulary = coded
+            codes = codes.astype(np.int64)
+            combined = codes if combined is None else combined * len(vocabulary) + codes
+            vocabularies.append(vocabulary)
+            size *= len(vocabulary)
+        if size >= 1 << 62:
+            return None
+        if mask is not None:
+            combined = combined[mask]
+        if size <= 1 << 20:
+            counts = np.bincount(combined, minlength=size)
+            keys = np.flatnonzero(counts)
+            counts = counts[keys]
+        else:
+            keys, counts = np.unique(combined, return_counts=True)
+
+        groups = []
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            values = []
+            for vocabulary in reversed(vocabularies):
+                key, code = divmod(key, len(vocabulary))
+                values.append(vocabulary[code])
+            groups.append((values[::-1], count))
+        # GROUP BY hands the groups back in key order
+        groups.sort(key=lambda group: [_sort_key(value) for value in group[0]])
+
+        group_of = {group: index for index, group in enumerate(parsed["groups"])}
+        rows = []
+        for values, count in groups:
+            row = [values[group_of[(name, lower)]] for name, lower, _ in parsed["selected"]]
+            row.insert(parsed["count_position"], count)
+            rows.append(tuple(row))
+
+        if parsed["order"]:
+            positions = []
+            for item in split_top_level(parsed["order"]):
+                order = _ORDER_ITEM.match(item.strip())
+                expr = order.group("expr").strip()
+                if expr.isdigit() and 0 < int(expr) <= len(names):
+                    position = int(expr) - 1
+                elif _COUNT_EXPRESSION.match(expr):
+                    position = parsed["count_position"]
+                else:
+                    unquoted = expr.strip('"').upper()
+                    position = next((index for index, name in enumerate(names) if name.upper() == unquoted), None)
+                if position is None:
+                    return None
+                positions.append((position, (order.group("direction") or "").upper() == "DESC"))
+            # Stable sorts, last key first, give the combined ordering
+            for position, descending in reversed(positions):
+                rows.sort(key=lambda row: _sort_key(row[position]), reverse=descending)
+        if parsed["limit"]:
+            rows = rows[:int(parsed["limit"])]
+        return names, rows
+
+    def nbytes(self):
+        return sum(column.nbytes() for column in self.columns.values())
+
+
+# ---- loading --------------------------------------------------------------
+
+class _ColumnBuilder:
+    """Fills one column's preallocated arrays while the table is scanned;
+    ``finish`` returns a Column, or None when the column can't be held
+    (mixed types, blobs, or text with too many distinct values)."""
+
+    def __init__(self, name, declared_type, rows):
+        self.name = name
+        self.numeric = declared_type.upper() in ("INTEGER", "INT", "REAL", "FLOAT", "DOUBLE", "NUMERIC")
+        self.vocabulary = {None: 0}
+        self.filled = 0
+        if self.numeric:
+            self.values = np.empty(rows, dtype=np.float64)
+        else:
+            self.codes = np.empty(rows, dtype=_code_dtype(MAX_CATEGORIES + 1))
+        self.types = set()
+        self.dropped = False
+
+    def add(self, values):
+        if self.dropped:
+            return
+        self.types.update(type(value) for value in values if value is not None)
+        start, end = self.filled, self.filled + len(values)
+        if self.numeric:
+            if not self.types <= {int, float}:
+                self._drop()
+                return
+            # None becomes NaN; SQLite has no NaN of its own, so NaN marks the NULLs
+            self.values = _fill(self.values, start, end, values)
+        else:
+            if not self.types <= {str}:
+                self._drop()
+                return
+            vocabulary = self.vocabulary
+            codes = np.fromiter((vocabulary.setdefault(value, len(vocabulary)) for value in values),
+                                dtype=np.uint32, count=len(values))
+            if len(vocabulary) > MAX_CATEGORIES + 1:
+                self._drop()
+                return
+            self.codes = _fill(self.codes, start, end, codes)
+        self.filled = end
+
+    def _drop(self):
+        self.dropped = True
+        self.vocabulary, self.values, self.codes = {}, None, None
+
+    def finish(self):
+        if self.dropped or len(self.types) > 1:
+            return None
+        if not self.numeric:
+            codes = self.codes[:self.filled]
+            dtype = _code_dtype(len(self.vocabulary))
+            return Column(self.name, "category", codes.astype(dtype) if dtype != codes.dtype else codes,
+                          list(self.vocabulary))
+        values = self.values[:self.filled]
+        if self.types == {float}:
+            return Column(self.name, "real", values)
+        nulls = np.isnan(values)
+        values[nulls] = 0
+        # Integers beyond 2**53 don't survive the trip through float64
+        if values.size and np.abs(values).max() > 2 ** 53:
+            return None
+        return Column(self.name, "integer", values.astype(np.int64), nulls=nulls if nulls.any() else None)
+
+
+def _fill(target, start, end, values):
+    """Write ``values`` into ``target[start:end]``, growing ``target`` if
+    rows were added after they were counted."""
+    if end > len(target):
+        target = np.resize(target, max(end, len(target) * 2))
+    target[start:end] = values
+    return target
+
+
+def scan_table(conn, table=TABLE_NAME):
+    """Read ``table`` column by column from an open SQLite connection; returns ``(rows, columns)``."""
+    declared = [(row[1], row[2] or "") for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")]
+    # Counted first so every column is allocated once at its full size
+    expected = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)}").fetchone()[0]
+    builders = [_ColumnBuilder(name, declared_type, expected) for name, declared_type in declared]
+    cursor = conn.execute(f"SELECT {', '.join(quote_identifier(name) for name, _ in declared)} "
+                          f"FROM {quote_identifier(table)}")
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(LOAD_BATCH_ROWS)
+        if not batch:
+            break
+        rows += len(batch)
+        for builder, values in zip(builders, zip(*batch)):
+            builder.add(values)
+    columns = []
+    # Each builder's arrays are let go as soon as its column is made
+    while builders:
+        column = builders.pop(0).finish()
+        if column is not None:
+            columns.append(column)
+    return rows, columns
+
+
+def _snapshot_name(data_version):
+    return "v-" + re.sub(r"[^A-Za-z0-9_.-]+", "_", str(data_version))
+
+
+def write_snapshot(directory, table):
+    """Save ``table`` as one .npy file per column plus meta.json, replacing
+    any older snapshot in ``directory``. Returns the snapshot path."""
+    final = os.path.join(directory, _snapshot_name(table.data_version))
+    staging = f"{final}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    meta = {"data_version": table.data_version, "rows": table.rows, "columns": []}
+    for index, column in enumerate(table.columns.values()):
+        np.save(os.path.join(staging, f"{index}.npy"), column.values)
+        if column.nulls is not None:
+            np.save(os.path.join(staging, f"{index}.nulls.npy"), column.nulls)
+        meta["columns"].append({"name": column.name, "kind": column.kind, "file": f"{index}.npy",
+                                "nulls": f"{index}.nulls.npy" if column.nulls is not None else None,
+                                "vocabulary": column.vocabulary})
+    with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(staging, final)
+    # Older versions go; a process still mapping them keeps its pages until it lets go
+    for name in os.listdir(directory):
+        if name != os.path.basename(final) and name.startswith("v-") and ".tmp-" not in name:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return final
+
+
+def read_snapshot(directory, data_version):
+    """Memory-map the snapshot of ``data_version`` in ``directory``; None when there isn't one."""
+    path = os.path.join(directory, _snapshot_name(data_version))
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta["data_version"] != data_version:
+        return None
+    columns = []
+    for entry in meta["columns"]:
+        values = np.load(os.path.join(path, entry["file"]), mmap_mode="r")
+        nulls = np.load(os.path.join(path, entry["nulls"]), mmap_mode="r") if entry["nulls"] else None
+        columns.append(Column(entry["name"], entry["kind"], values, entry["vocabulary"], nulls))
+    return ColumnTable(data_version, meta["rows"], columns)
+
+
+class ColumnStore:
+    """The column store of one single-file dataset. ``execute`` answers from
+    the snapshot matching the pool's current data version; while that is
+    still loading (at startup or after the data changed) it returns None."""
+
+    def __init__(self, db_pool, table=TABLE_NAME, directory=None):
+        self.db_pool = db_pool
+        self.table = table
+        self.directory = directory or os.path.join(COLUMN_STORE_DIR, "default")
+        self._loaded = None
+        self._loading = False
+        self._failed_version = None
+        self._lock = threading.Lock()
+        self.last_load = None
+
+    def load(self):
+        """Load the current data version, from its snapshot when there is one,
+        otherwise by scanning SQLite (and writing the snapshot)."""
+        started = time.perf_counter()
+        # One read transaction, so the version and the rows scanned agree
+        with self.db_pool.snapshot() as conn:
+            version = str(self.db_pool.data_version())
+            table, source = read_snapshot(self.directory, version), "snapshot"
+            if table is None:
+                rows, columns = scan_table(conn, self.table)
+                table, source = ColumnTable(version, rows, columns), "sqlite"
+        if source == "sqlite":
+            try:
+                write_snapshot(self.directory, table)
+                # Read back memory-mapped, the arrays live in the page cache rather than the heap
+                table = read_snapshot(self.directory, version) or table
+            except OSError as e:
+                logger.warning("Column store snapshot not written to %s: %s", self.directory, e)
+        self._loaded = table
+        self.last_load = {"source": source, "data_version": version,
+                          "seconds": round(time.perf_counter() - started, 3)}
+        logger.info("Column store for %s loaded from %s: %d rows, %d columns in %.3f s", self.table, source,
+                    table.rows, len(table.columns), self.last_load["seconds"])
+        return table
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception as e:
+            self._failed_version = self.db_pool.data_version()
+            logger.warning("Column store for %s not loaded: %s", self.table, e)
+        finally:
+            self._loading = False
+
+    def refresh(self):
+        """Start loading the current data version on a background thread, unless that's under way."""
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._load_in_background, name="column-store", daemon=True).start()
+
+    def current(self):
+        """The loaded table when it matches the data; otherwise None, and a reload starts."""
+        loaded = self._loaded
+        version = str(self.db_pool.data_version())
+        if loaded is not None and loaded.data_version == version:
+            return loaded
+        if version != self._failed_version:
+            self.refresh()
+        return None
+
+    def execute(self, sql):
+        """``(column names, rows)`` answering ``sql`` from memory, or None when SQLite has to."""
+        parsed = parse_count_query(sql)
+        if parsed is None:
+            return None
+        loaded = self.current()
+        if loaded is None:
+            metrics.inc("column_store_queries_total", 1, "Count queries by column store result", result="loading")
+            return None
+        with span("column_scan", rows=loaded.rows):
+            answer = loaded.count(parsed)
+        metrics.inc("column_store_queries_total", 1, "Count queries by column store result",
+                    result="hit" if answer else "unsupported")
+        return answer
+
+    def summary(self):
+        loaded = self._loaded
+        return {
+            "loaded": loaded is not None,
+            "data_version": loaded.data_version if loaded else None,
+            "rows": loaded.rows if loaded else 0,
+            "columns": len(loaded.columns) if loaded else 0,
+            "bytes": loaded.nbytes() if loaded else 0,
+            "loading": self._loading,
+            "last_load": self.last_load,
+        }
+
+
+def main(argv=None):
+    from db_pool import ReadOnlyConnectionPool
+
+    parser = argparse.ArgumentParser(description="Write the column store snapshot of a SQLite table")
+    parser.add_argument("db", help="SQLite database file")
+    parser.add_argument("--table", default=TABLE_NAME)
+    parser.add_argument("--out", default=os.path.join(COLUMN_STORE_DIR, "default"),
+                        help="snapshot directory (COLUMN_STORE_DIR/<dataset name> for the app)")
+    args = parser.parse_args(argv)
+    store = ColumnStore(ReadOnlyConnectionPool(args.db), args.table, args.out)
+    table = store.load()
+    print(f"{store.last_load['source']}: rows={table.rows} columns={len(table.columns)} bytes={table.nbytes()} "
+          f"seconds={store.last_load['seconds']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
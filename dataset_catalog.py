@@ -0,0 +1,132 @@
+# Datasets the app answers questions about.
+#
+# DATASET_CATALOG (default datasets.json) names them:
+#
+#   {"default": "wave1",
+#    "datasets": {
+#      "wave1":  {"db": "medical.db", "csv": "data/BrCA Dataset_N5030_lab.csv"},
+#      "wave2":  {"db": "wave2.db", "csv": "data/wave2.csv", "schema": "schemas/wave2.json"},
+#      "cohort": {"partitions": ["partitions/medical_south.db", "partitions/medical_west.db"],
+#                 "partitioned_by": "AHRI_REGION"}}}
+#
+# "table" defaults to medical_info and "schema" (a JSON object of column
+# descriptions for the SQL prompt) to medical_schema.py. Partitioned datasets
+# are read through partitioned_db.PartitionedPool. "column_store" (default:
+# the COLUMN_STORE setting) keeps a single-file dataset in column_store.py's
+# in-memory column store as well. Requests pick a dataset with
+# "dataset"; without a catalog file the app serves medical.db alone, as before.
+
+import json
+import os
+
+from aggregate_cube import AggregateRewriter
+from column_store import COLUMN_STORE, COLUMN_STORE_DIR, ColumnStore
+from db_pool import ReadOnlyConnectionPool
+from medical_schema import COLUMN_DESCRIPTIONS
+from partitioned_db import FanOut, PartitionedPool
+from query_router import TemplateParser
+from schema_index import SchemaIndex
+from sql_cache import SQL_CACHE_PATH, SQLCache
+
+DATASET_CATALOG = os.getenv('DATASET_CATALOG', 'datasets.json')
+
+DEFAULT_DATASET = {"db": "medical.db", "csv": "data/BrCA Dataset_N5030_lab.csv"}
+
+TABLE_NAME = "medical_info"
+
+
+class DatasetError(LookupError):
+    pass
+
+
+def load_descriptions(schema_path):
+    """Column descriptions from a JSON file, or medical_schema.py's when no file is given."""
+    if not schema_path:
+        return COLUMN_DESCRIPTIONS
+    with open(schema_path, encoding="utf-8") as f:
+        descriptions = json.load(f)
+    if not isinstance(descriptions, dict) or not descriptions:
+        raise DatasetError(f"{schema_path} must be a JSON object of column descriptions")
+    return descriptions
+
+
+class Dataset:
+    """One dataset: where its rows live, how its columns are described, and
+    the per-dataset pieces built on them (connection pool, prompt schema
+    index, SQL cache, aggregate rewriter, question templates and, optionally,
+    column store)."""
+
+    def __init__(self, name, db=None, partitions=None, table=TABLE_NAME, csv=None, schema=None,
+                 partitioned_by=None, sql_cache=None, column_store=None, default=False):
+        if bool(db) == bool(partitions):
+            raise DatasetError(f"Dataset '{name}' needs either 'db' or 'partitions'")
+        self.name = name
+        self.table = table
+        self.csv_path = csv
+        self.partitioned_by = partitioned_by
+        self.column_descriptions = load_descriptions(schema)
+        if partitions:
+            self.pool = PartitionedPool(partitions, table)
+            self.fanout = FanOut(self.pool)
+        else:
+            self.pool = ReadOnlyConnectionPool(db)
+            self.fanout = None
+        self.rewriter = AggregateRewriter(self.pool)
+        self.schema_index = SchemaIndex(self.column_descriptions)
+        self.templates = TemplateParser(self.pool, self.column_descriptions, table)
+        self.column_store = None
+        if (COLUMN_STORE if column_store is None else column_store) and not partitions:
+            self.column_store = ColumnStore(self.pool, table, os.path.join(COLUMN_STORE_DIR, name))
+        # The default dataset keeps the cache file it always had
+        self.sql_cache = SQLCache(sql_cache or (SQL_CACHE_PATH if default else f"sql_cache_{name}.db"))
+
+    def data_version(self):
+        """Changes whenever the data does; distinct between datasets."""
+        return f"{self.name}:{self.pool.data_version()}"
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "table": self.table,
+            "files": self.pool.database_paths(),
+            "partitioned_by": self.partitioned_by,
+            "columns": len(self.column_descriptions),
+            "data_version": self.pool.data_version(),
+            "charts_with_code_interpreter": bool(self.csv_path),
+            "column_store": self.column_store.summary() if self.column_store else None,
+        }
+
+
+class DatasetCatalog:
+    """The configured datasets by name, and which one requests get by default."""
+
+    def __init__(self, datasets, default):
+        self.datasets = datasets
+        self.default = datasets[default]
+
+    @classmethod
+    def load(cls, path=DATASET_CATALOG):
+        if not path or not os.path.exists(path):
+            return cls({"default": Dataset("default", default=True, **DEFAULT_DATASET)}, "default")
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        entries = config.get("datasets") or {}
+        if not entries:
+            raise DatasetError(f"{path} lists no datasets")
+        default = config.get("default") or next(iter(entries))
+        if default not in entries:
+            raise DatasetError(f"Default dataset '{default}' is not in {path}")
+        datasets = {name: Dataset(name, default=name == default, **entry) for name, entry in entries.items()}
+        return cls(datasets, default)
+
+    def get(self, name=None):
+        """The dataset called ``name``, or the default one; raises DatasetError when unknown."""
+        if not name:
+            return self.default
+        dataset = self.datasets.get(name)
+        if dataset is None:
+            raise DatasetError(f"Unknown dataset '{name}'; choose one of: {', '.join(self.datasets)}")
+        return dataset
+
+    def describe(self):
+        return {"default": self.default.name, "datasets": [dataset.describe() for dataset in self.datasets.values()]}
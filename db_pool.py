@@ -0,0 +1,267 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# Memory-map up to this many bytes of the database file
+MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+# Page cache per connection, in KiB (SQLite takes negative values as KiB)
+CACHE_SIZE_KIB = int(os.getenv('SQLITE_CACHE_SIZE_KIB', str(64 * 1024)))
+
+# Idle connections kept open per database; busier moments open extra ones
+# that are closed again when returned
+POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '8'))
+
+# Connections in use at once per database; past this, requests wait for one to be returned
+MAX_CONNECTIONS = int(os.getenv('SQLITE_MAX_CONNECTIONS', '32'))
+
+# Seconds a request waits for a connection before giving up
+CHECKOUT_TIMEOUT = float(os.getenv('SQLITE_CHECKOUT_TIMEOUT', '30'))
+
+
+class ReadOnlyConnectionPool:
+    """Hands out pooled read-only SQLite connections so that repeated
+    queries don't pay for connect and PRAGMA setup each time. A connection
+    is checked out for the length of a ``cursor()`` block and returned after,
+    so the number kept open doesn't grow with the number of server threads:
+    at most ``pool_size`` stay open while idle, and at most
+    ``max_connections`` are in use at once (later checkouts wait).
+
+    Schema lookups are cached until the database file changes on disk.
+    """
+
+    def __init__(self, db_path, mmap_size=MMAP_SIZE, cache_size_kib=CACHE_SIZE_KIB, pool_size=POOL_SIZE,
+                 max_connections=MAX_CONNECTIONS, checkout_timeout=CHECKOUT_TIMEOUT):
+        self.db_path = db_path
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.pool_size = pool_size
+        self.max_connections = max(1, max_connections, pool_size)
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue(maxsize=max(1, pool_size))
+        self._slots = threading.BoundedSemaphore(self.max_connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._table_cache = {}
+        self._wal_checked = False
+        atexit.register(self.close_all)
+
+    # SQLite files the pool reads
+    def database_paths(self):
+        return [self.db_path]
+
+    # The database (and its WAL, if any) changes whenever either file does
+    def _signature(self):
+        signature = []
+        for db_path in self.database_paths():
+            for path in (db_path, f"{db_path}-wal"):
+                try:
+                    stat = os.stat(path)
+                    signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+                except FileNotFoundError:
+                    signature.append(None)
+        return tuple(signature)
+
+    # Files replaced on disk (a rebuild) mean connections have to be reopened
+    def _identity(self):
+        identity = []
+        for path in self.database_paths():
+            try:
+                identity.append(os.stat(path).st_ino)
+            except FileNotFoundError:
+                identity.append(None)
+        return tuple(identity)
+
+    # WAL lets readers run alongside the ingest writer, but switching the
+    # journal mode needs a writable connection, so it is done once up front.
+    def _ensure_wal(self):
+        if self._wal_checked:
+            return
+        self._wal_checked = True
+        for path in self.database_paths():
+            if not os.path.exists(path):
+                continue
+            try:
+                conn = sqlite3.connect(path)
+                try:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _open(self):
+        uri = f"file:{quote(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size={-int(self.cache_size_kib)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _connect(self):
+        with self._lock:
+            self._ensure_wal()
+        conn = self._open()
+        with self._lock:
+            self._connections.add(conn)
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self._connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _checkout(self):
+        """Take an idle connection, or open one if none is left; connections
+        opened before the database file was replaced are closed instead.
+        Waits while ``max_connections`` are checked out already."""
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise sqlite3.OperationalError(f"All {self.max_connections} connections to "
+                                           f"{', '.join(self.database_paths())} are in use")
+        try:
+            identity = self._identity()
+            while True:
+                try:
+                    conn, opened_on = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect(), identity
+                if opened_on == identity:
+                    return conn, identity
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, conn, identity, broken=False):
+        """Return a checked-out connection; past ``pool_size`` idle ones
+        (after a burst of concurrent requests) or when ``broken`` it is
+        closed rather than kept."""
+        try:
+            if conn not in self._connections:
+                return
+            if broken:
+                self._discard(conn)
+                return
+            try:
+                self._idle.put_nowait((conn, identity))
+            except queue.Full:
+                self._discard(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def cursor(self):
+        pinned = getattr(self._local, "pinned", None)
+        if pinned is not None:
+            # Inside snapshot(): keep reading the data the transaction started on
+            conn, identity = pinned, None
+        else:
+            conn, identity = self._checkout()
+        cursor = conn.cursor()
+        broken = False
+        try:
+            yield cursor
+        except sqlite3.Error as e:
+            # Ordinary SQL errors leave the connection usable; a closed handle
+            # or a corrupt file means it shouldn't go to the next request.
+            broken = not isinstance(e, sqlite3.OperationalError)
+            raise
+        finally:
+            try:
+                cursor.close()
+            except sqlite3.Error:
+                pass
+            if pinned is None:
+                self._checkin(conn, identity, broken)
+
+    @contextmanager
+    def snapshot(self):
+        """Hold one read transaction on a connection for the enclosed block,
+        so every query this thread runs in it sees the same data even while
+        the ingest writer commits."""
+        if getattr(self._local, "pinned", None) is not None:
+            yield self._local.pinned
+            return
+        conn, identity = self._checkout()
+        try:
+            conn.execute("BEGIN")
+            # BEGIN is deferred: the snapshot is taken by the first read
+            conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        except sqlite3.Error:
+            self._checkin(conn, identity, broken=True)
+            raise
+        self._local.pinned = conn
+        try:
+            yield conn
+        finally:
+            self._local.pinned = None
+            broken = False
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                broken = True
+            self._checkin(conn, identity, broken)
+
+    def in_snapshot(self):
+        """Whether this thread is inside a ``snapshot()`` block."""
+        return getattr(self._local, "pinned", None) is not None
+
+    def _remember(self, key, signature, value):
+        # A snapshot may be older than the file on disk, so what it reads isn't
+        # cached under the file's current signature
+        if not self.in_snapshot():
+            self._table_cache[key] = (signature, value)
+
+    def table_exists(self, table_name):
+        signature = self._signature()
+        if signature[0] is None:
+            return False
+        cached = self._table_cache.get(table_name)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with self.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+            exists = cursor.fetchone() is not None
+        self._remember(table_name, signature, exists)
+        return exists
+
+    def data_version(self):
+        """The ingest data_version (see ingest_csv.py), or the file signature
+        for databases built some other way; changes whenever the data does."""
+        signature = self._signature()
+        cached = self._table_cache.get("ingest_meta:data_version")
+        if cached and cached[0] == signature:
+            return cached[1]
+        version = None
+        if self.table_exists("ingest_meta"):
+            with self.cursor() as cursor:
+                cursor.execute("SELECT value FROM ingest_meta WHERE key = 'data_version'")
+                row = cursor.fetchone()
+                version = row[0] if row else None
+        if version is None:
+            version = "sig-" + "-".join(str(part) for item in signature if item for part in item)
+        self._remember("ingest_meta:data_version", signature, version)
+        return version
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,380 @@
+# Build or refresh the medical_info table from the survey CSV.
+#
+#   python ingest_csv.py                          # upsert the default CSV into medical.db
+#   python ingest_csv.py new_drop.csv --prune     # also drop CASE_IDs missing from the file
+#   python ingest_csv.py --rebuild                # recreate the table with inferred types
+#
+# The CSV is streamed in chunks, so memory stays flat however large the file is.
+
+import argparse
+import csv
+import hashlib
+import logging
+import re
+import sqlite3
+import sys
+import time
+
+from aggregate_cube import build_cube, cube_is_current
+
+DEFAULT_CSV_PATH = "data/BrCA Dataset_N5030_lab.csv"
+DEFAULT_DB_PATH = "medical.db"
+TABLE_NAME = "medical_info"
+KEY_COLUMN = "CASE_ID"
+
+# Always stored as numbers; other columns are inferred from the first chunk
+# and widened (INTEGER -> REAL -> TEXT) when a later chunk does not fit
+NUMERIC_COLUMNS = {
+    "AGE", "AHRI_CCI_SCORE",
+    "MMG_FREQ_3MO", "MMG_FREQ_6MO", "MMG_FREQ_9MO", "MMG_FREQ_12MO",
+    "MMG_FREQ_24MO", "MMG_FREQ_BEYOND24MO",
+}
+
+# Yes/no and Likert answers are lowercased so queries can compare them directly
+NORMALIZED_PREFIXES = ("C_", "BARRIER_", "LIS_")
+
+# Columns the text questions filter and group on most
+INDEXED_COLUMNS = ("AHRI_REGION", "SEX", "AHRI_RACE_CAT", "AHRI_AGE_CAT", "INCOME")
+
+CHUNK_ROWS = 2000
+
+YES_NO_SYNONYMS = {"y": "yes", "n": "no", "true": "yes", "false": "no"}
+
+_WHITESPACE = re.compile(r"\s+")
+
+_TYPE_RANK = {"INTEGER": 0, "REAL": 1, "TEXT": 2}
+
+logger = logging.getLogger(__name__)
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_normalized_column(column):
+    return column.startswith(NORMALIZED_PREFIXES) and not column.endswith("_TXT")
+
+
+def normalize_answer(value):
+    value = _WHITESPACE.sub(" ", value.strip().lower())
+    return YES_NO_SYNONYMS.get(value, value)
+
+
+def parse_number(value):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        # Free-text answers in numeric columns are kept; SQLite's column
+        # affinity stores them as TEXT alongside the numbers.
+        return value
+
+
+def infer_column_types(header, sample_rows):
+    types = {}
+    for index, column in enumerate(header):
+        if column == KEY_COLUMN:
+            types[column] = "TEXT"
+            continue
+        values = [row[index].strip() for row in sample_rows if index < len(row) and row[index].strip()]
+        if column in NUMERIC_COLUMNS:
+            numbers = [n for n in map(parse_number, values) if not isinstance(n, str)]
+            types[column] = "INTEGER" if numbers and all(isinstance(n, int) for n in numbers) else "REAL"
+        elif values and all(isinstance(parse_number(v), int) for v in values):
+            types[column] = "INTEGER"
+        elif values and all(isinstance(parse_number(v), (int, float)) for v in values):
+            types[column] = "REAL"
+        else:
+            types[column] = "TEXT"
+    return types
+
+
+def value_type(value):
+    number = parse_number(value)
+    if isinstance(number, int):
+        return "INTEGER"
+    return "REAL" if isinstance(number, float) else "TEXT"
+
+
+def widen_column_types(header, types, rows):
+    """Return ``{column: type}`` for the numeric columns whose values in ``rows`` need a wider type."""
+    widened = {}
+    for index, column in enumerate(header):
+        current = types[column]
+        if current not in ("INTEGER", "REAL"):
+            continue
+        needed, text_values = current, 0
+        for row in rows:
+            value = row[index].strip() if index < len(row) else ""
+            if not value:
+                continue
+            kind = value_type(value)
+            if kind == "TEXT" and column in NUMERIC_COLUMNS:
+                text_values += 1
+            elif _TYPE_RANK[kind] > _TYPE_RANK[needed]:
+                needed = kind
+        if text_values:
+            logger.warning("%s: %d free-text value(s) kept in a %s column", column, text_values, needed)
+        if needed != current:
+            widened[column] = needed
+    return widened
+
+
+def make_row_converter(header, types):
+    converters = []
+    for column in header:
+        if is_normalized_column(column):
+            converters.append(normalize_answer)
+        elif types[column] in ("INTEGER", "REAL"):
+            converters.append(lambda v: parse_number(v.strip()))
+        else:
+            converters.append(str.strip)
+
+    width = len(header)
+
+    def convert(row):
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        return [conv(value) if value.strip() else None for conv, value in zip(converters, row)]
+
+    return convert
+
+
+def row_hash(values):
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(repr(value).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def read_chunks(reader, size):
+    chunk = []
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def table_columns(conn, table):
+    return {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")}
+
+
+def create_key_index(conn):
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote_identifier('ux_' + TABLE_NAME + '_' + KEY_COLUMN)} "
+                 f"ON {quote_identifier(TABLE_NAME)} ({quote_identifier(KEY_COLUMN)})")
+
+
+def widen_table(conn, widened):
+    """Recreate the table with the wider declared types in ``widened``.
+
+    SQLite cannot change a column's type in place, so the rows are copied into
+    a new table; the new column affinity converts the values already stored.
+    Their fingerprints were taken with the narrower types, so the next run
+    rewrites those rows once.
+    """
+    table = quote_identifier(TABLE_NAME)
+    staging = quote_identifier(TABLE_NAME + "_widen")
+    column_defs = ", ".join(
+        f"{quote_identifier(name)} {widened.get(name, declared)}" + (" NOT NULL" if notnull else "")
+        for _, name, declared, notnull, _, _ in conn.execute(f"PRAGMA table_info({table})")
+    )
+    conn.execute(f"DROP TABLE IF EXISTS {staging}")
+    conn.execute(f"CREATE TABLE {staging} ({column_defs})")
+    conn.execute(f"INSERT INTO {staging} SELECT * FROM {table}")
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+    # Dropping the old table dropped its indexes; the others come back in create_indexes
+    create_key_index(conn)
+
+
+def prepare_schema(conn, header, types, rebuild):
+    if rebuild:
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(TABLE_NAME)}")
+        conn.execute(f"DROP TABLE IF EXISTS {quote_identifier(TABLE_NAME + '_ingest')}")
+
+    existing = table_columns(conn, TABLE_NAME)
+    if not existing:
+        column_defs = ", ".join(
+            f"{quote_identifier(column)} {types[column]}" + (" NOT NULL" if column == KEY_COLUMN else "")
+            for column in header
+        )
+        conn.execute(f"CREATE TABLE {quote_identifier(TABLE_NAME)} ({column_defs})")
+    else:
+        # New columns in a data drop are added; old untyped tables keep working
+        for column in header:
+            if column not in existing:
+                conn.execute(f"ALTER TABLE {quote_identifier(TABLE_NAME)} "
+                             f"ADD COLUMN {quote_identifier(column)} {types[column]}")
+
+    create_key_index(conn)
+
+    # Row fingerprints let a re-run skip rows that did not change
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {quote_identifier(TABLE_NAME + '_ingest')} "
+                 f"({KEY_COLUMN} TEXT PRIMARY KEY, row_hash TEXT NOT NULL) WITHOUT ROWID")
+    conn.execute("CREATE TABLE IF NOT EXISTS ingest_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+
+def create_indexes(conn, header):
+    for column in INDEXED_COLUMNS:
+        if column in header:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier('idx_' + TABLE_NAME + '_' + column)} "
+                         f"ON {quote_identifier(TABLE_NAME)} ({quote_identifier(column)})")
+
+
+def bump_data_version(conn, source):
+    current = conn.execute("SELECT value FROM ingest_meta WHERE key = 'data_version'").fetchone()
+    version = int(current[0]) + 1 if current else 1
+    conn.executemany(
+        "INSERT INTO ingest_meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        [("data_version", str(version)), ("ingested_at", str(time.time())), ("source", source)]
+    )
+    return version
+
+
+def ingest(csv_path=DEFAULT_CSV_PATH, db_path=DEFAULT_DB_PATH, chunk_rows=CHUNK_ROWS,
+           rebuild=False, prune=False, encoding="utf-8-sig"):
+    """Stream ``csv_path`` into ``medical_info`` and return ingest statistics."""
+    started = time.perf_counter()
+    stats = {"read": 0, "inserted_or_updated": 0, "unchanged": 0, "pruned": 0}
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+
+        with open(csv_path, newline="", encoding=encoding, errors="replace") as f:
+            reader = csv.reader(f)
+            header = [column.strip() for column in next(reader)]
+            if KEY_COLUMN not in header:
+                raise ValueError(f"CSV has no {KEY_COLUMN} column")
+            key_index = header.index(KEY_COLUMN)
+
+            chunks = read_chunks(reader, chunk_rows)
+            first_chunk = next(chunks, [])
+            types = infer_column_types(header, first_chunk)
+
+            with conn:
+                prepare_schema(conn, header, types, rebuild)
+                if prune:
+                    conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen_ids (id TEXT PRIMARY KEY) WITHOUT ROWID")
+                    conn.execute("DELETE FROM seen_ids")
+            # An existing table keeps its declared types; values are converted to match them
+            declared = table_columns(conn, TABLE_NAME)
+            types.update({column: declared[column].upper() for column in header
+                          if declared[column].upper() in _TYPE_RANK})
+            convert = make_row_converter(header, types)
+
+            columns = ", ".join(quote_identifier(column) for column in header)
+            placeholders = ", ".join("?" for _ in header)
+            updates = ", ".join(f"{quote_identifier(column)} = excluded.{quote_identifier(column)}"
+                                for column in header if column != KEY_COLUMN)
+            upsert_sql = (f"INSERT INTO {quote_identifier(TABLE_NAME)} ({columns}) VALUES ({placeholders}) "
+                          f"ON CONFLICT({quote_identifier(KEY_COLUMN)}) DO UPDATE SET {updates}")
+            fingerprint_sql = (f"INSERT INTO {quote_identifier(TABLE_NAME + '_ingest')} ({KEY_COLUMN}, row_hash) "
+                               f"VALUES (?, ?) ON CONFLICT({KEY_COLUMN}) DO UPDATE SET row_hash = excluded.row_hash")
+
+            def process(chunk):
+                nonlocal convert
+                widened = widen_column_types(header, types, chunk)
+                if widened:
+                    logger.warning("Widening %s after row %d: later rows do not fit the inferred types",
+                                   ", ".join(f"{column} to {kind}" for column, kind in widened.items()),
+                                   stats["read"])
+                    with conn:
+                        widen_table(conn, widened)
+                    types.update(widened)
+                    stats.setdefault("widened", {}).update(widened)
+                    convert = make_row_converter(header, types)
+
+                rows = {}
+                for raw in chunk:
+                    values = convert(raw)
+                    if values[key_index] is None:
+                        continue
+                    values[key_index] = str(values[key_index])
+                    rows[values[key_index]] = values
+                stats["read"] += len(chunk)
+
+                keys = list(rows)
+                known = {}
+                for start in range(0, len(keys), 500):
+                    batch = keys[start:start + 500]
+                    known.update(conn.execute(
+                        f"SELECT {KEY_COLUMN}, row_hash FROM {quote_identifier(TABLE_NAME + '_ingest')} "
+                        f"WHERE {KEY_COLUMN} IN ({', '.join('?' for _ in batch)})", batch
+                    ).fetchall())
+
+                changed, fingerprints = [], []
+                for key, values in rows.items():
+                    digest = row_hash(values)
+                    if known.get(key) == digest:
+                        stats["unchanged"] += 1
+                        continue
+                    changed.append(values)
+                    fingerprints.append((key, digest))
+
+                # One transaction per chunk keeps commits cheap and the WAL bounded
+                with conn:
+                    conn.executemany(upsert_sql, changed)
+                    conn.executemany(fingerprint_sql, fingerprints)
+                    if prune:
+                        conn.executemany("INSERT OR IGNORE INTO seen_ids (id) VALUES (?)", [(k,) for k in keys])
+                stats["inserted_or_updated"] += len(changed)
+
+            if first_chunk:
+                process(first_chunk)
+            for chunk in chunks:
+                process(chunk)
+
+        with conn:
+            if prune:
+                cursor = conn.execute(f"DELETE FROM {quote_identifier(TABLE_NAME)} "
+                                      f"WHERE {quote_identifier(KEY_COLUMN)} NOT IN (SELECT id FROM seen_ids)")
+                stats["pruned"] = cursor.rowcount
+                conn.execute(f"DELETE FROM {quote_identifier(TABLE_NAME + '_ingest')} "
+                             f"WHERE {KEY_COLUMN} NOT IN (SELECT id FROM seen_ids)")
+            create_indexes(conn, header)
+            if stats["inserted_or_updated"] or stats["pruned"] or rebuild or stats.get("widened"):
+                stats["data_version"] = bump_data_version(conn, csv_path)
+        # Aggregate tables are only valid for the data version they were built from
+        if not cube_is_current(conn):
+            stats["cube_seconds"] = build_cube(conn)["seconds"]
+        conn.execute("PRAGMA optimize")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"Load the survey CSV into the {TABLE_NAME} table")
+    parser.add_argument("csv_path", nargs="?", default=DEFAULT_CSV_PATH)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite database file")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per transaction")
+    parser.add_argument("--rebuild", action="store_true", help="drop and recreate the table first")
+    parser.add_argument("--prune", action="store_true", help="delete rows whose CASE_ID is not in the CSV")
+    parser.add_argument("--encoding", default="utf-8-sig")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(message)s")
+    stats = ingest(args.csv_path, args.db, chunk_rows=args.chunk_rows, rebuild=args.rebuild,
+                   prune=args.prune, encoding=args.encoding)
+    print(", ".join(f"{key}={value}" for key, value in stats.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import httpx
+import requests
+from openai import OpenAI
+from requests.adapters import HTTPAdapter
+
+from request_metrics import metrics, span
+
+logger = logging.getLogger(__name__)
+
+# Point both the SDK and raw calls at the real API or at openai_stub.py
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+
+# Seconds to open a connection, and to wait for a response once connected
+CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+READ_TIMEOUT = float(os.getenv('OPENAI_READ_TIMEOUT', '60'))
+
+# Retries after the first attempt on 429/5xx and connection errors
+MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '3'))
+
+# Backoff before retry n is uniform in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)]
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# Keep-alive connections held open to the API
+POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', '20'))
+
+# Consecutive failed attempts that open the breaker, and how long it stays open
+BREAKER_THRESHOLD = int(os.getenv('OPENAI_BREAKER_THRESHOLD', '5'))
+BREAKER_COOLDOWN = float(os.getenv('OPENAI_BREAKER_COOLDOWN', '30'))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Latency samples kept per call label for the percentiles
+LATENCY_SAMPLES = 1000
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated upstream failures, then lets a single
+    trial call through once the cooldown has passed."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_running:
+                return False
+            self._trial_running = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def release(self):
+        """End a call that says nothing about upstream (a local client error):
+        the state stays as it was, and a half-open breaker may try again."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_running:
+                    logger.warning("OpenAI circuit breaker opened after %d failures", self._failures)
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class CallStats:
+    """Per-label call counts, latency percentiles and token usage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels = {}
+
+    def record(self, label, seconds, ok, retries=0, usage=None):
+        with self._lock:
+            entry = self._labels.setdefault(label, {
+                "calls": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latencies": deque(maxlen=LATENCY_SAMPLES),
+            })
+            entry["calls"] += 1
+            entry["errors"] += 0 if ok else 1
+            entry["retries"] += retries
+            entry["latencies"].append(seconds)
+            if usage:
+                entry["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                entry["completion_tokens"] += usage.get("completion_tokens") or 0
+
+    def reset(self):
+        with self._lock:
+            self._labels = {}
+
+    def summary(self):
+        with self._lock:
+            summary = {}
+            for label, entry in self._labels.items():
+                latencies = sorted(entry["latencies"])
+
+                def percentile(p):
+                    return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+                summary[label] = {key: value for key, value in entry.items() if key != "latencies"}
+                summary[label].update({"p50_ms": percentile(0.5), "p95_ms": percentile(0.95),
+                                       "p99_ms": percentile(0.99)} if latencies else {})
+            return summary
+
+
+class _BreakerTransport(httpx.HTTPTransport):
+    """httpx transport for the SDK client that shares the breaker and stats."""
+
+    def __init__(self, breaker, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.breaker = breaker
+        self.stats = stats
+
+    def handle_request(self, request):
+        label = "sdk " + request.url.path.split("/v1/", 1)[-1].split("/", 1)[0]
+        if not self.breaker.allow():
+            # The SDK retries any exception raised here, so an open breaker
+            # answers 503 with x-should-retry: false instead; that surfaces
+            # at once as openai.InternalServerError
+            self.stats.record(label, 0.0, ok=False)
+            return httpx.Response(503, headers={"x-should-retry": "false"}, request=request,
+                                  json={"error": {"message": "OpenAI circuit breaker is open; upstream is failing",
+                                                  "type": "circuit_open"}})
+        started = time.perf_counter()
+        try:
+            response = super().handle_request(request)
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            self.stats.record(label, time.perf_counter() - started, ok=False)
+            raise
+        ok = response.status_code not in RETRY_STATUSES
+        if ok:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+        self.stats.record(label, time.perf_counter() - started, ok=ok)
+        return response
+
+
+class OpenAIClient:
+    """One connection-pooled client for the raw chat completions calls and
+    the SDK (files, assistants, threads), with retries, a circuit breaker and
+    latency/token reporting shared between them."""
+
+    def __init__(self, api_key=None, base_url=OPENAI_BASE_URL, connect_timeout=CONNECT_TIMEOUT,
+                 read_timeout=READ_TIMEOUT, max_retries=MAX_RETRIES, pool_size=POOL_SIZE, breaker=None):
+        self.api_key = api_key or os.getenv('OPENAI_API_KEY')
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = CallStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"})
+
+        # The SDK does its own jittered backoff (honouring Retry-After) on 429/5xx
+        transport = _BreakerTransport(self.breaker, self.stats,
+                                      limits=httpx.Limits(max_connections=pool_size,
+                                                          max_keepalive_connections=pool_size))
+        self.sdk = OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=max_retries,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            http_client=httpx.Client(transport=transport),
+        )
+        # Created on first async call; bound to the event loop that made it
+        self._async_http = None
+        self._async_loop = None
+
+    def _backoff(self, attempt, response=None):
+        delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(BACKOFF_MAX, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def post(self, path, payload, label=None):
+        """POST ``payload`` to ``path`` with retries and return the decoded
+        JSON. Raises requests exceptions like a plain ``requests.post``."""
+        label = label or path.strip("/")
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.stats.record(label, time.perf_counter() - started, ok=False, retries=attempt)
+                raise CircuitOpenError("OpenAI circuit breaker is open; upstream is failing")
+            response, error = None, None
+            try:
+                response = self.session.post(self.base_url + path, json=payload, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+            except requests.exceptions.RequestException:
+                # Not an upstream failure (bad URL, payload...), so not worth retrying,
+                # and no sign either way of whether upstream has recovered
+                self.breaker.release()
+                self.stats.record(label, time.perf_counter() - started, ok=False, retries=attempt)
+                raise
+
+            if error is None and response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                break
+            self.breaker.record_failure()
+            if attempt >= self.max_retries:
+                break
+            delay = self._backoff(attempt, response)
+            logger.info("OpenAI %s attempt %d failed (%s); retrying in %.2fs", label, attempt + 1,
+                        error or response.status_code, delay)
+            time.sleep(delay)
+            attempt += 1
+
+        seconds = time.perf_counter() - started
+        if error is not None:
+            self.stats.record(label, seconds, ok=False, retries=attempt)
+            raise error
+        try:
+            response.raise_for_status()
+        except requests.exceptions.HTTPError:
+            self.stats.record(label, seconds, ok=False, retries=attempt)
+            raise
+        return self._record_success(label, seconds, attempt, response.json())
+
+    def _record_success(self, label, seconds, attempt, body):
+        usage = body.get("usage") or {}
+        self.stats.record(label, seconds, ok=True, retries=attempt, usage=usage)
+        logger.info("OpenAI %s: %.0f ms, %d retries, %s prompt + %s completion tokens", label, seconds * 1000,
+                    attempt, usage.get("prompt_tokens", "?"), usage.get("completion_tokens", "?"))
+        return body
+
+    def chat_completion(self, payload, label="chat"):
+        with span("llm_call", label=label) as record:
+            return _count_tokens(record, self.post("/chat/completions", payload, label=label))
+
+    def _async_client(self):
+        loop = asyncio.get_running_loop()
+        if self._async_http is None or self._async_loop is not loop:
+            self._async_http = httpx.AsyncClient(
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            )
+            self._async_loop = loop
+        return self._async_http
+
+    async def apost(self, path, payload, label=None):
+        """Awaitable :meth:`post` for the ASGI app. Same retries, breaker and
+        stats, but failures surface as httpx errors (or CircuitOpenError)."""
+        label = label or path.strip("/")
+        http = self._async_client()
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.stats.record(label, time.perf_counter() - started, ok=False, retries=attempt)
+                raise CircuitOpenError("OpenAI circuit breaker is open; upstream is failing")
+            response, error = None, None
+            try:
+                response = await http.post(self.base_url + path, json=payload)
+            except httpx.TransportError as e:
+                error = e
+            except httpx.RequestError:
+                self.breaker.release()
+                self.stats.record(label, time.perf_counter() - started, ok=False, retries=attempt)
+                raise
+
+            if error is None and response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                break
+            self.breaker.record_failure()
+            if attempt >= self.max_retries:
+                break
+            delay = self._backoff(attempt, response)
+            logger.info("OpenAI %s attempt %d failed (%s); retrying in %.2fs", label, attempt + 1,
+                        error or response.status_code, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        seconds = time.perf_counter() - started
+        if error is not None:
+            self.stats.record(label, seconds, ok=False, retries=attempt)
+            raise error
+        if response.is_error:
+            self.stats.record(label, seconds, ok=False, retries=attempt)
+            response.raise_for_status()
+        return self._record_success(label, seconds, attempt, response.json())
+
+    async def achat_completion(self, payload, label="chat"):
+        with span("llm_call", label=label) as record:
+            return _count_tokens(record, await self.apost("/chat/completions", payload, label=label))
+
+    async def aclose(self):
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    def summary(self):
+        return {"breaker": self.breaker.state, "calls": self.stats.summary()}
+
+
+# Put a completion's token usage on its llm_call span and the token counters
+def _count_tokens(record, body):
+    usage = body.get("usage") or {}
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind) is not None:
+            record[kind] = usage[kind]
+            metrics.inc("llm_tokens_total", usage[kind], "Tokens used by chat completions",
+                        label=record["label"], kind=kind.split("_")[0])
+    return body
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+# The process-wide client both entry points use
+def shared_client():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = OpenAIClient()
+        return _shared
@@ -0,0 +1,408 @@
+# Local stand-in for the parts of the OpenAI API this project uses, so the
+# registry, the request paths and openai_client.py can be exercised offline.
+#
+#   python openai_stub.py --port 8099
+#   OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub python text_n_graph1.py
+
+import argparse
+import itertools
+import json
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.files = {}
+        self.assistants = {}
+        self.threads = {}
+        self.runs = {}
+        self.calls = []
+        # Simulated Code Interpreter run time, in seconds
+        self.run_seconds = 0.2
+        # Simulated chat completion latency, and the share of calls answered
+        # with a 503/429 so retries and the circuit breaker can be exercised
+        self.chat_seconds = 0.0
+        self.failure_rate = 0.0
+        self.failure_statuses = (503, 429)
+        # Substring of the question -> reply content; see chat_reply()
+        self.chat_replies = {}
+
+    def new_id(self, prefix):
+        return f"{prefix}-stub{next(self.ids)}"
+
+    def record(self, method, path):
+        with self.lock:
+            self.calls.append((method, path))
+
+
+# A tiny valid PNG so chart paths have something to save
+def _placeholder_png(width=4, height=4):
+    def chunk(kind, data):
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+    raw = b"".join(b"\x00" + b"\x80\x80\x80" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw))
+            + chunk(b"IEND", b""))
+
+
+CHART_WORDS = ("plot", "visual", "graph", "draw", "chart")
+
+
+# Canned reply for a chat completion: a configured reply when the prompt
+# contains one of state.chat_replies' keys, else a fixed count query (or an
+# unsupported chart spec when JSON is asked for)
+def chat_reply(state, payload):
+    prompt = " ".join(str(message.get("content", "")) for message in payload.get("messages", []))
+    for needle, reply in state.chat_replies.items():
+        if needle.lower() in prompt.lower():
+            return reply if isinstance(reply, str) else json.dumps(reply)
+    if (payload.get("response_format") or {}).get("type") == "json_object":
+        return json.dumps({"supported": False})
+    return "SELECT COUNT(*) FROM medical_info"
+
+
+def _parse_multipart(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    fields, upload = {}, None
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if part.get_filename():
+            upload = (part.get_filename(), part.get_payload(decode=True))
+        else:
+            fields[name] = part.get_content().strip()
+    return fields, upload
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so pooled clients reuse their connections as with the real API
+    protocol_version = "HTTP/1.1"
+    state = None
+    routes = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, kind, object_id):
+        self._send_json(404, {"error": {
+            "message": f"No {kind} found with id '{object_id}'.",
+            "type": "invalid_request_error",
+            "code": None,
+        }})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/v1/"):
+            path = path[3:]
+        self.state.record(method, path)
+        for route_method, pattern, handler in self.routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                return handler(self, *match.groups())
+        self._send_json(404, {"error": {"message": f"Unknown route {method} {path}"}})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    # ---- files -----------------------------------------------------------
+
+    def create_file(self):
+        fields, upload = _parse_multipart(self.headers["Content-Type"], self._read_body())
+        filename, content = upload
+        file_id = self.state.new_id("file")
+        record = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": fields.get("purpose", "assistants"),
+            "status": "processed",
+        }
+        with self.state.lock:
+            self.state.files[file_id] = (record, content)
+        self._send_json(200, record)
+
+    def retrieve_file(self, file_id):
+        entry = self.state.files.get(file_id)
+        if entry is None:
+            return self._not_found("file", file_id)
+        self._send_json(200, entry[0])
+
+    def file_content(self, file_id):
+        entry = self.state.files.get(file_id)
+        if entry is None:
+            return self._not_found("file", file_id)
+        content = entry[1]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def delete_file(self, file_id):
+        with self.state.lock:
+            entry = self.state.files.pop(file_id, None)
+        if entry is None:
+            return self._not_found("file", file_id)
+        self._send_json(200, {"id": file_id, "object": "file", "deleted": True})
+
+    # ---- assistants ------------------------------------------------------
+
+    def create_assistant(self):
+        payload = json.loads(self._read_body() or b"{}")
+        assistant_id = self.state.new_id("asst")
+        record = {
+            "id": assistant_id,
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "name": payload.get("name"),
+            "description": None,
+            "model": payload.get("model"),
+            "instructions": payload.get("instructions"),
+            "tools": payload.get("tools", []),
+            "tool_resources": payload.get("tool_resources", {}),
+            "metadata": {},
+        }
+        with self.state.lock:
+            self.state.assistants[assistant_id] = record
+        self._send_json(200, record)
+
+    def retrieve_assistant(self, assistant_id):
+        record = self.state.assistants.get(assistant_id)
+        if record is None:
+            return self._not_found("assistant", assistant_id)
+        self._send_json(200, record)
+
+    def delete_assistant(self, assistant_id):
+        with self.state.lock:
+            record = self.state.assistants.pop(assistant_id, None)
+        if record is None:
+            return self._not_found("assistant", assistant_id)
+        self._send_json(200, {"id": assistant_id, "object": "assistant.deleted", "deleted": True})
+
+    # ---- chat completions ------------------------------------------------
+
+    def chat_completion(self):
+        payload = json.loads(self._read_body() or b"{}")
+        if self.state.chat_seconds:
+            time.sleep(self.state.chat_seconds)
+        if self.state.failure_rate and random.random() < self.state.failure_rate:
+            status = random.choice(self.state.failure_statuses)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Retry-After", "0")
+            body = json.dumps({"error": {"message": "Stub failure", "type": "server_error"}}).encode("utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        content = chat_reply(self.state, payload)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in payload.get("messages", [])) // 4
+        self._send_json(200, {
+            "id": self.state.new_id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        })
+
+    # ---- threads, messages and runs --------------------------------------
+
+    def _message(self, thread_id, role, content):
+        return {
+            "id": self.state.new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": content,
+            "assistant_id": None,
+            "run_id": None,
+            "attachments": [],
+            "metadata": {},
+        }
+
+    def create_thread(self):
+        self._read_body()
+        thread_id = self.state.new_id("thread")
+        with self.state.lock:
+            self.state.threads[thread_id] = []
+        self._send_json(200, {"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+
+    def create_message(self, thread_id):
+        payload = json.loads(self._read_body() or b"{}")
+        if thread_id not in self.state.threads:
+            return self._not_found("thread", thread_id)
+        message = self._message(thread_id, payload.get("role", "user"),
+                                [{"type": "text", "text": {"value": payload.get("content", ""), "annotations": []}}])
+        with self.state.lock:
+            self.state.threads[thread_id].append(message)
+        self._send_json(200, message)
+
+    def list_messages(self, thread_id):
+        if thread_id not in self.state.threads:
+            return self._not_found("thread", thread_id)
+        data = list(reversed(self.state.threads[thread_id]))
+        self._send_json(200, {"object": "list", "data": data, "first_id": None, "last_id": None, "has_more": False})
+
+    def _run_record(self, run_id):
+        run = self.state.runs[run_id]
+        if run["status"] != "completed" and time.time() - run["created_at"] >= self.state.run_seconds:
+            self._complete_run(run)
+        return run
+
+    def _complete_run(self, run):
+        thread = self.state.threads[run["thread_id"]]
+        question = thread[-1]["content"][0]["text"]["value"] if thread else ""
+        if any(word in question.lower() for word in CHART_WORDS):
+            file_id = self.state.new_id("file")
+            with self.state.lock:
+                self.state.files[file_id] = ({"id": file_id, "object": "file", "bytes": 0,
+                                              "created_at": int(time.time()), "filename": "chart.png",
+                                              "purpose": "assistants_output", "status": "processed"},
+                                             _placeholder_png())
+            content = [{"type": "image_file", "image_file": {"file_id": file_id}}]
+        else:
+            content = [{"type": "text", "text": {"value": f"Stub answer to: {question}", "annotations": []}}]
+        message = self._message(run["thread_id"], "assistant", content)
+        message["assistant_id"] = run["assistant_id"]
+        message["run_id"] = run["id"]
+        with self.state.lock:
+            thread.append(message)
+            run["status"] = "completed"
+            run["completed_at"] = int(time.time())
+
+    def create_run(self, thread_id):
+        payload = json.loads(self._read_body() or b"{}")
+        if thread_id not in self.state.threads:
+            return self._not_found("thread", thread_id)
+        run_id = self.state.new_id("run")
+        run = {
+            "id": run_id,
+            "object": "thread.run",
+            "created_at": time.time(),
+            "thread_id": thread_id,
+            "assistant_id": payload.get("assistant_id"),
+            "status": "queued",
+            "model": "gpt-4o",
+            "instructions": "",
+            "tools": [],
+            "last_error": None,
+            "completed_at": None,
+            "parallel_tool_calls": True,
+        }
+        with self.state.lock:
+            self.state.runs[run_id] = run
+        if not payload.get("stream"):
+            return self._send_json(200, run)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for status in ("queued", "in_progress"):
+            run["status"] = status
+            self._send_event(f"thread.run.{status}", run)
+        time.sleep(self.state.run_seconds)
+        self._complete_run(run)
+        self._send_event("thread.run.completed", run)
+        self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+        self.close_connection = True
+
+    def _send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def retrieve_run(self, thread_id, run_id):
+        if run_id not in self.state.runs:
+            return self._not_found("run", run_id)
+        self._send_json(200, self._run_record(run_id))
+
+    def cancel_run(self, thread_id, run_id):
+        if run_id not in self.state.runs:
+            return self._not_found("run", run_id)
+        run = self.state.runs[run_id]
+        run["status"] = "cancelled"
+        self._send_json(200, run)
+
+
+StubHandler.routes = [
+    ("POST", r"/files", StubHandler.create_file),
+    ("GET", r"/files/([^/]+)", StubHandler.retrieve_file),
+    ("GET", r"/files/([^/]+)/content", StubHandler.file_content),
+    ("DELETE", r"/files/([^/]+)", StubHandler.delete_file),
+    ("POST", r"/assistants", StubHandler.create_assistant),
+    ("GET", r"/assistants/([^/]+)", StubHandler.retrieve_assistant),
+    ("DELETE", r"/assistants/([^/]+)", StubHandler.delete_assistant),
+    ("POST", r"/chat/completions", StubHandler.chat_completion),
+    ("POST", r"/threads", StubHandler.create_thread),
+    ("POST", r"/threads/([^/]+)/messages", StubHandler.create_message),
+    ("GET", r"/threads/([^/]+)/messages", StubHandler.list_messages),
+    ("POST", r"/threads/([^/]+)/runs", StubHandler.create_run),
+    ("GET", r"/threads/([^/]+)/runs/([^/]+)", StubHandler.retrieve_run),
+    ("POST", r"/threads/([^/]+)/runs/([^/]+)/cancel", StubHandler.cancel_run),
+]
+
+
+# Start the stub on a background thread; returns (server, state, base_url)
+def start_stub_server(host="127.0.0.1", port=0):
+    state = StubState()
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, state, base_url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline stub of the OpenAI API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--chat-seconds", type=float, default=0.0, help="simulated chat completion latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of chat calls failing with 503/429")
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(args.host, args.port)
+    state.chat_seconds = args.chat_seconds
+    state.failure_rate = args.failure_rate
+    print(f"OpenAI stub listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
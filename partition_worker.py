@@ -0,0 +1,71 @@
+# Worker process for partitioned_db.FanOut.
+#
+#   python partition_worker.py      # started by partitioned_db.WorkerPool, not by hand
+#
+# Runs as a program of its own instead of through multiprocessing: spawn and
+# forkserver workers both re-import the parent's __main__, which for the web
+# apps means building the whole app again in every worker. This module only
+# needs sqlite3 and the query guardrails.
+#
+# Requests are pickled (path, sql, time_budget) tuples on stdin; each gets a
+# pickled ("ok", rows, steps) or ("error", exception, steps) reply on stdout,
+# steps being what the guardrails recorded. The worker exits when stdin closes.
+
+import os
+import pickle
+import sqlite3
+import sys
+from urllib.parse import quote
+
+from sql_guard import guarded_query
+
+# Connections opened by this worker, kept between requests
+_connections = {}
+
+
+def _connection(path):
+    identity = os.stat(path).st_ino
+    cached = _connections.get(path)
+    if cached and cached[0] == identity:
+        return cached[1]
+    if cached:
+        cached[1].close()
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+    conn.execute("PRAGMA query_only=ON")
+    _connections[path] = (identity, conn)
+    return conn
+
+
+def partition_rows(path, sql, time_budget, steps):
+    """Run ``sql`` on one partition file under the usual guardrails."""
+    cursor = _connection(path).cursor()
+    try:
+        with guarded_query(cursor, sql, steps=steps, time_budget=time_budget, slow_query_seconds=None):
+            cursor.execute(sql)
+            return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def main():
+    requests, replies = sys.stdin.buffer, sys.stdout.buffer
+    while True:
+        try:
+            path, sql, time_budget = pickle.load(requests)
+        except EOFError:
+            return 0
+        steps = []
+        try:
+            reply = ("ok", partition_rows(path, sql, time_budget, steps), steps)
+        except Exception as e:
+            reply = ("error", e, steps)
+        try:
+            data = pickle.dumps(reply)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            data = pickle.dumps(("error", RuntimeError(f"{type(reply[1]).__name__}: {reply[1]}"), steps))
+        replies.write(data)
+        replies.flush()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,456 @@
+# One table split across several SQLite files.
+#
+#   python partitioned_db.py medical.db --by AHRI_REGION --out "partitions/medical_{value}.db"
+#
+# A partitioned dataset (see dataset_catalog.py) keeps the rows of its table in
+# several files: one per region, per survey wave, or per slice of a cohort too
+# large for one file. PartitionedPool ATTACHes every file to each pooled
+# connection behind a TEMP VIEW named like the table, so any generated SQL runs
+# unchanged. FanOut sends COUNT/SUM/AVG/MIN/MAX queries (with or without
+# GROUP BY) to all files at once on a pool of worker processes
+# (partition_worker.py) and merges the partial aggregates, so those queries
+# scale with the number of cores, not rows.
+
+import argparse
+import atexit
+import os
+import pickle
+import queue
+import re
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote
+
+from aggregate_cube import build_cube, quote_identifier, split_top_level
+from db_pool import ReadOnlyConnectionPool
+from sql_guard import QUERY_TIME_BUDGET
+
+TABLE_NAME = "medical_info"
+
+# Processes running partition queries, shared by every partitioned dataset
+PARTITION_WORKERS = int(os.getenv('PARTITION_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+# Below this many bytes in total, one connection reading the combined view
+# beats shipping partial results between processes
+FANOUT_MIN_BYTES = int(os.getenv('FANOUT_MIN_BYTES', str(64 * 1024 * 1024)))
+
+_AGGREGATES = ("COUNT", "SUM", "AVG", "MIN", "MAX", "TOTAL")
+
+_QUERY = re.compile(
+    r"^SELECT\s+(?P<select>.+?)\s+FROM\s+\"?(?P<table>\w+)\"?"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\d+)(?:\s+OFFSET\s+(?P<offset>\d+))?)?$",
+    re.IGNORECASE | re.DOTALL
+)
+_ALIAS = re.compile(r"^(?P<expr>.+?)\s+AS\s+(?P<q>[\"'`]?)(?P<alias>[^\"'`]+)(?P=q)$", re.IGNORECASE | re.DOTALL)
+# "COUNT(*) n": an alias without AS, unless the last word belongs to the expression
+_BARE_ALIAS = re.compile(r"^(?P<expr>.+?[\w)\"'`\]])\s+(?:\"(?P<quoted>[^\"]+)\"|(?P<alias>[A-Za-z_]\w*))$", re.DOTALL)
+_KEYWORDS = {"AND", "AS", "ASC", "BETWEEN", "CASE", "COLLATE", "DESC", "ELSE", "END", "ESCAPE", "FALSE", "GLOB", "IN",
+             "IS", "ISNULL", "LIKE", "NOT", "NOTNULL", "NULL", "OR", "REGEXP", "THEN", "TRUE", "WHEN"}
+_AGGREGATE_CALL = re.compile(r"\b(?P<name>" + "|".join(_AGGREGATES) + r")\s*\(", re.IGNORECASE)
+_ORDER_ITEM = re.compile(r"^(?P<expr>.+?)(?P<direction>\s+(?:ASC|DESC))?(?P<nulls>\s+NULLS\s+(?:FIRST|LAST))?$",
+                         re.IGNORECASE | re.DOTALL)
+_UNSUPPORTED = re.compile(r"\b(JOIN|DISTINCT|HAVING|UNION|INTERSECT|EXCEPT|OVER|GROUP_CONCAT|STRING_AGG|"
+                          r"JSON_GROUP_ARRAY|JSON_GROUP_OBJECT|RANDOM)\b|\(\s*SELECT", re.IGNORECASE)
+
+
+def _same(a, b):
+    return " ".join(a.replace('"', "").split()).upper() == " ".join(b.replace('"', "").split()).upper()
+
+
+class PartitionedPool(ReadOnlyConnectionPool):
+    """A ReadOnlyConnectionPool over a table split across ``paths``. Each
+    connection ATTACHes every file and reads the table through a TEMP VIEW
+    (UNION ALL of the parts; columns missing from a part read as NULL)."""
+
+    def __init__(self, paths, table=TABLE_NAME, **kwargs):
+        if not paths:
+            raise ValueError("A partitioned dataset needs at least one file")
+        probe = sqlite3.connect(":memory:")
+        try:
+            limit = probe.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(probe, "getlimit") else 10
+        finally:
+            probe.close()
+        if len(paths) > limit:
+            raise ValueError(f"SQLite can attach at most {limit} partitions, got {len(paths)}")
+        super().__init__(paths[0], **kwargs)
+        self.paths = list(paths)
+        self.table = table
+
+    def database_paths(self):
+        return list(self.paths)
+
+    def _open(self):
+        conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA temp_store=MEMORY")
+        columns, parts = [], []
+        for index, path in enumerate(self.paths):
+            schema = f"p{index}"
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (f"file:{quote(os.path.abspath(path))}?mode=ro",))
+            conn.execute(f"PRAGMA {schema}.mmap_size={int(self.mmap_size)}")
+            # The page cache budget is shared between the parts
+            conn.execute(f"PRAGMA {schema}.cache_size={-max(1024, int(self.cache_size_kib) // len(self.paths))}")
+            names = [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({quote_identifier(self.table)})")]
+            if not names:
+                raise sqlite3.OperationalError(f"no such table: {self.table} in {path}")
+            columns += [name for name in names if name not in columns]
+            parts.append((schema, set(names)))
+
+        selects = []
+        for schema, names in parts:
+            items = ", ".join(quote_identifier(column) if column in names else f"NULL AS {quote_identifier(column)}"
+                              for column in columns)
+            selects.append(f"SELECT {items} FROM {schema}.{quote_identifier(self.table)}")
+        conn.execute(f"CREATE TEMP VIEW {quote_identifier(self.table)} AS " + " UNION ALL ".join(selects))
+        conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def table_exists(self, table_name):
+        # Only the combined table is visible: each file's aggregate tables describe that file alone
+        return table_name == self.table and all(os.path.exists(path) for path in self.paths)
+
+    def data_version(self):
+        """The ingest data_version of every part, joined (``"3+1+2"``)."""
+        signature = self._signature()
+        cached = self._table_cache.get("ingest_meta:data_version")
+        if cached and cached[0] == signature:
+            return cached[1]
+        versions = []
+        with self.cursor() as cursor:
+            for index, path in enumerate(self.paths):
+                try:
+                    cursor.execute(f"SELECT value FROM p{index}.ingest_meta WHERE key = 'data_version'")
+                    row = cursor.fetchone()
+                except sqlite3.OperationalError:
+                    row = None
+                if row:
+                    versions.append(str(row[0]))
+                else:
+                    stat = os.stat(path)
+                    versions.append(f"sig-{stat.st_ino}-{stat.st_size}-{stat.st_mtime_ns}")
+        version = "+".join(versions)
+        self._remember("ingest_meta:data_version", signature, version)
+        return version
+
+    def total_bytes(self):
+        return sum(os.path.getsize(path) for path in self.paths if os.path.exists(path))
+
+
+# ---- fan-out --------------------------------------------------------------
+
+def _partial_terms(name, argument):
+    """Per-partition expressions for one aggregate call, and how to merge them."""
+    name = name.upper()
+    if name == "AVG":
+        return [f"SUM({argument})", f"COUNT({argument})"], "(SUM({0}) * 1.0 / NULLIF(SUM({1}), 0))"
+    if name == "COUNT":
+        return [f"COUNT({argument})"], "COALESCE(SUM({0}), 0)"
+    if name == "SUM":
+        return [f"SUM({argument})"], "SUM({0})"
+    return [f"{name}({argument})"], name + "({0})"
+
+
+def _replace_aggregates(expression, partials):
+    """Rewrite every aggregate call in ``expression`` into its merge over
+    partial columns, appending the per-partition terms to ``partials``."""
+    output, position = [], 0
+    for match in _AGGREGATE_CALL.finditer(expression):
+        if match.start() < position:
+            continue
+        depth, end = 1, match.end()
+        while end < len(expression) and depth:
+            depth += {"(": 1, ")": -1}.get(expression[end], 0)
+            end += 1
+        if depth:
+            return None
+        argument = expression[match.end():end - 1].strip()
+        if _AGGREGATE_CALL.search(argument):
+            return None
+        terms, merge = _partial_terms(match.group("name"), argument)
+        names = []
+        for term in terms:
+            names.append(f"a{len(partials)}")
+            partials.append(term)
+        output.append(expression[position:match.start()] + merge.format(*names))
+        position = end
+    if not output:
+        return expression
+    return "".join(output) + expression[position:]
+
+
+def plan_fanout(sql, table=TABLE_NAME):
+    """Split an aggregate query into ``{"partial": per-partition SQL, "final":
+    SQL merging the partials, ...}``, or None when it doesn't decompose."""
+    sql = sql.strip().rstrip(";").strip()
+    if _UNSUPPORTED.search(sql):
+        return None
+    match = _QUERY.match(sql)
+    if not match or match.group("table").lower() != table.lower():
+        return None
+
+    items = []
+    for item in split_top_level(match.group("select")):
+        aliased = _ALIAS.match(item)
+        if aliased:
+            items.append((aliased.group("expr").strip(), aliased.group("alias")))
+            continue
+        bare = _BARE_ALIAS.match(item)
+        if bare:
+            alias = bare.group("quoted") or bare.group("alias")
+            last_word = re.split(r"[\s(]", bare.group("expr"))[-1].upper()
+            if bare.group("quoted") or (alias.upper() not in _KEYWORDS and last_word not in _KEYWORDS):
+                items.append((bare.group("expr").strip(), alias))
+                continue
+        items.append((item, item))
+
+    groups = []
+    for group in (split_top_level(match.group("group")) if match.group("group") else []):
+        # GROUP BY 1 and GROUP BY <alias> name a select item
+        if group.isdigit() and 0 < int(group) <= len(items):
+            group = items[int(group) - 1][0]
+        else:
+            group = next((expr for expr, name in items if _same(name, group) and expr != name), group)
+        if _AGGREGATE_CALL.search(group):
+            return None
+        groups.append(group)
+
+    partials, finals = [], []
+    for expr, name in items:
+        group_index = next((index for index, group in enumerate(groups) if _same(group, expr)), None)
+        if group_index is not None:
+            finals.append(f"g{group_index}")
+            continue
+        if not _AGGREGATE_CALL.search(expr):
+            return None
+        merged = _replace_aggregates(expr, partials)
+        if merged is None:
+            return None
+        finals.append(merged)
+    if not partials:
+        return None
+
+    order = []
+    for part in (split_top_level(match.group("order")) if match.group("order") else []):
+        order_match = _ORDER_ITEM.match(part)
+        expr, suffix = order_match.group("expr").strip(), (order_match.group("direction") or "") + \
+            (order_match.group("nulls") or "")
+        if expr.isdigit() and 0 < int(expr) <= len(items):
+            order.append(expr + suffix)
+            continue
+        position = next((index for index, (item_expr, name) in enumerate(items)
+                         if _same(item_expr, expr) or _same(name, expr)), None)
+        if position is None:
+            group_index = next((index for index, group in enumerate(groups) if _same(group, expr)), None)
+            if group_index is None:
+                return None
+            order.append(f"g{group_index}{suffix}")
+        else:
+            order.append(f"{position + 1}{suffix}")
+
+    partial_items = [f"{group} AS g{index}" for index, group in enumerate(groups)]
+    partial_items += [f"{term} AS a{index}" for index, term in enumerate(partials)]
+    partial = f"SELECT {', '.join(partial_items)} FROM {quote_identifier(table)}"
+    if match.group("where"):
+        partial += f" WHERE {match.group('where')}"
+    if groups:
+        partial += " GROUP BY " + ", ".join(groups)
+
+    final = "SELECT " + ", ".join(f"{expr} AS {quote_identifier(name)}" for expr, (_, name) in zip(finals, items))
+    final += " FROM partials"
+    if groups:
+        final += " GROUP BY " + ", ".join(f"g{index}" for index in range(len(groups)))
+    if order:
+        final += " ORDER BY " + ", ".join(order)
+    if match.group("limit"):
+        final += f" LIMIT {match.group('limit')}" + (f" OFFSET {match.group('offset')}" if match.group("offset") else "")
+    columns = [f"g{index}" for index in range(len(groups))] + [f"a{index}" for index in range(len(partials))]
+    return {"partial": partial, "final": final, "columns": columns}
+
+
+# The worker program; see partition_worker.py
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "partition_worker.py")
+
+
+class WorkerPool:
+    """Up to ``size`` partition_worker.py processes, started when first
+    needed and kept for later queries. Each runs one query at a time."""
+
+    def __init__(self, size=PARTITION_WORKERS):
+        self.size = size
+        self._threads = ThreadPoolExecutor(max_workers=size, thread_name_prefix="partition")
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._workers = set()
+
+    def _start(self):
+        worker = subprocess.Popen([sys.executable, WORKER_SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _stop(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+        try:
+            worker.stdin.close()
+        except OSError:
+            pass
+        try:
+            worker.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+            worker.wait()
+        worker.stdout.close()
+
+    def _run(self, path, sql, time_budget, steps):
+        try:
+            worker = self._idle.get_nowait()
+        except queue.Empty:
+            worker = self._start()
+        try:
+            pickle.dump((path, sql, time_budget), worker.stdin)
+            worker.stdin.flush()
+            status, value, worker_steps = pickle.load(worker.stdout)
+        except (OSError, EOFError, pickle.UnpicklingError) as e:
+            # The worker died (or was killed); the next query starts a fresh one
+            self._stop(worker)
+            raise RuntimeError(f"Partition worker exited while querying {path}") from e
+        self._idle.put(worker)
+        if steps is not None:
+            steps.extend(worker_steps)
+        if status == "error":
+            raise value
+        return value
+
+    def submit(self, path, sql, time_budget, steps=None):
+        """Run ``sql`` on the partition file ``path``; returns a Future of its
+        rows. What the guardrails record there is added to ``steps``."""
+        return self._threads.submit(self._run, path, sql, time_budget, steps)
+
+    def shutdown(self):
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            workers = list(self._workers)
+        for worker in workers:
+            self._stop(worker)
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def worker_pool():
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WorkerPool()
+            atexit.register(_worker_pool.shutdown)
+        return _worker_pool
+
+
+class FanOut:
+    """Answers decomposable aggregate queries on a PartitionedPool by running
+    them on every file in parallel and merging the partial results."""
+
+    def __init__(self, pool, min_bytes=FANOUT_MIN_BYTES):
+        self.pool = pool
+        self.min_bytes = min_bytes
+
+    def plan(self, sql):
+        # Workers read the files on their own connections, outside a batch's snapshot()
+        if self.pool.in_snapshot() or self.pool.total_bytes() < self.min_bytes:
+            return None
+        return plan_fanout(sql, self.pool.table)
+
+    def run(self, plan, time_budget=QUERY_TIME_BUDGET, steps=None):
+        """Return ``(column names, rows)`` for a plan made by :meth:`plan`.
+        What the guardrails record on the partitions (plan checks,
+        rejections, timeouts) is added to ``steps``, each message once."""
+        partition_steps = []
+        futures = [worker_pool().submit(path, plan["partial"], time_budget, partition_steps)
+                   for path in self.pool.paths]
+        wait(futures)
+        if steps is not None:
+            steps.extend(step for step in dict.fromkeys(partition_steps) if step not in steps)
+        partial_rows = [row for future in futures for row in future.result()]
+
+        merge = sqlite3.connect(":memory:")
+        try:
+            merge.execute(f"CREATE TABLE partials ({', '.join(plan['columns'])})")
+            merge.executemany(f"INSERT INTO partials VALUES ({', '.join('?' for _ in plan['columns'])})",
+                              partial_rows)
+            cursor = merge.execute(plan["final"])
+            return [column[0] for column in cursor.description], cursor.fetchall()
+        finally:
+            merge.close()
+
+
+# ---- splitting ------------------------------------------------------------
+
+def split_database(db_path, column, out_pattern, table=TABLE_NAME):
+    """Write the rows of ``table`` into one file per value of ``column``
+    (``out_pattern`` with ``{value}``), with the same schema, indexes and
+    ingest metadata, and aggregate tables built for each part."""
+    started = time.perf_counter()
+    source = sqlite3.connect(db_path)
+    try:
+        statements = [row[0] for row in source.execute(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL ORDER BY type DESC", (table,))]
+        values = [row[0] for row in source.execute(
+            f"SELECT DISTINCT {quote_identifier(column)} FROM {quote_identifier(table)}")]
+    finally:
+        source.close()
+
+    parts = []
+    for value in values:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", str(value if value is not None else "none")).strip("_").lower() or "none"
+        path = out_pattern.format(value=slug)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute("ATTACH DATABASE ? AS source", (db_path,))
+                predicate = f"{quote_identifier(column)} IS NULL" if value is None else f"{quote_identifier(column)} = ?"
+                conn.execute(f"INSERT INTO {quote_identifier(table)} SELECT * FROM source.{quote_identifier(table)} "
+                             f"WHERE {predicate}", () if value is None else (value,))
+                has_meta = conn.execute("SELECT 1 FROM source.sqlite_master WHERE name = 'ingest_meta'").fetchone()
+                if has_meta:
+                    conn.execute("CREATE TABLE ingest_meta AS SELECT * FROM source.ingest_meta")
+            conn.execute("DETACH DATABASE source")
+            rows = conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)}").fetchone()[0]
+            if has_meta:
+                build_cube(conn)
+            conn.execute("ANALYZE")
+        finally:
+            conn.close()
+        parts.append({"path": path, "value": value, "rows": rows})
+    return {"partitions": parts, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split a table into one SQLite file per column value")
+    parser.add_argument("db", help="SQLite database file to split")
+    parser.add_argument("--by", required=True, help="column whose values pick the file, e.g. AHRI_REGION")
+    parser.add_argument("--out", default="partitions/medical_{value}.db", help="output path with {value}")
+    parser.add_argument("--table", default=TABLE_NAME)
+    args = parser.parse_args(argv)
+    result = split_database(args.db, args.by, args.out, args.table)
+    for part in result["partitions"]:
+        print(f"{part['path']}: {part['rows']} rows ({args.by} = {part['value']})")
+    print(f"seconds={result['seconds']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
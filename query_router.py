@@ -0,0 +1,375 @@
+# Local routing for /usa-health questions.
+#
+#   tier 0  template parser: count questions over one yes/no column, known
+#           categorical values and an optional breakdown become SQL (or a
+#           chart spec) here, with no LLM call
+#   tier 1  question_to_sql / the chart spec call, one gpt-4o request
+#   tier 2  the Code Interpreter assistant, for charts a spec can't express
+#
+# Answers taken from the SQL cache or the chart store are recorded as "cache".
+# Questions that say plot/chart/graph/visualize always want a chart; for the
+# rest a small naive Bayes classifier trained on the example questions below
+# decides.
+
+import math
+import re
+import threading
+from collections import Counter
+
+from medical_schema import COLUMN_DESCRIPTIONS
+from request_metrics import metrics
+from schema_index import tokenize
+from sql_cache import normalize_question
+
+TABLE_NAME = "medical_info"
+
+TIERS = ("0", "1", "2", "cache")
+
+CHART_EXAMPLES = (
+    "plot the number of patients per region",
+    "draw a pie chart of income brackets",
+    "show a bar chart of diabetes by race",
+    "visualize the age distribution of patients",
+    "plot a histogram of patient ages",
+    "graph hypertension rates by region",
+    "chart the share of uninsured patients by income",
+    "make a pie chart of marital status",
+    "draw a line chart of mammogram likelihood by age group",
+    "create a bar graph of education levels",
+    "show me a chart of barriers to mammograms",
+    "plot comorbidity score against age",
+    "visualise insurance types as a bar chart",
+    "generate a scatter plot of age and comorbidity score",
+    "heatmap of barriers by race category",
+    "stacked bar chart of pain concerns by race",
+    "display the distribution of community types in a pie chart",
+    "draw the breakdown of employment status",
+    "plot how many patients have cancer in each region",
+    "bar chart of patients per age category",
+    "can you graph the income distribution",
+    "visualization of mammogram status by region",
+    "pie chart showing the regions",
+    "plot the trend of mammogram likelihood over time",
+    "draw a diagram of transport types to mammogram appointments",
+    "visualize how many patients have diabetes by region",
+    "show how many patients are in each income bracket as a bar chart",
+    "graph how many women had a mammogram per age group",
+)
+
+TEXT_EXAMPLES = (
+    "how many patients have diabetes",
+    "how many patients are there in each region",
+    "how many patients with hypertension live in the south",
+    "what is the average age of patients who received ssi",
+    "list the case ids of patients older than 85 with kidney disease",
+    "how many uninsured patients postponed care due to cost",
+    "what share of patients in each community type had a mammogram in the past 12 months",
+    "show every patient record from the northeast",
+    "break down fear of mammogram results by race category",
+    "how often did cost keep patients from a mammogram by age group",
+    "what is the average comorbidity score per income bracket",
+    "which region has the most patients with cancer",
+    "count the patients without health insurance",
+    "what percentage of patients are married",
+    "give me the number of patients with copd",
+    "how many women had an abnormal mammogram result",
+    "list patients who withdrew from screening",
+    "what is the most common barrier to getting a mammogram",
+    "how many patients have medicare",
+    "show the income of patients in the west",
+    "which patients have a regular primary care provider",
+    "what is the median age per region",
+    "how many respondents are black alone",
+    "tell me how many patients drove themselves to the mammogram",
+    "find patients with both diabetes and hypertension",
+    "number of patients per income bracket",
+    "how many patients are in each age group",
+    "number of women by marital status",
+)
+
+# Columns questions filter or break down by, with the words that name them
+CATEGORY_COLUMNS = {
+    "AHRI_REGION": ("region", "regions"),
+    "AHRI_RACE_CAT": ("race", "race category", "race categories", "racial group", "racial groups"),
+    "AHRI_AGE_CAT": ("age group", "age groups", "age category", "age categories", "age bracket", "age brackets",
+                     "age range", "age ranges"),
+    "INCOME": ("income", "income bracket", "income brackets", "income level", "income levels", "household income"),
+    "EDUCATION": ("education", "education level", "education levels", "educational level"),
+    "COMMUNITY_TYPE": ("community type", "community types", "community", "communities", "type of community"),
+    "MARITAL_STATUS": ("marital status",),
+    "EMPLOYMENT": ("employment", "employment status", "employment situation"),
+    "SEX": ("sex", "gender"),
+}
+
+# Words a breakdown follows: "in each region", "per income bracket", "by race"
+_BREAKDOWN = r"(?:in each|for each|in every|for every|per|by|across|broken down by)"
+
+_COUNT_INTENT = re.compile(r"^(?:how many|what is the (?:total )?number of|number of|the number of|"
+                           r"total number of|count(?: of| the)?|give me the number of|tell me how many)\b")
+
+# Words the templates account for without changing the query
+_TEMPLATE_WORDS = {
+    "how", "many", "what", "is", "the", "total", "number", "of", "count", "give", "me", "tell", "there",
+    "patients", "patient", "women", "woman", "people", "persons", "respondents", "participants",
+    "are", "were", "was", "be", "who", "that", "with", "have", "has", "had", "do", "does", "did", "a", "an",
+    "in", "from", "live", "lives", "living", "located", "and", "currently", "diagnosed", "suffer", "suffering",
+    "any",
+}
+_NEGATIONS = {"not", "no", "without", "never", "dont", "doesnt", "didnt", "nor", "non"}
+# Words that ask for a chart whatever the classifier makes of the rest
+_CHART_TRIGGERS = {
+    "plot", "plots", "plotted", "plotting", "chart", "charts", "charted", "graph", "graphs", "graphed",
+    "visualize", "visualise", "visualized", "visualised", "visualization", "visualisation",
+}
+_CHART_WORDS = {
+    "plot", "chart", "graph", "draw", "visualize", "visualise", "visualization", "visualisation", "show",
+    "display", "make", "create", "generate", "pie", "bar", "bars", "line", "as", "distribution", "breakdown",
+    "split", "on", "using", "can", "you", "please",
+}
+
+# Category values too generic to recognize in free text
+_GENERIC_VALUES = {"", "yes", "no", "other", "not sure", "prefer not to answer", "none"}
+
+# Adjectives questions use for a condition the descriptions name as a noun
+_WORD_FORMS = {
+    "diabetic": "diabetes", "hypertensive": "hypertension", "asthmatic": "asthma", "arthritic": "arthritis",
+    "insured": "insurance", "uninsured": "no insurance",
+}
+
+
+def _quote_value(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class IntentClassifier:
+    """Multinomial naive Bayes over words and word pairs, deciding whether a
+    question asks for a chart or for an answer."""
+
+    def __init__(self, chart_examples=CHART_EXAMPLES, text_examples=TEXT_EXAMPLES, alpha=0.5):
+        self.alpha = alpha
+        self._counts = {"chart": Counter(), "text": Counter()}
+        for label, examples in (("chart", chart_examples), ("text", text_examples)):
+            for example in examples:
+                self._counts[label].update(self._features(example))
+        self._totals = {label: sum(counts.values()) for label, counts in self._counts.items()}
+        self._vocabulary = set(self._counts["chart"]) | set(self._counts["text"])
+        total_examples = len(chart_examples) + len(text_examples)
+        self._prior = {"chart": math.log(len(chart_examples) / total_examples),
+                       "text": math.log(len(text_examples) / total_examples)}
+
+    @staticmethod
+    def _features(question):
+        words = normalize_question(question).split()
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def chart_probability(self, question):
+        scores = dict(self._prior)
+        size = len(self._vocabulary)
+        for feature in self._features(question):
+            if feature not in self._vocabulary:
+                continue
+            for label in scores:
+                scores[label] += math.log((self._counts[label][feature] + self.alpha)
+                                          / (self._totals[label] + self.alpha * size))
+        return 1 / (1 + math.exp(max(-50.0, min(50.0, scores["text"] - scores["chart"]))))
+
+    def is_chart(self, question):
+        if _CHART_TRIGGERS & set(normalize_question(question).split()):
+            return True
+        return self.chart_probability(question) >= 0.5
+
+
+class TemplateParser:
+    """Turns count questions that name one yes/no condition, known category
+    values and at most one breakdown into SQL, without the model.
+
+    Column vocabulary comes from the column descriptions; category values come
+    from the aggregate tables (aggregate_cube.py), so they match the stored
+    data exactly. Anything the templates can't account for word by word is
+    left to tier 1.
+    """
+
+    def __init__(self, db_pool, column_descriptions=COLUMN_DESCRIPTIONS, table=TABLE_NAME):
+        self.db_pool = db_pool
+        self.table = table
+        self._column_stems = {column: set(tokenize(column.replace("_", " ")) + tokenize(description))
+                              for column, description in column_descriptions.items()}
+        self._lock = threading.Lock()
+        self._version = None
+        self._yes_values = {}
+        self._value_phrases = {}
+
+    def _load_vocabulary(self):
+        version = self.db_pool.data_version()
+        with self._lock:
+            if version == self._version:
+                return
+            yes_values, value_phrases = {}, {}
+            values_by_column = {}
+            if self.db_pool.table_exists("agg_counts"):
+                with self.db_pool.cursor() as cursor:
+                    cursor.execute("SELECT column_name, value FROM agg_counts")
+                    for column, value in cursor.fetchall():
+                        values_by_column.setdefault(column, []).append(value)
+
+            for column, values in values_by_column.items():
+                answers = {str(value).lower() for value in values if value not in (None, "")}
+                if answers and answers <= {"yes", "no"}:
+                    yes_values[column] = next((value for value in values if str(value).lower() == "yes"), "yes")
+                if column not in CATEGORY_COLUMNS:
+                    continue
+                for value in values:
+                    for phrase in self._phrases_for(value):
+                        value_phrases.setdefault(phrase, set()).add((column, value))
+
+            self._yes_values = yes_values
+            # A phrase naming values of two columns is ambiguous, so it's never matched
+            self._value_phrases = {phrase: next(iter(targets)) for phrase, targets in value_phrases.items()
+                                   if len(targets) == 1}
+            self._version = version
+
+    @staticmethod
+    def _phrases_for(value):
+        phrase = normalize_question(str(value or ""))
+        if phrase in _GENERIC_VALUES or phrase.isdigit():
+            return []
+        phrases = [phrase]
+        # "Rural (country)" is also just "rural"; "Black alone" is also "black"
+        head = normalize_question(str(value).split("(")[0])
+        if head and head != phrase and head not in _GENERIC_VALUES:
+            phrases.append(head)
+        if phrase.endswith(" alone"):
+            phrases.append(phrase[:-len(" alone")])
+        return phrases
+
+    @staticmethod
+    def _remove_phrase(text, phrase):
+        return re.sub(rf"(?:^| ){re.escape(phrase)}(?= |$)", " ", text, count=1)
+
+    def _find_breakdown(self, text, chart):
+        for column, aliases in CATEGORY_COLUMNS.items():
+            for alias in sorted(aliases, key=len, reverse=True):
+                match = re.search(rf"(?:^| ){_BREAKDOWN} (?:the )?{re.escape(alias)}(?= |$)", text)
+                if match is None and chart:
+                    # "a pie chart of income brackets" names the breakdown without a preposition
+                    match = re.search(rf"(?:^| )(?:of |the )*{re.escape(alias)}(?= |$)", text)
+                if match:
+                    return column, text[:match.start()] + " " + text[match.end():]
+        return None, text
+
+    def parse(self, question, chart=False):
+        """Return ``{"sql", "group_by", "filters"}`` or None when the question
+        isn't one of the templates."""
+        text = normalize_question(question)
+        counted = _COUNT_INTENT.match(text)
+        if not counted and not chart:
+            return None
+        self._load_vocabulary()
+        if not self._yes_values and not self._value_phrases:
+            return None
+        if counted:
+            text = text[counted.end():]
+
+        group_by, text = self._find_breakdown(text, chart)
+        if chart and group_by is None:
+            return None
+
+        filters = []
+        for phrase in sorted(self._value_phrases, key=len, reverse=True):
+            if re.search(rf"(?:^| ){re.escape(phrase)}(?= |$)", text):
+                column, value = self._value_phrases[phrase]
+                if column == group_by or any(column == existing for existing, _ in filters):
+                    return None
+                filters.append((column, value))
+                text = self._remove_phrase(text, phrase)
+                # "in the South region": the column's own name is accounted for too
+                for alias in CATEGORY_COLUMNS[column]:
+                    text = self._remove_phrase(text, alias)
+
+        words = " ".join(_WORD_FORMS.get(word, word) for word in text.split()).split()
+        negated = any(word in _NEGATIONS for word in words)
+        if negated and filters:
+            # "with diabetes not in the south": which part the "not" belongs to
+            # isn't something the templates can tell
+            return None
+        ignored = _TEMPLATE_WORDS | _NEGATIONS | (_CHART_WORDS if chart else set())
+        residual = [word for word in words if word not in ignored]
+        if residual:
+            condition = self._condition_column(residual)
+            if condition is None:
+                return None
+            yes = self._yes_values[condition]
+            filters.append((condition, ("no" if yes == "yes" else "No") if negated else yes))
+        elif negated:
+            return None
+
+        where = " AND ".join(f"{column} = {_quote_value(value)}" for column, value in filters)
+        if group_by:
+            sql = f"SELECT {group_by}, COUNT(*) FROM {self.table}"
+            sql += f" WHERE {where}" if where else ""
+            sql += f" GROUP BY {group_by}"
+        else:
+            sql = f"SELECT COUNT(*) FROM {self.table}" + (f" WHERE {where}" if where else "")
+        return {"sql": sql, "group_by": group_by, "filters": filters}
+
+    def sql(self, question):
+        """SQL for a templated question, or None."""
+        parsed = self.parse(question)
+        return parsed["sql"] if parsed else None
+
+    def _condition_column(self, residual):
+        # Every leftover word has to appear in the name or description of
+        # exactly one column, and that column has to be a yes/no one; a
+        # column's follow-up questions (C_DB_FOLLOWON for C_DB) don't count
+        # as another match
+        wanted = set(tokenize(" ".join(residual)))
+        if not wanted:
+            return None
+        matches = [column for column, stems in self._column_stems.items() if wanted <= stems]
+        matches = [column for column in matches if not any(column.startswith(other + "_") for other in matches)]
+        if len(matches) != 1 or matches[0] not in self._yes_values:
+            return None
+        return matches[0]
+
+    def chart_spec(self, question):
+        """A chart spec (see chart_engine.validate_spec) for a count-by-category chart, or None."""
+        parsed = self.parse(question, chart=True)
+        if parsed is None or parsed["group_by"] is None:
+            return None
+        words = set(normalize_question(question).split())
+        chart_type = "pie" if "pie" in words else "line" if "line" in words else "bar"
+        sql = parsed["sql"].replace("COUNT(*)", "COUNT(*) AS n", 1)
+        title = question.strip().rstrip("?.!")
+        return {"supported": True, "sql": sql, "chart_type": chart_type, "x": parsed["group_by"], "y": "n",
+                "title": title[:1].upper() + title[1:80], "x_label": parsed["group_by"], "y_label": "patients"}
+
+
+class QueryRouter:
+    """Chart/text classification and per-tier request counts. Each dataset
+    has its own TemplateParser (see dataset_catalog.py)."""
+
+    def __init__(self):
+        self.classifier = IntentClassifier()
+        self._lock = threading.Lock()
+        self._served = {path: Counter() for path in ("text", "graph")}
+
+    def is_chart(self, question):
+        return self.classifier.is_chart(question)
+
+    def record(self, path, tier):
+        """Count a request on ``path`` ("text"/"graph") as served by ``tier``."""
+        tier = str(tier)
+        with self._lock:
+            self._served[path][tier] += 1
+        metrics.inc("router_requests_total", 1, "Requests by path and the tier that served them", path=path, tier=tier)
+
+    def reset(self):
+        with self._lock:
+            self._served = {path: Counter() for path in self._served}
+
+    def summary(self):
+        with self._lock:
+            served = {path: {tier: counts[tier] for tier in TIERS} for path, counts in self._served.items()}
+        total = sum(sum(counts.values()) for counts in served.values())
+        local = sum(counts["0"] + counts["cache"] for counts in served.values())
+        return {"served": served, "total": total, "llm_offload_ratio": round(local / total, 4) if total else 0.0}
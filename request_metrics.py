@@ -0,0 +1,291 @@
+# Per-stage timing spans, Prometheus metrics and the slow-query log.
+#
+# Code that does a unit of work for a request wraps it in
+#
+#   with span("sql_execute") as record:
+#       ...
+#
+# and the duration lands in the current request's Trace (returned to the
+# client as `timings` and a Server-Timing header) and in the per-stage latency
+# histogram served at /metrics. Stages: template_parse, prompt_build,
+# sql_cache_lookup, llm_call, column_scan, sql_execute, sql_fetch, chart_draw,
+# assistant_run, file_download and serialize.
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = tuple(float(bound) for bound in os.getenv(
+    'METRICS_LATENCY_BUCKETS', '0.001,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120').split(','))
+
+# SQL running longer than this many seconds goes to the slow-query log
+SLOW_QUERY_SECONDS = float(os.getenv('SLOW_QUERY_SECONDS', '1'))
+
+# File the slow-query log is appended to (one JSON object per line); empty
+# leaves it to the logging configuration
+SLOW_QUERY_LOG = os.getenv('SLOW_QUERY_LOG', 'slow_queries.log')
+
+METRIC_PREFIX = "usa_health_"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+slow_query_logger = logging.getLogger("slow_queries")
+_slow_log_lock = threading.Lock()
+_slow_log_ready = False
+
+
+class Histogram:
+    """Bucketed latency observations, cumulative as Prometheus expects."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside its bucket, the
+        way Prometheus' histogram_quantile does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Counters, gauges and latency histograms, rendered in the Prometheus
+    text format. Collectors add values computed at scrape time (cache hit
+    ratios, queue depths) without the owning code pushing them."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._families = {}
+        self._collectors = []
+
+    def _family(self, name, kind, help_text):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = {"kind": kind, "help": help_text, "samples": {}}
+        return family
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        with self._lock:
+            samples = self._family(name, "counter", help_text)["samples"]
+            key = _label_key(labels)
+            samples[key] = samples.get(key, 0) + amount
+
+    def gauge_add(self, name, amount, help_text="", **labels):
+        with self._lock:
+            samples = self._family(name, "gauge", help_text)["samples"]
+            key = _label_key(labels)
+            samples[key] = samples.get(key, 0) + amount
+
+    def observe(self, name, seconds, help_text="", **labels):
+        with self._lock:
+            samples = self._family(name, "histogram", help_text)["samples"]
+            key = _label_key(labels)
+            histogram = samples.get(key)
+            if histogram is None:
+                histogram = samples[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def value(self, name, **labels):
+        with self._lock:
+            family = self._families.get(name)
+            return family["samples"].get(_label_key(labels), 0) if family else 0
+
+    def histogram_summary(self, name, label):
+        """``{label value: count, mean and estimated p50/p95/p99 in ms}`` for one histogram."""
+        with self._lock:
+            family = self._families.get(name)
+            histograms = dict(family["samples"]) if family else {}
+        summary = {}
+        for key, histogram in histograms.items():
+            if not histogram.count:
+                continue
+            entry = {"count": histogram.count, "mean_ms": round(histogram.sum / histogram.count * 1000, 2)}
+            for q in (0.5, 0.95, 0.99):
+                entry[f"p{int(q * 100)}_ms"] = round(histogram.quantile(q) * 1000, 2)
+            summary[dict(key).get(label, "")] = entry
+        return summary
+
+    def add_collector(self, collect):
+        """Register ``collect()``, returning ``[(name, kind, help, [(labels, value), ...]), ...]``."""
+        self._collectors.append(collect)
+
+    def reset(self):
+        """Forget counters and histograms; gauges of work still in flight are kept."""
+        with self._lock:
+            for family in self._families.values():
+                if family["kind"] != "gauge":
+                    family["samples"] = {}
+
+    def render(self):
+        with self._lock:
+            families = [(name, family["kind"], family["help"], list(family["samples"].items()))
+                        for name, family in sorted(self._families.items())]
+        for collect in self._collectors:
+            try:
+                families += [(name, kind, help_text, [(_label_key(labels), value) for labels, value in samples])
+                             for name, kind, help_text, samples in collect()]
+            except Exception:
+                logging.getLogger(__name__).exception("Metrics collector failed")
+
+        lines = []
+        for name, kind, help_text, samples in families:
+            name = METRIC_PREFIX + name
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(value.buckets) + [float("inf")], value.counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# ---- request traces -------------------------------------------------------
+
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+class Trace:
+    """The timed stages of one request, in the order they finished."""
+
+    def __init__(self):
+        self.spans = []
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. ``llm_call;dur=812.4, sql_execute;dur=3.1``."""
+        return ", ".join(f"{record['stage']};dur={record['ms']}" for record in self.spans)
+
+    def describe(self):
+        return "Timings: " + ", ".join(f"{record['stage']} {record['ms']} ms" for record in self.spans) + "."
+
+
+def start_trace():
+    """Begin a new trace for the request running in the current context."""
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Time the enclosed block as ``stage``. Keys added to the yielded dict
+    (token counts, row counts) are kept with the span; ``ms`` is filled in
+    on exit, so callers can quote it in their steps afterwards."""
+    record = dict(stage=stage, **attributes)
+    metrics.gauge_add("stage_in_flight", 1, "Stages currently running", stage=stage)
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        record["ms"] = round(seconds * 1000, 2)
+        metrics.gauge_add("stage_in_flight", -1, stage=stage)
+        metrics.observe("stage_seconds", seconds, "Time spent in each request stage", stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(record)
+
+
+# ---- request counts -------------------------------------------------------
+
+def request_started(route):
+    metrics.gauge_add("requests_in_flight", 1, "Requests being handled", route=route)
+    return time.perf_counter()
+
+
+def request_finished(route, status, started):
+    """Close a request opened with request_started. A None status means the
+    request was handed to another handler that counts it itself."""
+    metrics.gauge_add("requests_in_flight", -1, route=route)
+    if status is None:
+        return
+    metrics.observe("request_seconds", time.perf_counter() - started, "Request latency by route", route=route)
+    metrics.inc("requests_total", 1, "Requests by route and status", route=route, status=status)
+
+
+# ---- slow-query log -------------------------------------------------------
+
+def _ensure_slow_log():
+    global _slow_log_ready
+    with _slow_log_lock:
+        if _slow_log_ready:
+            return
+        _slow_log_ready = True
+        if SLOW_QUERY_LOG:
+            handler = logging.FileHandler(SLOW_QUERY_LOG, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.INFO)
+
+
+def log_slow_query(sql, seconds, threshold=SLOW_QUERY_SECONDS, **context):
+    """Record ``sql`` in the slow-query log when it took ``threshold`` seconds or more."""
+    if threshold is None or seconds < threshold:
+        return False
+    _ensure_slow_log()
+    metrics.inc("slow_queries_total", 1, "Queries slower than the slow-query threshold")
+    entry = {"at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "seconds": round(seconds, 3), "sql": sql}
+    entry.update(context)
+    slow_query_logger.warning(json.dumps(entry, default=str))
+    return True
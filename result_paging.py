@@ -0,0 +1,211 @@
+import base64
+import csv
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import re
+import sys
+from contextlib import ExitStack
+
+# Rows per page when the client doesn't ask for a size, and the most it may ask for
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '1000'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '10000'))
+
+# Rows pulled from SQLite per fetchmany() while streaming
+STREAM_BATCH_ROWS = 500
+
+# Page tokens carry the SQL, so they are signed to stop clients editing it.
+# Set PAGE_TOKEN_SECRET to the same value on every worker/process; without it
+# each process signs with its own random key and tokens only work on the
+# process that issued them, for as long as it runs.
+_SECRET = (os.getenv('PAGE_TOKEN_SECRET') or os.urandom(32).hex()).encode("utf-8")
+_secret_warning = None if os.getenv('PAGE_TOKEN_SECRET') else (
+    "PAGE_TOKEN_SECRET is not set: page tokens only work on the process that issued them")
+
+# "ORDER BY <one column> [ASC|DESC]" ending a query, optionally followed by its LIMIT
+_ORDER_KEY = re.compile(r'\bORDER\s+BY\s+(?P<key>"[^"]+"|[A-Za-z_]\w*|\d+)(?:\s+(?P<direction>ASC|DESC))?'
+                        r'(?:\s+LIMIT\s+\d+(?:\s*(?:,|\s+OFFSET\s)\s*\d+)?)?$', re.IGNORECASE)
+
+
+class PageTokenError(ValueError):
+    pass
+
+
+def clamp_page_size(value):
+    try:
+        size = int(value) if value is not None else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        raise PageTokenError("limit must be an integer")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def strip_statement(sql):
+    return sql.strip().rstrip(";").strip()
+
+
+def encode_page_token(sql, offset, dataset=None, after=None):
+    global _secret_warning
+    if _secret_warning:
+        logging.getLogger(__name__).warning(_secret_warning)
+        _secret_warning = None
+    payload = {"sql": sql, "offset": offset}
+    if dataset is not None:
+        payload["dataset"] = dataset
+    if after is not None:
+        payload["after"] = after
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    signature = hmac.new(_SECRET, body, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(signature + body).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token):
+    """Return ``(sql, offset, dataset, after)`` from a token made by :func:`encode_page_token`."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        signature, body = raw[:16], raw[16:]
+        if not hmac.compare_digest(signature, hmac.new(_SECRET, body, hashlib.sha256).digest()[:16]):
+            raise PageTokenError("Page token is invalid or has expired")
+        payload = json.loads(body)
+        return payload["sql"], int(payload["offset"]), payload.get("dataset"), payload.get("after")
+    except (ValueError, KeyError, TypeError) as e:
+        if isinstance(e, PageTokenError):
+            raise
+        raise PageTokenError("Page token is malformed")
+
+
+def column_metadata(description):
+    return [{"name": column[0]} for column in description]
+
+
+def paged_sql(sql):
+    return f"SELECT * FROM ({strip_statement(sql)}) LIMIT ? OFFSET ?"
+
+
+def _quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def order_key(sql, names):
+    """``(column, descending)`` when ``sql`` ends in an ORDER BY on one of
+    its own result columns ``names`` (by name or position), otherwise None."""
+    match = _ORDER_KEY.search(strip_statement(sql))
+    if not match:
+        return None
+    key = match.group("key")
+    if key.isdigit():
+        position = int(key) - 1
+        if not 0 <= position < len(names):
+            return None
+        column = names[position]
+    else:
+        matches = [name for name in names if name.lower() == key.strip('"').lower()]
+        if len(matches) != 1:
+            return None
+        column = matches[0]
+    return column, (match.group("direction") or "").upper() == "DESC"
+
+
+def keyset_after(key, names, rows, previous=None):
+    """Where the page after ``rows`` starts for a query ordered by ``key``
+    (see :func:`order_key`): the last key value and how many rows with that
+    value have been returned. None when the query can't be paged that way."""
+    if key is None or not rows:
+        return None
+    column, descending = key
+    index = names.index(column)
+    value = rows[-1][index]
+    # NULLs sort first ascending, so rows after them can't be found by value
+    if value is None or isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        return None
+    ties = 0
+    for row in reversed(rows):
+        if row[index] != value:
+            break
+        ties += 1
+    if ties == len(rows) and previous and previous["column"] == column and previous["value"] == value:
+        ties += previous["ties"]
+    return {"column": column, "desc": descending, "value": value, "ties": ties}
+
+
+def keyset_sql(sql, after):
+    """The page of ``sql`` that starts at ``after`` (see :func:`keyset_after`),
+    taking ``(value, limit, ties)`` as parameters. A filter on the ordering
+    column lets SQLite seek to the page instead of stepping over every row
+    before it as OFFSET does; only rows tied with the last value are skipped.
+    Rows with equal keys keep the order SQLite returns them in, as with OFFSET."""
+    column = _quote_identifier(after["column"])
+    if after["desc"]:
+        where, direction = f"({column} <= ? OR {column} IS NULL)", "DESC"
+    else:
+        where, direction = f"{column} >= ?", "ASC"
+    return f"SELECT * FROM ({strip_statement(sql)}) WHERE {where} ORDER BY {column} {direction} LIMIT ? OFFSET ?"
+
+
+def _ndjson_lines(names, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), default=str) + "\n"
+
+
+def _csv_lines(names, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() > 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+STREAM_FORMATS = {
+    "ndjson": ("application/x-ndjson", _ndjson_lines),
+    "csv": ("text/csv", _csv_lines),
+}
+
+
+def stream_rows(cursor_context, sql, fmt, guard=None):
+    """Execute ``sql`` and return ``(columns, mimetype, body)`` where ``body``
+    yields the encoded rows a batch at a time.
+
+    The query runs before this returns so SQL errors surface as a normal
+    error response; the cursor is closed when the body is exhausted or the
+    client goes away. ``guard(cursor)``, if given, is a context manager held
+    open for the whole stream (see sql_guard.guarded_query).
+    """
+    mimetype, encoder = STREAM_FORMATS[fmt]
+    stack = ExitStack()
+    try:
+        cursor = stack.enter_context(cursor_context())
+        if guard is not None:
+            stack.enter_context(guard(cursor))
+        cursor.execute(strip_statement(sql))
+        columns = column_metadata(cursor.description)
+    except BaseException:
+        stack.__exit__(*sys.exc_info())
+        raise
+
+    def rows():
+        while True:
+            batch = cursor.fetchmany(STREAM_BATCH_ROWS)
+            if not batch:
+                return
+            yield from batch
+
+    def body():
+        try:
+            if fmt == "ndjson":
+                yield json.dumps({"columns": columns}) + "\n"
+            yield from encoder([column["name"] for column in columns], rows())
+        except Exception as e:
+            # Headers are already sent; NDJSON clients get the error as a last line
+            if fmt == "ndjson":
+                yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            stack.close()
+
+    return columns, mimetype, body()
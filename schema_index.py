@@ -0,0 +1,161 @@
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Columns taken from the BM25 ranking before group expansion
+TOP_K = int(os.getenv('SCHEMA_TOP_K', '25'))
+
+# Below this best-match score the question is too vague to prune safely
+MIN_CONFIDENCE = float(os.getenv('SCHEMA_MIN_CONFIDENCE', '3.0'))
+
+# Cheap, frequently filtered columns that every prompt gets
+ALWAYS_INCLUDED = ("CASE_ID", "AGE", "SEX", "AHRI_REGION", "AHRI_AGE_CAT", "AHRI_RACE_CAT")
+
+# Mentioning any trigger word pulls in the whole group, since answers often
+# need several sibling columns (e.g. every RACE* flag for a race breakdown)
+COLUMN_GROUPS = {
+    "race": ({"race", "races", "racial", "ethnicity", "ethnic", "black", "white", "asian", "african",
+              "caribbean", "chinese", "filipino", "japanese", "korean", "vietnamese", "indian",
+              "hawaiian", "alaska"},
+             ("RACE1_", "RACE2_", "RACE3_", "AHRI_RACE_CAT")),
+    "hispanic": ({"hispanic", "latina", "latino", "spanish", "mexican", "puerto", "chicana"}, ("HLS_",)),
+    "comorbidity": ({"comorbidity", "comorbidities", "condition", "conditions", "disease", "diseases"},
+                    ("C_", "AHRI_CCI_SCORE")),
+    "insurance": ({"insurance", "insured", "uninsured", "medicare", "tricare", "champus", "coverage"},
+                  ("INS_",)),
+    "assistance": ({"assistance", "benefit", "benefits", "welfare", "ssi", "eitc", "wic", "tanf", "snap"},
+                   ("LIS_",)),
+    "care_cost": ({"cost", "costs", "afford", "postpone", "postponed"}, ("CARECOST_", "INS_RX_COST")),
+    "provider": ({"provider", "pcp", "physician", "doctor", "doctors"}, ("PCP_",)),
+    "menopause": ({"menopause", "menstrual", "menopausal", "hrt", "hormone"}, ("MENO_", "HRT")),
+    "barrier": ({"barrier", "barriers", "prevented", "delayed", "interfered"}, ("BARRIER_",)),
+    "likelihood": ({"likely", "likelihood", "next"}, ("MMG_FREQ",)),
+    "transport": ({"travel", "transport", "transportation", "vehicle"}, ("MMG_TRANSPORT_", "MMG_REASONABLE_TIME")),
+    "time_off": ({"work", "paid", "off"}, ("MMG_TIMEOFF_",)),
+}
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "is", "are", "was", "were", "be",
+    "by", "as", "at", "it", "its", "this", "that", "these", "those", "from", "if", "then", "what", "which",
+    "who", "how", "many", "much", "do", "does", "did", "have", "has", "had", "patient", "patients",
+    "yes", "no", "options", "mentioned", "here", "e", "g", "etc", "not", "your", "you", "i", "my",
+    "any", "all", "each", "give", "me", "show", "list", "count", "number", "there",
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in _STOPWORDS or len(token) < 2:
+            continue
+        # Light stemming so "cancers"/"cancer" and "diabetes"/"diabetic" meet
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token[:7] if len(token) > 7 else token)
+    return tokens
+
+
+# Token counts for gpt-4o prompts; falls back to a chars/4 estimate
+def count_tokens(text, model="gpt-4o"):
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(model).encode(text))
+        except Exception:
+            pass
+    return max(1, len(text) // 4)
+
+
+def format_columns(column_descriptions, columns=None):
+    columns = column_descriptions if columns is None else columns
+    return ", ".join(f"{col}: {column_descriptions[col]}" for col in columns)
+
+
+class SchemaIndex:
+    """BM25 index over column names and descriptions, built once so each
+    prompt carries only the columns relevant to the question."""
+
+    def __init__(self, column_descriptions, top_k=TOP_K, min_confidence=MIN_CONFIDENCE, k1=1.5, b=0.75):
+        self.column_descriptions = column_descriptions
+        self.columns = list(column_descriptions)
+        self.top_k = top_k
+        self.min_confidence = min_confidence
+        self.k1 = k1
+        self.b = b
+        self.full_schema = format_columns(column_descriptions)
+        self.full_schema_tokens = count_tokens(self.full_schema)
+
+        self._documents = []
+        document_frequency = Counter()
+        for column, description in column_descriptions.items():
+            # Column names count twice: they are the most specific signal
+            terms = Counter(tokenize(column.replace("_", " ")) * 2 + tokenize(description))
+            self._documents.append(terms)
+            document_frequency.update(terms.keys())
+        self._lengths = [sum(terms.values()) for terms in self._documents]
+        self._average_length = sum(self._lengths) / max(1, len(self._lengths))
+        count = len(self._documents)
+        self._idf = {term: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+                     for term, freq in document_frequency.items()}
+
+    def score(self, question):
+        terms = tokenize(question)
+        scores = []
+        for terms_in_doc, length in zip(self._documents, self._lengths):
+            total = 0.0
+            for term in terms:
+                tf = terms_in_doc.get(term)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * length / self._average_length)
+                    total += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(total)
+        return scores
+
+    def _group_columns(self, question):
+        words = set(_TOKEN.findall(question.lower()))
+        selected = set()
+        for triggers, prefixes in COLUMN_GROUPS.values():
+            if words & triggers:
+                selected.update(col for col in self.columns if col.startswith(prefixes))
+        return selected
+
+    def select(self, question):
+        """Return ``(columns_desc, info)`` for the prompt, where ``info``
+        records which columns were chosen and the token savings."""
+        scores = self.score(question)
+        ranked = sorted(range(len(self.columns)), key=lambda i: scores[i], reverse=True)
+        best = scores[ranked[0]] if ranked else 0.0
+
+        if best < self.min_confidence:
+            info = {"fallback": True, "columns": len(self.columns), "best_score": round(best, 3),
+                    "tokens_full": self.full_schema_tokens, "tokens_pruned": self.full_schema_tokens}
+            logger.info("Schema prompt: low confidence (%.2f), sending full schema", best)
+            return self.full_schema, info
+
+        selected = {col for col in ALWAYS_INCLUDED if col in self.column_descriptions}
+        for i in ranked[:self.top_k]:
+            if scores[i] <= 0:
+                break
+            column = self.columns[i]
+            selected.add(column)
+            # Follow-on and free-text columns only make sense next to their parent
+            selected.update(col for col in self.columns if col.startswith(column + "_"))
+        selected |= self._group_columns(question)
+
+        ordered = [col for col in self.columns if col in selected]
+        columns_desc = format_columns(self.column_descriptions, ordered)
+        info = {"fallback": False, "columns": len(ordered), "best_score": round(best, 3),
+                "tokens_full": self.full_schema_tokens, "tokens_pruned": count_tokens(columns_desc)}
+        logger.info("Schema prompt: %d/%d columns, %d -> %d tokens", len(ordered), len(self.columns),
+                    info["tokens_full"], info["tokens_pruned"])
+        return columns_desc, info
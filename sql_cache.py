@@ -0,0 +1,191 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # numpy search is fast enough for a few thousand entries
+    faiss = None
+
+SQL_CACHE_PATH = os.getenv('SQL_CACHE_PATH', 'sql_cache.db')
+
+# Cosine similarity a cached question needs to be reused for a new one (on
+# top of both questions having the same content words, see _content_words)
+SIMILARITY_THRESHOLD = float(os.getenv('SQL_CACHE_SIMILARITY', '0.9'))
+
+# Entries older than this are dropped, and the least recently used go first
+# once the cache holds more than MAX_ENTRIES
+TTL_SECONDS = int(os.getenv('SQL_CACHE_TTL', str(24 * 3600)))
+MAX_ENTRIES = int(os.getenv('SQL_CACHE_MAX_ENTRIES', '5000'))
+
+EMBEDDING_DIM = 512
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# Words a rephrasing may add, drop or swap without changing which SQL answers
+# it. Everything else (values like south or female, column words like region
+# or copd, negations, aggregates, numbers) has to match for a semantic hit.
+_FILLER_WORDS = {"a", "an", "the", "of", "in", "on", "at", "to", "for", "with", "by", "and", "is", "are", "was",
+                 "were", "be", "been", "do", "does", "did", "have", "has", "had", "how", "many", "much", "what",
+                 "which", "who", "there", "that", "this", "those", "these", "their", "they", "them", "me", "i",
+                 "we", "you", "please", "can", "could", "show", "give", "tell", "list", "find", "get", "number",
+                 "count", "patients", "patient", "people", "persons", "person", "respondents", "total"}
+
+
+def normalize_question(question):
+    return " ".join(_TOKEN.findall(question.lower().replace("'", "")))
+
+
+# Hashed word and character n-gram features; cheap, local and good enough to
+# tell rephrasings of the same question apart from different questions.
+def embed(normalized):
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    words = normalized.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {normalized} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vector[bucket] += sign
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _content_words(normalized):
+    # Plurals count as the same word ("regions" / "region")
+    return {token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+            for token in normalized.split() if token not in _FILLER_WORDS}
+
+
+class SQLCache:
+    """Two-tier cache from questions to generated SQL.
+
+    Tier one is an exact match on the normalized question text; tier two
+    compares local embeddings and reuses the SQL of the closest cached
+    question above ``threshold``, as long as both questions have the same
+    content words. Entries persist in a small SQLite file.
+    """
+
+    def __init__(self, path=SQL_CACHE_PATH, threshold=SIMILARITY_THRESHOLD,
+                 ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sql_cache ("
+            "normalized TEXT PRIMARY KEY, question TEXT, sql TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, created_at REAL, last_used REAL, hits INTEGER DEFAULT 0)"
+        )
+        self._conn.commit()
+        self._index_dirty = True
+        self._keys = []
+        self._matrix = None
+        self._faiss_index = None
+
+    def _rebuild_index(self):
+        rows = self._conn.execute("SELECT normalized, embedding FROM sql_cache").fetchall()
+        self._keys = [row[0] for row in rows]
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        if faiss is not None:
+            self._faiss_index = faiss.IndexFlatIP(EMBEDDING_DIM)
+            if rows:
+                self._faiss_index.add(self._matrix)
+        self._index_dirty = False
+
+    def _nearest(self, vector):
+        if self._index_dirty:
+            self._rebuild_index()
+        if not self._keys:
+            return None, 0.0
+        if self._faiss_index is not None:
+            scores, ids = self._faiss_index.search(vector.reshape(1, -1), 1)
+            return self._keys[int(ids[0][0])], float(scores[0][0])
+        scores = self._matrix @ vector
+        best = int(np.argmax(scores))
+        return self._keys[best], float(scores[best])
+
+    def lookup(self, question):
+        """Return ``(sql, tier)`` for a cached question, or ``(None, "miss")``."""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sql, created_at FROM sql_cache WHERE normalized = ?", (normalized,)
+            ).fetchone()
+            tier = "exact"
+            key = normalized
+            if row is None or now - row[1] > self.ttl:
+                key, score = self._nearest(embed(normalized))
+                row = None
+                if key is not None and score >= self.threshold and _content_words(key) == _content_words(normalized):
+                    row = self._conn.execute(
+                        "SELECT sql, created_at FROM sql_cache WHERE normalized = ?", (key,)
+                    ).fetchone()
+                    tier = "semantic"
+                if row is None or now - row[1] > self.ttl:
+                    self.stats["misses"] += 1
+                    return None, "miss"
+
+            self._conn.execute(
+                "UPDATE sql_cache SET last_used = ?, hits = hits + 1 WHERE normalized = ?", (now, key)
+            )
+            self._conn.commit()
+            self.stats[f"{tier}_hits"] += 1
+            return row[0], tier
+
+    def store(self, question, sql):
+        normalized = normalize_question(question)
+        vector = embed(normalized)
+        now = time.time()
+        with self._lock:
+            existed = self._conn.execute(
+                "SELECT 1 FROM sql_cache WHERE normalized = ?", (normalized,)
+            ).fetchone() is not None
+            self._conn.execute(
+                "INSERT INTO sql_cache (normalized, question, sql, embedding, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(normalized) DO UPDATE SET "
+                "sql = excluded.sql, question = excluded.question, created_at = excluded.created_at, "
+                "last_used = excluded.last_used",
+                (normalized, question, sql, vector.tobytes(), now, now)
+            )
+            evicted = self._evict(now)
+            self._conn.commit()
+
+            # Appending keeps the in-memory index warm; evictions need a rebuild
+            if evicted:
+                self._index_dirty = True
+            elif not existed and not self._index_dirty:
+                self._keys.append(normalized)
+                self._matrix = np.vstack([self._matrix, vector.reshape(1, -1)])
+                if self._faiss_index is not None:
+                    self._faiss_index.add(vector.reshape(1, -1))
+
+    def _evict(self, now):
+        expired = self._conn.execute("DELETE FROM sql_cache WHERE created_at < ?", (now - self.ttl,)).rowcount
+        overflow = self._conn.execute(
+            "DELETE FROM sql_cache WHERE normalized IN ("
+            "SELECT normalized FROM sql_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        ).rowcount
+        return expired + overflow
+
+    def summary(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM sql_cache").fetchone()[0]
+        lookups = sum(self.stats.values())
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return dict(self.stats, entries=entries, hit_ratio=round(hits / lookups, 4) if lookups else 0.0)
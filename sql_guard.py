@@ -0,0 +1,122 @@
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from request_metrics import SLOW_QUERY_SECONDS, log_slow_query
+
+# Wall-clock budget for one generated query, in seconds
+QUERY_TIME_BUDGET = float(os.getenv('QUERY_TIME_BUDGET', '5'))
+
+# Streams legitimately run longer than a single page
+STREAM_TIME_BUDGET = float(os.getenv('STREAM_TIME_BUDGET', '120'))
+
+# Hard cap on rows a generated query may produce, across all pages
+MAX_RESULT_ROWS = int(os.getenv('MAX_RESULT_ROWS', '1000000'))
+
+# SQLite VM instructions between deadline checks
+PROGRESS_INTERVAL = 10000
+
+# Statement actions a read-only query needs; everything else is denied
+_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION,
+                    getattr(sqlite3, "SQLITE_RECURSIVE", 33)}
+
+# "SCAN t" (even "USING COVERING INDEX") is a full pass over t; "SEARCH t" is not
+_SCAN = re.compile(r"^SCAN (\(subquery-\d+\)|\S+)")
+
+# Subqueries and CTEs that SQLite evaluates once into a small temporary result
+_DERIVED = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\(subquery-\d+\)|\S+)")
+
+
+class QueryGuardError(Exception):
+    pass
+
+
+class QueryRejected(QueryGuardError):
+    pass
+
+
+class QueryTimeout(QueryGuardError):
+    pass
+
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    return sqlite3.SQLITE_OK if action in _ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def cap_rows(sql, cap=MAX_RESULT_ROWS):
+    return f"SELECT * FROM ({sql.strip().rstrip(';')}) LIMIT {int(cap)}"
+
+
+def find_cross_joins(plan_rows):
+    """Return the tables fully scanned inside another full scan.
+
+    EXPLAIN QUERY PLAN lists nested-loop joins as sibling rows under one
+    parent; two or more full SCANs of base tables there mean every row of one table
+    is paired with every row of the other.
+    """
+    derived = {"CONSTANT"}
+    for _, _, _, detail in plan_rows:
+        match = _DERIVED.match(detail)
+        if match:
+            derived.add(match.group(1))
+
+    scans_by_parent = {}
+    for _, parent, _, detail in plan_rows:
+        match = _SCAN.match(detail)
+        if match and match.group(1) not in derived and not match.group(1).startswith("(subquery"):
+            scans_by_parent.setdefault(parent, []).append(match.group(1))
+    return [tables for tables in scans_by_parent.values() if len(tables) > 1]
+
+
+def check_plan(cursor, sql, params=()):
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    cross_joins = find_cross_joins(cursor.fetchall())
+    if cross_joins:
+        tables = " x ".join(cross_joins[0])
+        raise QueryRejected(f"Query plan is a full cross join ({tables}); add a join condition or filter")
+
+
+@contextmanager
+def guarded_query(cursor, sql, params=(), steps=None, time_budget=QUERY_TIME_BUDGET,
+                  slow_query_seconds=SLOW_QUERY_SECONDS):
+    """Run the enclosed execute/fetch calls under the guardrails: read-only
+    authorizer, plan pre-check and a wall-clock budget. Rejections and
+    timeouts are recorded in ``steps`` and raised as QueryGuardError.
+    Queries taking ``slow_query_seconds`` or more (None to skip) go to the
+    slow-query log."""
+    steps = steps if steps is not None else []
+    conn = cursor.connection
+    started = time.monotonic()
+    outcome = "error"
+    deadline = started + time_budget
+    conn.set_authorizer(_read_only_authorizer)
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_INTERVAL)
+    try:
+        try:
+            check_plan(cursor, sql, params)
+            steps.append("Query plan checked: no full cross joins.")
+            yield
+            outcome = "ok"
+        except sqlite3.DatabaseError as e:
+            message = str(e)
+            if "interrupted" in message:
+                raise QueryTimeout(f"Query exceeded its {time_budget:g}s time budget and was stopped") from e
+            if "not authorized" in message:
+                raise QueryRejected("Only read-only SELECT queries are allowed") from e
+            raise
+    except QueryRejected as e:
+        outcome = "rejected"
+        steps.append(f"Query rejected: {e}")
+        raise
+    except QueryTimeout as e:
+        outcome = "timeout"
+        steps.append(f"Query stopped: {e}")
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+        conn.set_authorizer(None)
+        seconds = time.monotonic() - started
+        if log_slow_query(sql, seconds, slow_query_seconds, params=params, outcome=outcome):
+            steps.append(f"Logged as a slow query ({seconds:.2f}s).")
@@ -0,0 +1,83 @@
+# Shared test fixtures: a small synthetic medical.db built the way the
+# benchmarks build theirs (benchmarks/synthetic_data.py + ingest_csv.py, so
+# the aggregate tables and ingest_meta are there too), the local OpenAI stub,
+# and the Flask app running on both.
+#
+#   python -m pytest -q
+
+import json
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.synthetic_data import generate_csv  # noqa: E402
+from ingest_csv import ingest  # noqa: E402
+from openai_stub import start_stub_server  # noqa: E402
+
+SYNTHETIC_ROWS = 2000
+
+
+@pytest.fixture(scope="session")
+def medical_db(tmp_path_factory):
+    """Path of a read-only-by-convention medical.db shared by the whole session."""
+    directory = tmp_path_factory.mktemp("medical")
+    csv_path = str(directory / "synthetic.csv")
+    db_path = str(directory / "medical.db")
+    generate_csv(csv_path, SYNTHETIC_ROWS, seed=0)
+    ingest(csv_path, db_path, rebuild=True)
+    return db_path
+
+
+@pytest.fixture
+def openai_stub():
+    """``(state, base_url)`` of a fresh stub server."""
+    server, state, base_url = start_stub_server()
+    try:
+        yield state, base_url
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(scope="session")
+def text_app(medical_db, tmp_path_factory):
+    """``(text_n_graph1 module, stub state)``: the app on a writable copy of
+    medical_db, with a column store, and a stub server of its own."""
+    directory = tmp_path_factory.mktemp("app")
+    db_path = str(directory / "medical.db")
+    shutil.copy(medical_db, db_path)
+    catalog_path = str(directory / "datasets.json")
+    with open(catalog_path, "w") as f:
+        json.dump({"datasets": {"default": {"db": db_path, "sql_cache": str(directory / "sql_cache.db")}}}, f)
+    server, state, base_url = start_stub_server()
+
+    with pytest.MonkeyPatch.context() as patch:
+        # Whatever the app creates relative to the working directory at import goes here
+        patch.chdir(directory)
+        patch.setenv("OPENAI_BASE_URL", base_url)
+        patch.setenv("OPENAI_API_KEY", "test")
+        patch.setenv("DATASET_CATALOG", catalog_path)
+        import text_n_graph1
+
+    # Modules imported while collecting the tests have read their settings already
+    from chart_store import ChartStore
+    from column_store import ColumnStore
+    from dataset_catalog import DatasetCatalog
+    from openai_client import OpenAIClient
+
+    text_n_graph1.openai_api = OpenAIClient(api_key="test", base_url=base_url, max_retries=0)
+    text_n_graph1.catalog = DatasetCatalog.load(catalog_path)
+    dataset = text_n_graph1.catalog.default
+    dataset.column_store = ColumnStore(dataset.pool, dataset.table, str(directory / "column_store"))
+    text_n_graph1.chart_store = ChartStore(str(directory / "artifacts"))
+    try:
+        yield text_n_graph1, state
+    finally:
+        server.shutdown()
+        server.server_close()
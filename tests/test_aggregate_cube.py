@@ -0,0 +1,123 @@
+import csv
+import shutil
+import sqlite3
+
+import pytest
+
+from aggregate_cube import AggregateRewriter, build_cube, cube_is_current, parse_count_query
+from db_pool import ReadOnlyConnectionPool
+from ingest_csv import ingest
+
+
+@pytest.fixture(scope="module")
+def pool(medical_db):
+    pool = ReadOnlyConnectionPool(medical_db)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture(scope="module")
+def rewriter(pool):
+    return AggregateRewriter(pool)
+
+
+def rows(pool, sql):
+    with pool.cursor() as cursor:
+        cursor.execute(sql)
+        return cursor.fetchall()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'yes'",
+    "SELECT COUNT(*) FROM medical_info WHERE LOWER(C_DB) = 'yes' AND AHRI_REGION = 'South'",
+    "SELECT AHRI_REGION, COUNT(*) FROM medical_info GROUP BY AHRI_REGION ORDER BY AHRI_REGION",
+    "SELECT AHRI_REGION, COUNT(*) AS n FROM medical_info WHERE C_HYPERTEN = 'yes' GROUP BY AHRI_REGION ORDER BY n DESC",
+    "SELECT INCOME, COUNT(*) FROM medical_info WHERE LOWER(C_COPD) = 'no' GROUP BY INCOME ORDER BY INCOME LIMIT 3",
+    "SELECT COUNT(*), SEX FROM medical_info GROUP BY SEX ORDER BY SEX",
+    "SELECT AHRI_REGION, INCOME, COUNT(*) FROM medical_info GROUP BY AHRI_REGION, INCOME ORDER BY 1, 2",
+])
+def test_rewrite_matches_the_base_table(pool, rewriter, sql):
+    rewrite = rewriter.rewrite(sql)
+    assert rewrite is not None, sql
+    assert rewrite[1] in ("agg_counts", "agg_dim_counts")
+    assert rows(pool, rewrite[0]) == rows(pool, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    # Without a column there is nothing to look up
+    "SELECT COUNT(*) FROM medical_info",
+    "SELECT AVG(AGE) FROM medical_info",
+    "SELECT COUNT(DISTINCT INCOME) FROM medical_info",
+    "SELECT COUNT(*) FROM medical_info WHERE AGE > 50",
+    "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'yes' OR C_COPD = 'yes'",
+    "SELECT AHRI_REGION, COUNT(*) FROM medical_info GROUP BY AHRI_REGION HAVING COUNT(*) > 10",
+    "SELECT COUNT(*) FROM medical_info a JOIN medical_info b ON a.CASE_ID = b.CASE_ID",
+    # Two columns that are both not dimensions
+    "SELECT C_DB, C_COPD, COUNT(*) FROM medical_info GROUP BY C_DB, C_COPD",
+])
+def test_other_queries_are_not_rewritten(rewriter, sql):
+    assert rewriter.rewrite(sql) is None
+
+
+def test_parse_count_query_reads_filters_and_groups():
+    parsed = parse_count_query("SELECT AHRI_REGION, COUNT(*) AS n FROM medical_info "
+                               "WHERE LOWER(C_DB) = 'yes' GROUP BY AHRI_REGION ORDER BY n DESC LIMIT 2")
+    assert parsed is not None
+    assert parsed["limit"] == "2"
+
+
+def test_stale_cube_is_not_used(medical_db, tmp_path):
+    path = str(tmp_path / "medical.db")
+    shutil.copy(medical_db, path)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE ingest_meta SET value = value || '-changed' WHERE key = 'data_version'")
+    assert not cube_is_current(conn)
+    conn.close()
+    pool = ReadOnlyConnectionPool(path)
+    try:
+        assert AggregateRewriter(pool).rewrite("SELECT COUNT(*) FROM medical_info") is None
+    finally:
+        pool.close_all()
+
+
+def test_cube_is_not_built_without_a_data_version(medical_db, tmp_path, caplog):
+    path = str(tmp_path / "medical.db")
+    shutil.copy(medical_db, path)
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            conn.execute("DROP TABLE ingest_meta")
+            conn.execute("DROP TABLE agg_counts")
+        stats = build_cube(conn)
+        assert "skipped" in stats
+        assert "ingest_meta" in caplog.text
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'agg_counts'").fetchone() is None
+    finally:
+        conn.close()
+
+
+def test_numeric_columns_compare_like_the_base_table(tmp_path):
+    # 0/1 answers ingest as INTEGER; '1' matches them in medical_info but not in the untyped cube
+    csv_path, path = str(tmp_path / "numeric.csv"), str(tmp_path / "numeric.db")
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["CASE_ID", "INS_TYPE_EMP", "AHRI_REGION"])
+        writer.writerows([f"C{index}", index % 2, "South" if index % 3 else "West"] for index in range(30))
+    ingest(csv_path, path, rebuild=True)
+    pool = ReadOnlyConnectionPool(path)
+    try:
+        rewriter = AggregateRewriter(pool)
+        for sql in ("SELECT COUNT(*) FROM medical_info WHERE INS_TYPE_EMP = '1'",
+                    "SELECT AHRI_REGION, COUNT(*) FROM medical_info WHERE INS_TYPE_EMP = '1' "
+                    "GROUP BY AHRI_REGION ORDER BY AHRI_REGION"):
+            rewrite = rewriter.rewrite(sql)
+            assert rewrite is None or rows(pool, rewrite[0]) == rows(pool, sql)
+            assert rows(pool, sql)[0][-1] > 0
+        # Grouping by the numeric column is still answered from the cube
+        sql = "SELECT INS_TYPE_EMP, COUNT(*) FROM medical_info GROUP BY INS_TYPE_EMP ORDER BY INS_TYPE_EMP"
+        rewrite = rewriter.rewrite(sql)
+        assert rewrite is not None
+        assert rows(pool, rewrite[0]) == rows(pool, sql)
+    finally:
+        pool.close_all()
@@ -0,0 +1,136 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.responses import JSONResponse
+
+
+@pytest.fixture(scope="module")
+def asgi(text_app):
+    # asgi_app imports text_n_graph1, which has to come from the text_app fixture
+    import asgi_app
+    return asgi_app
+
+
+def held_app():
+    """An ASGI app whose limited requests wait until ``release`` is set."""
+    entered, release = asyncio.Event(), asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["method"] == "POST":
+            entered.set()
+            await release.wait()
+        await JSONResponse({"ok": True})(scope, receive, send)
+
+    return app, entered, release
+
+
+def client(app, address="10.0.0.1"):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(address, 1234)),
+                             base_url="http://testserver")
+
+
+def test_requests_over_the_client_limit_get_429(asgi):
+    async def scenario():
+        app, entered, release = held_app()
+        limiter = asgi.ConcurrencyLimitMiddleware(app, max_total=2, max_per_client=1)
+        async with client(limiter) as first, client(limiter, "10.0.0.2") as other:
+            held = asyncio.ensure_future(first.post("/usa-health", json={"query": "a"}))
+            await entered.wait()
+
+            refused = await first.post("/usa-health", json={"query": "b"})
+            assert refused.status_code == 429
+            assert refused.headers["Retry-After"]
+            assert "client limit" in refused.json()["error"]
+            # Other clients and unlimited routes are not affected
+            assert (await first.get("/usa-health/serving-stats")).status_code == 200
+            assert limiter.summary()["active"] == 1
+
+            release.set()
+            assert (await held).status_code == 200
+            assert (await other.post("/usa-health", json={"query": "c"})).status_code == 200
+            assert (await first.post("/usa-health/", json={"query": "d"})).status_code == 200
+        assert limiter.summary() == {"active": 0, "clients": 0, "rejected": 1, "max_total": 2, "max_per_client": 1}
+
+    asyncio.run(scenario())
+
+
+def test_requests_over_the_server_limit_get_429(asgi):
+    async def scenario():
+        app, entered, release = held_app()
+        limiter = asgi.ConcurrencyLimitMiddleware(app, max_total=1, max_per_client=5)
+        async with client(limiter) as first, client(limiter, "10.0.0.2") as other:
+            held = asyncio.ensure_future(first.post("/usa-health/batch", json={"queries": ["a"]}))
+            await entered.wait()
+            refused = await other.post("/usa-health", json={"query": "b"})
+            assert refused.status_code == 429 and "server limit" in refused.json()["error"]
+            release.set()
+            await held
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_shares_one_run_per_key(asgi):
+    async def scenario():
+        flights = asgi.SingleFlight()
+        runs = []
+
+        async def work(value):
+            runs.append(value)
+            await asyncio.sleep(0.05)
+            return value * 2
+
+        results = await asyncio.gather(*[flights.run("a", lambda: work(1)) for _ in range(5)],
+                                       flights.run("b", lambda: work(10)))
+        assert results == [2] * 5 + [20]
+        assert runs == [1, 10]
+        assert flights.summary() == {"in_flight": 0, "started": 2, "coalesced": 4}
+
+        # Once finished, the key runs again
+        assert await flights.run("a", lambda: work(3)) == 6
+
+    asyncio.run(scenario())
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_run(asgi):
+    async def scenario():
+        flights = asgi.SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leaving = asyncio.ensure_future(flights.run("a", work))
+        staying = asyncio.ensure_future(flights.run("a", work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        assert await staying == "done"
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+
+    asyncio.run(scenario())
+
+
+def test_identical_questions_share_one_translation(text_app, asgi, monkeypatch):
+    app, state = text_app
+
+    question = "Tally the respondents older than sixty, coalesced"
+    state.chat_replies.update({"older than sixty": "SELECT COUNT(*) FROM medical_info WHERE AGE > 60"})
+    # Slow enough that every request joins the first translation
+    monkeypatch.setattr(state, "chat_seconds", 0.3)
+    monkeypatch.setattr(asgi, "flights", asgi.SingleFlight())
+
+    async def scenario():
+        async with client(asgi.app) as http:
+            try:
+                return await asyncio.gather(*[http.post("/usa-health", json={"query": question})
+                                              for _ in range(4)])
+            finally:
+                await app.openai_api.aclose()
+
+    calls = len(state.calls)
+    responses = asyncio.run(scenario())
+    assert [response.status_code for response in responses] == [200] * 4
+    assert len({(response.json()["query"], str(response.json()["data"])) for response in responses}) == 1
+    assert state.calls[calls:].count(("POST", "/chat/completions")) == 1
+    assert asgi.flights.summary()["coalesced"] >= 3
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import openai
+import pytest
+from flask import Flask
+
+from assistant_jobs import JobManager, follow_run, register_job_routes
+
+STREAM = ["thread.created", "thread.run.created", "thread.run.queued", "thread.run.in_progress",
+          "thread.run.step.created", "thread.run.step.in_progress", "thread.message.created",
+          *["thread.message.delta"] * 50, "thread.run.step.delta", "thread.run.in_progress",
+          "thread.message.completed", "thread.run.step.completed", "thread.run.completed", "done"]
+
+
+def wait_until_finished(jobs, job_id):
+    job = jobs.get(job_id)
+    while job["status"] not in ("completed", "failed"):
+        job = jobs.wait_for_change(job_id, job["version"], timeout=5)
+    return job
+
+
+def test_only_run_status_changes_update_the_job():
+    jobs = JobManager()
+    seen = []
+    submitted = threading.Event()
+
+    def work(on_event):
+        submitted.wait(5)
+        for event in STREAM:
+            on_event(event)
+            seen.append(jobs.get(job_id)["event"])
+        return "chart.png"
+
+    job_id = jobs.submit(work)
+    submitted.set()
+    job = wait_until_finished(jobs, job_id)
+    assert job["status"] == "completed"
+    # running, created, queued, in_progress, completed, then the result
+    assert job["version"] == 6
+    assert job["event"] == "thread.run.completed"
+    assert "thread.message.delta" not in seen
+
+
+def test_events_endpoint_sends_one_frame_per_status_change():
+    app = Flask(__name__)
+    jobs = JobManager()
+    register_job_routes(app, jobs)
+    release = threading.Event()
+
+    def work(on_event):
+        release.wait(5)
+        for event in STREAM:
+            on_event(event)
+        return "chart.png"
+
+    with app.test_request_context():
+        job_id = jobs.submit(work)
+        client = app.test_client()
+        response = client.get(f"/usa-health/jobs/{job_id}/events", buffered=False)
+        release.set()
+        body = b"".join(response.response).decode()
+    frames = [frame for frame in body.split("\n\n") if frame.startswith("event: status")]
+    assert len(frames) <= 6
+    assert '"status": "completed"' in frames[-1]
+    assert "delta" not in body
+
+
+def test_stalled_run_stream_is_cancelled_at_the_deadline(openai_stub):
+    state, base_url = openai_stub
+    # The stub sends queued and in_progress, then nothing until the run finishes
+    state.run_seconds = 6
+    client = openai.OpenAI(base_url=base_url, api_key="stub", max_retries=0)
+    thread = client.beta.threads.create()
+    events = []
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        follow_run(client, thread.id, "asst-stub", on_event=events.append, timeout=1.5)
+    assert time.monotonic() - started < 4
+    assert events[0] == "thread.run.queued"
+    assert any(method == "POST" and path.endswith("/cancel") for method, path in state.calls)
+
+
+def test_finished_jobs_expire_on_lookups():
+    jobs = JobManager(ttl=0.2)
+    job_id = jobs.submit(lambda on_event: "chart.png")
+    job = wait_until_finished(jobs, job_id)
+    assert job["status"] == "completed"
+    time.sleep(0.3)
+    assert jobs.get(job_id) is None
+    assert jobs.counts()["completed"] == 0
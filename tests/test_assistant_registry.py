@@ -0,0 +1,103 @@
+import threading
+
+import openai
+import pytest
+
+from assistant_registry import AssistantRegistry, file_sha256
+
+INSTRUCTIONS = "Answer questions about the dataset with charts."
+
+
+@pytest.fixture
+def client(openai_stub):
+    _, base_url = openai_stub
+    return openai.OpenAI(base_url=base_url, api_key="stub", max_retries=0)
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "dataset.csv"
+    path.write_text("AGE,SEX\n45,Female\n61,Male\n")
+    return path
+
+
+def creations(state):
+    return [path for method, path in state.calls if method == "POST" and path in ("/files", "/assistants")]
+
+
+def test_assistant_is_reused_across_calls_and_restarts(openai_stub, client, dataset, tmp_path):
+    state, _ = openai_stub
+    registry_path = str(tmp_path / "registry.json")
+    first = AssistantRegistry(client, path=registry_path).get_assistant_id(str(dataset), INSTRUCTIONS, "charts")
+    registry = AssistantRegistry(client, path=registry_path)
+    assert registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts") == first
+    assert creations(state) == ["/files", "/assistants"]
+    # Other instructions on the same data share the uploaded file
+    assert registry.get_assistant_id(str(dataset), "Other instructions", "charts") != first
+    assert creations(state) == ["/files", "/assistants", "/assistants"]
+
+
+def test_changed_dataset_gets_a_new_upload_and_the_old_one_is_collected(openai_stub, client, dataset, tmp_path):
+    state, _ = openai_stub
+    registry = AssistantRegistry(client, path=str(tmp_path / "registry.json"))
+    old_version = registry.dataset_version(str(dataset))
+    assert old_version == file_sha256(str(dataset))
+    old = registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts")
+
+    dataset.write_text("AGE,SEX\n45,Female\n61,Male\n70,Female\n")
+    assert registry.dataset_version(str(dataset)) != old_version
+    new = registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts")
+    assert new != old
+    assert set(state.assistants) == {new}
+    assert len(state.files) == 1
+
+
+def test_entry_deleted_remotely_is_recreated(openai_stub, client, dataset, tmp_path):
+    state, _ = openai_stub
+    registry = AssistantRegistry(client, path=str(tmp_path / "registry.json"), verify_interval=0)
+    old = registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts")
+    state.assistants.clear()
+    new = registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts")
+    assert new != old
+    assert set(state.assistants) == {new}
+
+
+def test_unused_entries_expire_on_a_later_lookup(openai_stub, client, dataset, tmp_path):
+    state, _ = openai_stub
+    registry = AssistantRegistry(client, path=str(tmp_path / "registry.json"))
+    old = registry.get_assistant_id(str(dataset), "First instructions", "charts")
+    current = registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts")
+    assert {old, current} <= set(state.assistants)
+    registry.max_age, registry.collect_interval = -1, 0
+    # Reusing an assistant creates nothing, but the lookup collects the expired one
+    assert registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts") == current
+    assert old not in state.assistants
+    assert current in state.assistants
+
+
+def test_processes_sharing_the_file_keep_each_others_entries(openai_stub, client, dataset, tmp_path):
+    state, _ = openai_stub
+    registry_path = str(tmp_path / "registry.json")
+    text_app = AssistantRegistry(client, path=registry_path)
+    whole_app = AssistantRegistry(client, path=registry_path)
+    text_id = text_app.get_assistant_id(str(dataset), INSTRUCTIONS, "text app")
+    whole_id = whole_app.get_assistant_id(str(dataset), "Other instructions", "whole app")
+    # Neither write lost the other's assistant, and the upload was shared
+    assert AssistantRegistry(client, path=registry_path).get_assistant_id(
+        str(dataset), INSTRUCTIONS, "text app") == text_id
+    assert text_app.get_assistant_id(str(dataset), "Other instructions", "whole app") == whole_id
+    assert creations(state) == ["/files", "/assistants", "/assistants"]
+
+
+def test_concurrent_lookups_create_one_assistant(openai_stub, client, dataset, tmp_path):
+    state, _ = openai_stub
+    registry = AssistantRegistry(client, path=str(tmp_path / "registry.json"))
+    ids = []
+    threads = [threading.Thread(target=lambda: ids.append(
+        registry.get_assistant_id(str(dataset), INSTRUCTIONS, "charts"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(ids)) == 1
+    assert creations(state) == ["/files", "/assistants"]
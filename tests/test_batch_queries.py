@@ -0,0 +1,155 @@
+import sqlite3
+
+import pytest
+
+from batch_queries import BatchError, execute_all, parse_batch
+from db_pool import ReadOnlyConnectionPool
+
+
+@pytest.mark.parametrize("body", [
+    None,
+    ["How many patients?"],
+    "How many patients?",
+    42,
+    {},
+    {"queries": []},
+    {"queries": "How many patients?"},
+    {"queries": ["How many patients?", "  "]},
+    {"queries": ["How many patients?", 3]},
+])
+def test_malformed_batches_are_rejected(body):
+    with pytest.raises(BatchError):
+        parse_batch(body)
+
+
+def test_batches_are_capped():
+    assert parse_batch({"queries": ["a?", "b?"]}, max_questions=2) == ["a?", "b?"]
+    with pytest.raises(BatchError, match="at most 2"):
+        parse_batch({"queries": ["a?", "b?", "c?"]}, max_questions=2)
+
+
+def test_identical_sql_runs_once():
+    runs = []
+
+    def execute(sql):
+        runs.append(sql)
+        return sql.lower()
+
+    class Pool:
+        def snapshot(self):
+            return sqlite3.connect(":memory:")
+
+    assert execute_all(["SELECT 1", None, "SELECT 1", "SELECT 2"], execute, Pool()) == \
+        ["select 1", None, "select 1", "select 2"]
+    assert runs == ["SELECT 1", "SELECT 2"]
+
+
+def insert_row(db_path, case_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute("INSERT INTO medical_info (CASE_ID) VALUES (?)", (case_id,))
+    finally:
+        conn.close()
+
+
+def delete_row(db_path, case_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM medical_info WHERE CASE_ID = ?", (case_id,))
+    finally:
+        conn.close()
+
+
+def test_a_batch_reads_one_snapshot(text_app, monkeypatch):
+    app, state = text_app
+    dataset = app.catalog.default
+    # Both counts come from medical_info itself (the column store would answer from memory)
+    monkeypatch.setattr(dataset, "column_store", None)
+    db_path = dataset.pool.db_path
+    state.chat_replies.update({
+        "patients before": "SELECT COUNT(*) FROM medical_info",
+        "records after": "SELECT COUNT(CASE_ID) FROM medical_info",
+    })
+    execute = app.execute_query_with_steps
+
+    def execute_then_write(sql, *args):
+        result = execute(sql, *args)
+        # The ingest writer commits between the batch's queries
+        if "COUNT(*)" in sql:
+            insert_row(db_path, "batch-snapshot-test")
+        return result
+
+    monkeypatch.setattr(app, "execute_query_with_steps", execute_then_write)
+    try:
+        with app.app.test_client() as client:
+            response = client.post("/usa-health/batch", json={
+                "queries": ["How many patients before?", "How many records after?"]})
+        assert response.status_code == 200
+        first, second = response.get_json()["results"]
+        assert first["status"] == second["status"] == 200
+        assert first["data"] == second["data"]
+    finally:
+        delete_row(db_path, "batch-snapshot-test")
+
+
+def test_snapshot_spans_every_query_of_the_batch(medical_db, tmp_path):
+    path = str(tmp_path / "medical.db")
+    conn = sqlite3.connect(medical_db)
+    conn.execute("VACUUM INTO ?", (path,))
+    conn.close()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+    pool = ReadOnlyConnectionPool(path)
+    counts = []
+
+    def execute(sql):
+        with pool.cursor() as cursor:
+            cursor.execute(sql)
+            counts.append(cursor.fetchone()[0])
+        insert_row(path, f"row-{len(counts)}")
+        return counts[-1]
+
+    try:
+        results = execute_all(["SELECT COUNT(*) FROM medical_info", "SELECT COUNT(CASE_ID) FROM medical_info",
+                               "SELECT COUNT(1) FROM medical_info"], execute, pool)
+    finally:
+        pool.close_all()
+    assert len(set(results)) == 1
+    assert counts == results
+
+
+def test_batch_endpoint_rejects_malformed_bodies(text_app):
+    app, _ = text_app
+    with app.app.test_client() as client:
+        for body in (["How many patients?"], "How many patients?", {"queries": []}):
+            response = client.post("/usa-health/batch", json=body)
+            assert response.status_code == 400
+            assert "error" in response.get_json()
+        response = client.post("/usa-health/batch", json={"queries": ["How many?"], "dataset": "nope"})
+        assert response.status_code == 400
+
+
+def test_batch_items_fail_on_their_own(text_app):
+    app, state = text_app
+    state.chat_replies.update({
+        "unknown column": "SELECT NO_SUCH_COLUMN FROM medical_info",
+        "women in the survey": "SELECT COUNT(*) FROM medical_info WHERE SEX = 'Female'",
+    })
+    with app.app.test_client() as client:
+        response = client.post("/usa-health/batch", json={"queries": [
+            "Count patients by an unknown column",
+            "Plot patients by region as a bar chart",
+            "How many women in the survey?",
+            "How many women in the survey?",
+        ]})
+    assert response.status_code == 200
+    body = response.get_json()
+    statuses = [result["status"] for result in body["results"]]
+    assert statuses[0] == 400 and "error" in body["results"][0]
+    assert statuses[1] == 400 and "batched" in body["results"][1]["error"]
+    assert statuses[2] == statuses[3] == 200
+    assert body["results"][2]["data"] == body["results"][3]["data"]
+    assert body["distinct_queries"] == 2
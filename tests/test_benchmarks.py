@@ -0,0 +1,26 @@
+from benchmarks.compare import compare
+from benchmarks.run import percentiles
+
+
+def _report(p95_ms, throughput):
+    level = {"concurrency": 4, "throughput_rps": throughput,
+             "paths": {"text": {"p50_ms": 10.0, "p95_ms": p95_ms, "p99_ms": p95_ms * 2}}}
+    return {"meta": {"commit": "abc", "created_at": "now"},
+            "datasets": [{"rows": 5000, "serve": {"levels": [level]}}]}
+
+
+def test_percentiles():
+    stats = percentiles([i / 1000 for i in range(1, 101)])
+    assert stats["count"] == 100
+    assert stats["p50_ms"] == 51.0
+    assert stats["p95_ms"] == 96.0
+    assert stats["max_ms"] == 100.0
+
+
+def test_compare_flags_slower_p95_and_lower_throughput():
+    regressions = compare(_report(100.0, 50.0), _report(150.0, 30.0), threshold=10)
+    assert len(regressions) == 2
+
+
+def test_compare_tolerates_changes_under_threshold():
+    assert compare(_report(100.0, 50.0), _report(105.0, 48.0), threshold=10) == []
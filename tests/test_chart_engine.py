@@ -0,0 +1,135 @@
+import io
+
+import pytest
+from PIL import Image
+
+import chart_engine
+from chart_engine import CHART_TYPES, ChartSpecError, render_chart, validate_spec
+from chart_store import ChartStore
+from db_pool import ReadOnlyConnectionPool
+
+SPECS = {
+    "bar": {"sql": "SELECT AHRI_REGION, COUNT(*) AS n FROM medical_info GROUP BY AHRI_REGION",
+            "chart_type": "bar", "x": "AHRI_REGION", "y": "n"},
+    "stacked_bar": {"sql": "SELECT AHRI_REGION, SEX, COUNT(*) AS n FROM medical_info GROUP BY AHRI_REGION, SEX",
+                    "chart_type": "stacked_bar", "x": "AHRI_REGION", "y": "n", "group": "SEX"},
+    "line": {"sql": "SELECT AGE, COUNT(*) AS n FROM medical_info GROUP BY AGE ORDER BY AGE",
+             "chart_type": "line", "x": "AGE", "y": "n"},
+    "pie": {"sql": "SELECT INCOME, COUNT(*) AS n FROM medical_info GROUP BY INCOME",
+            "chart_type": "pie", "x": "INCOME", "y": "n"},
+    "histogram": {"sql": "SELECT AGE FROM medical_info", "chart_type": "histogram", "x": "AGE"},
+    "scatter": {"sql": "SELECT AGE, AHRI_CCI_SCORE FROM medical_info",
+                "chart_type": "scatter", "x": "AGE", "y": "AHRI_CCI_SCORE"},
+}
+
+
+@pytest.fixture(scope="module")
+def pool(medical_db):
+    pool = ReadOnlyConnectionPool(medical_db)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChartStore(str(tmp_path / "artifacts"))
+
+
+@pytest.fixture
+def drawn(monkeypatch):
+    """The axes of every chart drawn during the test."""
+    axes = []
+    draw = chart_engine._draw
+
+    def record(ax, *args):
+        draw(ax, *args)
+        axes.append(ax)
+
+    monkeypatch.setattr(chart_engine, "_draw", record)
+    return axes
+
+
+def scalar(pool, sql):
+    with pool.cursor() as cursor:
+        return cursor.execute(sql).fetchone()[0]
+
+
+def test_every_chart_type_has_a_spec():
+    assert set(SPECS) == set(CHART_TYPES)
+
+
+@pytest.mark.parametrize("chart_type", CHART_TYPES)
+def test_each_chart_type_renders(pool, store, drawn, chart_type):
+    spec = validate_spec(dict(SPECS[chart_type], title=f"A {chart_type} chart"))
+    artifact, cached = render_chart(spec, pool, store)
+    assert not cached
+    with open(artifact.path, "rb") as f:
+        image = Image.open(io.BytesIO(f.read()))
+    assert image.format == "PNG" and image.size == (1000, 600)
+
+    ax, = drawn
+    assert ax.get_title() == f"A {chart_type} chart"
+    regions = scalar(pool, "SELECT COUNT(DISTINCT AHRI_REGION) FROM medical_info")
+    if chart_type == "bar":
+        assert len(ax.patches) == regions
+        assert sum(bar.get_height() for bar in ax.patches) == scalar(pool, "SELECT COUNT(*) FROM medical_info")
+    elif chart_type == "stacked_bar":
+        assert len(ax.patches) == regions * scalar(pool, "SELECT COUNT(DISTINCT SEX) FROM medical_info")
+        assert ax.get_legend().get_title().get_text() == "SEX"
+    elif chart_type == "line":
+        assert len(ax.lines[0].get_xdata()) == scalar(pool, "SELECT COUNT(DISTINCT AGE) FROM medical_info")
+    elif chart_type == "pie":
+        assert len(ax.patches) == scalar(pool, "SELECT COUNT(DISTINCT INCOME) FROM medical_info")
+    elif chart_type == "histogram":
+        # Weighted by the per-value counts, the bins add up to every row
+        assert sum(bar.get_height() for bar in ax.patches) == scalar(
+            pool, "SELECT COUNT(AGE) FROM medical_info")
+    else:
+        assert len(ax.collections[0].get_offsets()) == scalar(
+            pool, "SELECT COUNT(*) FROM medical_info WHERE AGE IS NOT NULL AND AHRI_CCI_SCORE IS NOT NULL")
+
+
+def test_repeated_charts_come_from_the_store(pool, store, drawn):
+    spec = validate_spec(SPECS["bar"])
+    first, cached = render_chart(spec, pool, store, fmt="svg")
+    assert not cached and first.path.endswith(".svg")
+    second, cached = render_chart(spec, pool, store, fmt="svg")
+    assert cached and second == first
+    assert len(drawn) == 1
+
+
+def test_pies_fold_the_smallest_slices(pool, store, drawn, monkeypatch):
+    monkeypatch.setattr(chart_engine, "MAX_CATEGORIES", 3)
+    render_chart(validate_spec(SPECS["pie"]), pool, store)
+    labels = [text.get_text() for text in drawn[0].texts if "%" not in text.get_text()]
+    assert len(labels) == 3 and labels[-1] == "other"
+
+
+@pytest.mark.parametrize("spec, message", [
+    ({"supported": False}, "can't be expressed"),
+    (dict(SPECS["bar"], sql="DELETE FROM medical_info"), "single SELECT"),
+    (dict(SPECS["bar"], sql="SELECT 1; SELECT 2"), "single SELECT"),
+    (dict(SPECS["bar"], chart_type="radar"), "Unsupported chart type"),
+    (dict(SPECS["bar"], x=None), "no x field"),
+    (dict(SPECS["line"], y=None), "needs a y field"),
+    (dict(SPECS["stacked_bar"], group=None), "needs a group field"),
+])
+def test_invalid_specs_are_rejected(spec, message):
+    with pytest.raises(ChartSpecError, match=message):
+        validate_spec(spec)
+
+
+def test_validate_spec_fills_in_defaults():
+    spec = validate_spec(dict(SPECS["histogram"], sql=SPECS["histogram"]["sql"] + ";"))
+    assert spec["sql"] == "SELECT AGE FROM medical_info"
+    assert (spec["y"], spec["group"], spec["x_label"], spec["y_label"]) == (None, None, "AGE", "count")
+
+
+@pytest.mark.parametrize("spec, fmt, message", [
+    (SPECS["bar"], "gif", "Unsupported image format"),
+    (dict(SPECS["bar"], y="missing"), "png", "no column 'missing'"),
+    (dict(SPECS["bar"], sql="SELECT AHRI_REGION, 1 AS n FROM medical_info WHERE 0"), "png", "no rows"),
+])
+def test_render_errors_are_spec_errors(pool, store, spec, fmt, message):
+    with pytest.raises(ChartSpecError, match=message):
+        render_chart(validate_spec(spec), pool, store, fmt=fmt)
@@ -0,0 +1,89 @@
+import io
+import os
+import shutil
+
+import pytest
+from flask import Flask
+from PIL import Image
+
+from assistant_jobs import JobManager, register_job_routes
+from chart_store import ChartStore, artifact_key
+
+
+def png(color, size=(40, 20)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChartStore(str(tmp_path / "artifacts"))
+
+
+def test_same_image_is_stored_once(store):
+    first = store.put("a", png("red"), "png")
+    second = store.put("b", png("red"), "png")
+    assert first.path == second.path
+    assert store.get("a") == store.get("b") == first
+    assert store.summary()["entries"] == 2
+
+
+def test_put_recreates_a_removed_directory(store):
+    store.put("a", png("red"), "png")
+    shutil.rmtree(store.root)
+    artifact = store.put("b", png("blue"), "png")
+    assert os.path.exists(artifact.path)
+    assert store.get("a") is None
+
+
+def test_clear_drops_entries_and_files(store):
+    artifact = store.put("a", png("red"), "png")
+    store.get("a")
+    store.clear()
+    assert not os.path.exists(artifact.path)
+    assert store.get("a") is None
+    assert store.summary()["entries"] == 0
+    assert store.stats["hits"] == 0
+    assert os.path.exists(store.put("a", png("red"), "png").path)
+
+
+def test_eviction_keeps_recent_unreferenced_files(tmp_path):
+    store = ChartStore(str(tmp_path / "artifacts"), max_bytes=1)
+    # Written by a put() in another process that hasn't linked it yet
+    pending = os.path.join(store.root, "f" * 64 + ".png")
+    with open(pending, "wb") as f:
+        f.write(png("green"))
+    first = store.put("a", png("red"), "png")
+    store.put("b", png("blue"), "png")
+    assert os.path.exists(pending)
+    assert store.get("a") is None
+    os.utime(pending, (0, 0))
+    os.utime(first.path, (0, 0))
+    store.put("c", png("yellow"), "png")
+    assert not os.path.exists(pending)
+    assert not os.path.exists(first.path)
+
+
+def test_variant_is_scaled_and_cached(store):
+    artifact = store.put(artifact_key("plot ages", 1), png("red", (400, 200)), "png")
+    small = store.variant(artifact, "webp", 100)
+    assert small.ext == "webp"
+    with Image.open(small.path) as image:
+        assert image.size == (100, 50)
+    assert store.variant(artifact, "webp", 100) == small
+
+
+def test_job_result_after_eviction_is_gone(store):
+    app = Flask(__name__)
+    jobs = JobManager()
+    register_job_routes(app, jobs)
+    artifact = store.put("a", png("red"), "png")
+    job_id = jobs.submit(lambda on_event: artifact.path)
+    client = app.test_client()
+    job = jobs.get(job_id)
+    while job["status"] != "completed":
+        job = jobs.wait_for_change(job_id, job["version"], timeout=5)
+    assert client.get(f"/usa-health/jobs/{job_id}/result").status_code == 200
+    store.clear()
+    assert client.get(f"/usa-health/jobs/{job_id}/result").status_code == 410
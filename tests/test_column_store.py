@@ -0,0 +1,96 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from column_store import ColumnStore, _ColumnBuilder, scan_table
+from db_pool import ReadOnlyConnectionPool
+
+
+@pytest.fixture(scope="module")
+def pool(medical_db):
+    pool = ReadOnlyConnectionPool(medical_db)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture(scope="module")
+def store(pool, tmp_path_factory):
+    store = ColumnStore(pool, directory=str(tmp_path_factory.mktemp("column_store") / "default"))
+    store.load()
+    return store
+
+
+def rows(medical_db, sql):
+    conn = sqlite3.connect(medical_db)
+    try:
+        cursor = conn.execute(sql)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM medical_info",
+    "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'yes'",
+    "SELECT COUNT(*) AS n FROM medical_info WHERE C_DB = 'YES'",
+    "SELECT COUNT(*) FROM medical_info WHERE LOWER(C_DB) = 'yes' AND AHRI_REGION = 'South'",
+    "SELECT AHRI_REGION, COUNT(*) FROM medical_info GROUP BY AHRI_REGION ORDER BY AHRI_REGION",
+    "SELECT COUNT(*), AHRI_REGION FROM medical_info WHERE SEX = 'Female' GROUP BY AHRI_REGION ORDER BY COUNT(*) DESC",
+    "SELECT AHRI_REGION, INCOME, COUNT(*) AS n FROM medical_info WHERE C_HYPERTEN = 'yes' "
+    "GROUP BY AHRI_REGION, INCOME ORDER BY n DESC, AHRI_REGION, INCOME LIMIT 7",
+    "SELECT LOWER(SEX), COUNT(*) FROM medical_info GROUP BY LOWER(SEX) ORDER BY 2",
+    "SELECT AGE, COUNT(*) FROM medical_info GROUP BY AGE ORDER BY AGE DESC LIMIT 5",
+])
+def test_counts_match_sqlite(medical_db, store, sql):
+    answer = store.execute(sql)
+    assert answer is not None, sql
+    assert answer == rows(medical_db, sql)
+
+
+def test_other_queries_fall_back(store):
+    assert store.execute("SELECT AVG(AGE) FROM medical_info") is None
+
+
+def test_the_snapshot_is_read_back(pool, store):
+    reloaded = ColumnStore(pool, directory=store.directory)
+    table = reloaded.load()
+    assert reloaded.last_load["source"] == "snapshot"
+    assert table.rows == store.current().rows
+    assert reloaded.execute("SELECT SEX, COUNT(*) FROM medical_info GROUP BY SEX") == \
+        store.execute("SELECT SEX, COUNT(*) FROM medical_info GROUP BY SEX")
+
+
+def test_scan_keeps_types_and_nulls(tmp_path, monkeypatch):
+    monkeypatch.setattr("column_store.LOAD_BATCH_ROWS", 2)
+    monkeypatch.setattr("column_store.MAX_CATEGORIES", 3)
+    conn = sqlite3.connect(str(tmp_path / "small.db"))
+    conn.execute("CREATE TABLE medical_info (AGE INTEGER, SCORE REAL, SEX TEXT, NOTE TEXT, MIXED TEXT)")
+    conn.executemany("INSERT INTO medical_info VALUES (?, ?, ?, ?, ?)", [
+        (40, 1.5, "Female", "a", "x"),
+        (None, None, None, "b", "y"),
+        (2 ** 40, 2.5, "Male", "c", 3),
+        (7, 0.0, "Female", "d", "z"),
+        (8, 4.0, "Male", "e", "w"),
+    ])
+    rows, columns = scan_table(conn)
+    conn.close()
+
+    columns = {column.name: column for column in columns}
+    assert rows == 5
+    # Too many distinct answers, or text mixed with numbers
+    assert set(columns) == {"AGE", "SCORE", "SEX"}
+    assert columns["AGE"].values.dtype == np.int64
+    assert columns["AGE"].values.tolist() == [40, 0, 2 ** 40, 7, 8]
+    assert columns["AGE"].null_mask().tolist() == [False, True, False, False, False]
+    assert np.isnan(columns["SCORE"].values[1])
+    assert [columns["SEX"].vocabulary[code] for code in columns["SEX"].values] == \
+        ["Female", None, "Male", "Female", "Male"]
+
+
+def test_rows_added_after_the_count_still_load():
+    builder = _ColumnBuilder("SEX", "TEXT", 1)
+    builder.add(("Female", "Male"))
+    builder.add(("Male",))
+    column = builder.finish()
+    assert [column.vocabulary[code] for code in column.values] == ["Female", "Male", "Male"]
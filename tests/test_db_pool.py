@@ -0,0 +1,112 @@
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+from db_pool import ReadOnlyConnectionPool
+from ingest_csv import TABLE_NAME
+
+
+@pytest.fixture
+def pool(medical_db):
+    pool = ReadOnlyConnectionPool(medical_db, pool_size=2)
+    yield pool
+    pool.close_all()
+
+
+def count_rows(pool):
+    with pool.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
+        return cursor.fetchone()[0]
+
+
+def test_connections_are_reused(pool):
+    count_rows(pool)
+    count_rows(pool)
+    assert len(pool._connections) == 1
+
+
+def test_many_threads_keep_at_most_pool_size_open(pool):
+    barrier = threading.Barrier(20)
+
+    def work():
+        with pool.cursor() as cursor:
+            barrier.wait()
+            cursor.execute("SELECT 1")
+
+    for _ in range(3):
+        threads = [threading.Thread(target=work) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Twenty ran at once, but only pool_size stay open afterwards
+        assert len(pool._connections) == 2
+
+
+def test_snapshot_pins_one_connection(pool):
+    with pool.snapshot() as conn:
+        with pool.cursor() as cursor:
+            assert cursor.connection is conn
+    assert len(pool._connections) == 1
+
+
+def test_broken_connection_is_not_returned(pool):
+    with pytest.raises(sqlite3.ProgrammingError):
+        with pool.cursor() as cursor:
+            cursor.connection.close()
+            cursor.execute("SELECT 1")
+    assert pool._connections == set()
+    assert count_rows(pool) > 0
+
+
+def test_connections_reopen_after_rebuild(medical_db, tmp_path):
+    path = tmp_path / "medical.db"
+    shutil.copy(medical_db, path)
+    pool = ReadOnlyConnectionPool(str(path), pool_size=2)
+    try:
+        count_rows(pool)
+        (first, _), = list(pool._idle.queue)
+        path.unlink()
+        shutil.copy(medical_db, path)
+        count_rows(pool)
+        assert first not in pool._connections
+        assert len(pool._connections) == 1
+    finally:
+        pool.close_all()
+
+
+def test_checkouts_past_max_connections_wait(medical_db):
+    pool = ReadOnlyConnectionPool(medical_db, pool_size=1, max_connections=2, checkout_timeout=0.2)
+    try:
+        with pool.cursor(), pool.cursor():
+            # A third has to wait for one of the two, and gives up after the timeout
+            with pytest.raises(sqlite3.OperationalError, match="in use"):
+                count_rows(pool)
+            assert len(pool._connections) == 2
+
+        held, release = threading.Barrier(3), threading.Event()
+        counted = []
+
+        def hold():
+            with pool.cursor():
+                held.wait(5)
+                release.wait(5)
+
+        holders = [threading.Thread(target=hold) for _ in range(2)]
+        waiter = threading.Thread(target=lambda: counted.append(count_rows(pool)))
+        for thread in holders:
+            thread.start()
+        held.wait(5)
+        waiter.start()
+        waiter.join(0.05)
+        assert not counted
+        release.set()
+        waiter.join(5)
+        assert counted and counted[0] > 0
+        for thread in holders:
+            thread.join()
+        assert len(pool._connections) == 1
+    finally:
+        pool.close_all()
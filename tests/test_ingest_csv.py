@@ -0,0 +1,100 @@
+import csv
+import logging
+import sqlite3
+
+import pytest
+
+from ingest_csv import infer_column_types, ingest, widen_column_types
+
+
+def write_csv(path, header, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+    return str(path)
+
+
+def read_table(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def declared_types(db_path):
+    return {name: kind for _, name, kind, _, _, _ in read_table(db_path, "PRAGMA table_info(medical_info)")}
+
+
+def test_types_are_inferred_from_the_first_chunk():
+    header = ["CASE_ID", "AGE", "SCORE", "RATIO", "SEX", "EMPTY"]
+    rows = [["1", "40", "3", "0.5", "Female", ""], ["2", "n/a", "4", "1", "Male", " "]]
+    assert infer_column_types(header, rows) == {
+        "CASE_ID": "TEXT", "AGE": "INTEGER", "SCORE": "INTEGER", "RATIO": "REAL", "SEX": "TEXT", "EMPTY": "TEXT"}
+
+
+def test_widening_follows_the_values():
+    header = ["CASE_ID", "AGE", "SCORE", "RATIO"]
+    types = {"CASE_ID": "TEXT", "AGE": "INTEGER", "SCORE": "INTEGER", "RATIO": "REAL"}
+    assert widen_column_types(header, types, [["1", "40", "3", "0.5"]]) == {}
+    assert widen_column_types(header, types, [["2", "40.5", "2.5", "x"], ["3", "", "y"]]) == \
+        {"AGE": "REAL", "SCORE": "TEXT", "RATIO": "TEXT"}
+
+
+def test_later_chunks_widen_the_column_types(tmp_path, caplog):
+    rows = [[str(i), str(30 + i), str(i % 3), str(i)] for i in range(6)]
+    rows += [["6", "41.5", "unknown", "2.5"], ["7", "not stated", "1", "3"]]
+    csv_path = write_csv(tmp_path / "survey.csv", ["CASE_ID", "AGE", "SCORE", "VISITS"], rows)
+    db_path = str(tmp_path / "medical.db")
+
+    with caplog.at_level(logging.WARNING, logger="ingest_csv"):
+        stats = ingest(csv_path, db_path, chunk_rows=3, rebuild=True)
+    assert stats["widened"] == {"AGE": "REAL", "SCORE": "TEXT", "VISITS": "REAL"}
+    assert "Widening" in caplog.text and "free-text" in caplog.text
+    assert declared_types(db_path) == {"CASE_ID": "TEXT", "AGE": "REAL", "SCORE": "TEXT", "VISITS": "REAL"}
+
+    # No mixed storage classes in a widened column
+    assert read_table(db_path, "SELECT DISTINCT typeof(SCORE), typeof(VISITS) FROM medical_info") == \
+        [("text", "real")]
+    assert read_table(db_path, "SELECT COUNT(*) FROM medical_info WHERE SCORE = '1'") == [(3,)]
+    # AGE is always a number; free text there is kept as it was
+    assert read_table(db_path, "SELECT typeof(AGE), COUNT(*) FROM medical_info GROUP BY 1 ORDER BY 1") == \
+        [("real", 7), ("text", 1)]
+    # Upserts still find the key after the table was recreated; rows stored
+    # before the widening are rewritten once with the wider types
+    stats = ingest(csv_path, db_path, chunk_rows=3)
+    assert (stats["unchanged"], stats["inserted_or_updated"]) == (2, 6)
+    assert "widened" not in stats
+    assert ingest(csv_path, db_path, chunk_rows=3)["unchanged"] == 8
+
+
+def test_an_existing_table_keeps_and_widens_its_declared_types(tmp_path):
+    db_path = str(tmp_path / "medical.db")
+    ingest(write_csv(tmp_path / "first.csv", ["CASE_ID", "SCORE"], [["1", "5"], ["2", "6"]]), db_path)
+    assert declared_types(db_path)["SCORE"] == "INTEGER"
+
+    stats = ingest(write_csv(tmp_path / "second.csv", ["CASE_ID", "SCORE"], [["3", "high"]]), db_path)
+    assert stats["widened"] == {"SCORE": "TEXT"}
+    assert read_table(db_path, "SELECT CASE_ID, SCORE, typeof(SCORE) FROM medical_info ORDER BY CASE_ID") == \
+        [("1", "5", "text"), ("2", "6", "text"), ("3", "high", "text")]
+
+
+def test_reingest_skips_unchanged_rows_and_prunes(tmp_path):
+    header = ["CASE_ID", "SEX", "C_DB"]
+    db_path = str(tmp_path / "medical.db")
+    stats = ingest(write_csv(tmp_path / "a.csv", header, [["1", "Female", "Yes"], ["2", "Male", " N "]]), db_path)
+    assert stats["inserted_or_updated"] == 2 and stats["data_version"] == 1
+    # Yes/no answers are normalized
+    assert read_table(db_path, "SELECT C_DB FROM medical_info ORDER BY CASE_ID") == [("yes",), ("no",)]
+
+    stats = ingest(write_csv(tmp_path / "b.csv", header, [["1", "Female", "Yes"], ["3", "Female", "No"]]),
+                   db_path, prune=True)
+    assert (stats["unchanged"], stats["inserted_or_updated"], stats["pruned"]) == (1, 1, 1)
+    assert stats["data_version"] == 2
+    assert read_table(db_path, "SELECT CASE_ID FROM medical_info ORDER BY CASE_ID") == [("1",), ("3",)]
+
+
+def test_a_csv_without_the_key_column_is_refused(tmp_path):
+    with pytest.raises(ValueError, match="CASE_ID"):
+        ingest(write_csv(tmp_path / "bad.csv", ["ID", "AGE"], [["1", "40"]]), str(tmp_path / "medical.db"))
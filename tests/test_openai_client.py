@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+import openai
+import pytest
+import requests
+
+import openai_stub
+from openai_client import CircuitBreaker, CircuitOpenError, OpenAIClient
+
+PAYLOAD = {"model": "gpt-4o", "messages": [{"role": "user", "content": "How many patients?"}]}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr("openai_client.BACKOFF_BASE", 0.001)
+
+
+def fail_first(monkeypatch, state, failures):
+    """Have the stub answer the next ``failures`` chat completions with a 503."""
+    outcomes = iter([0.0] * failures)
+    state.failure_rate, state.failure_statuses = 0.5, (503,)
+    monkeypatch.setattr(openai_stub.random, "random", lambda: next(outcomes, 1.0))
+
+
+def chat_calls(state):
+    return sum(path == "/chat/completions" for _, path in state.calls)
+
+
+def test_failed_attempts_are_retried(openai_stub, monkeypatch):
+    state, base_url = openai_stub
+    fail_first(monkeypatch, state, 2)
+    client = OpenAIClient(api_key="test", base_url=base_url, max_retries=3)
+    body = client.chat_completion(PAYLOAD)
+    assert body["choices"][0]["message"]["content"]
+    assert chat_calls(state) == 3
+    assert client.summary()["calls"]["chat"]["retries"] == 2
+    assert client.breaker.state == "closed"
+
+
+def test_retries_give_up_after_max_retries(openai_stub):
+    state, base_url = openai_stub
+    state.failure_rate, state.failure_statuses = 1.0, (503,)
+    client = OpenAIClient(api_key="test", base_url=base_url, max_retries=2, breaker=CircuitBreaker(threshold=10))
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.chat_completion(PAYLOAD)
+    assert chat_calls(state) == 3
+
+
+def test_async_calls_retry_too(openai_stub, monkeypatch):
+    state, base_url = openai_stub
+    fail_first(monkeypatch, state, 1)
+    client = OpenAIClient(api_key="test", base_url=base_url, max_retries=2)
+
+    async def call():
+        try:
+            return await client.achat_completion(PAYLOAD)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(call())["choices"]
+    assert chat_calls(state) == 2
+
+
+def test_breaker_opens_fails_fast_and_closes_after_a_good_trial(openai_stub):
+    state, base_url = openai_stub
+    state.failure_rate, state.failure_statuses = 1.0, (503,)
+    breaker = CircuitBreaker(threshold=2, cooldown=0.2)
+    client = OpenAIClient(api_key="test", base_url=base_url, max_retries=1, breaker=breaker)
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.chat_completion(PAYLOAD)
+    assert breaker.state == "open"
+
+    calls = chat_calls(state)
+    with pytest.raises(CircuitOpenError):
+        client.chat_completion(PAYLOAD)
+    assert chat_calls(state) == calls
+
+    time.sleep(0.25)
+    assert breaker.state == "half_open"
+    state.failure_rate = 0.0
+    client.chat_completion(PAYLOAD)
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = CircuitBreaker(threshold=3, cooldown=0.05)
+    for _ in range(3):
+        breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    # Only one trial at a time
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_local_client_errors_leave_the_breaker_alone(openai_stub):
+    state, base_url = openai_stub
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    client = OpenAIClient(api_key="test", base_url=base_url, max_retries=0, breaker=breaker)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+
+    # A malformed URL fails in requests before anything is sent
+    misconfigured = OpenAIClient(api_key="test", base_url="api.openai.invalid/v1", breaker=breaker)
+    with pytest.raises(requests.exceptions.MissingSchema):
+        misconfigured.chat_completion(PAYLOAD)
+    assert breaker.state == "half_open"
+    # The trial slot was given back, so the next call can still test upstream
+    client.chat_completion(PAYLOAD)
+    assert breaker.state == "closed"
+
+
+def test_sdk_calls_share_the_breaker_and_fail_fast_when_open(openai_stub):
+    state, base_url = openai_stub
+    state.failure_rate, state.failure_statuses = 1.0, (503,)
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    client = OpenAIClient(api_key="test", base_url=base_url, max_retries=1, breaker=breaker)
+    with pytest.raises(openai.InternalServerError):
+        client.sdk.chat.completions.create(**PAYLOAD)
+    assert breaker.state == "open"
+    assert client.stats.summary()["sdk chat"]["errors"] == 2
+
+    calls = chat_calls(state)
+    started = time.perf_counter()
+    with pytest.raises(openai.InternalServerError, match="circuit breaker is open"):
+        client.sdk.chat.completions.create(**PAYLOAD)
+    # Not retried by the SDK: one refusal, nothing sent upstream, no backoff
+    assert time.perf_counter() - started < 0.2
+    assert chat_calls(state) == calls
+    assert client.stats.summary()["sdk chat"]["calls"] == 3
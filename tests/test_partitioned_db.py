@@ -0,0 +1,123 @@
+import sqlite3
+
+import pytest
+
+from partitioned_db import FanOut, PartitionedPool, WorkerPool, plan_fanout, split_database
+from sql_guard import QueryRejected, QueryTimeout
+
+
+@pytest.fixture(scope="module")
+def partitions(medical_db, tmp_path_factory):
+    directory = tmp_path_factory.mktemp("partitions")
+    split = split_database(medical_db, "AHRI_REGION", str(directory / "medical_{value}.db"))
+    return [part["path"] for part in split["partitions"]]
+
+
+@pytest.fixture(scope="module")
+def pool(partitions):
+    pool = PartitionedPool(partitions)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture(scope="module")
+def fanout(pool):
+    return FanOut(pool, min_bytes=0)
+
+
+def base_rows(medical_db, sql):
+    conn = sqlite3.connect(medical_db)
+    try:
+        cursor = conn.execute(sql)
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def same_rows(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        assert list(got) == [pytest.approx(value) if isinstance(value, float) else value for value in want]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM medical_info",
+    "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'yes'",
+    "SELECT AHRI_REGION, COUNT(*) FROM medical_info GROUP BY AHRI_REGION ORDER BY AHRI_REGION",
+    "SELECT SEX, AVG(AGE) AS mean_age, MIN(AGE), MAX(AGE) FROM medical_info GROUP BY SEX ORDER BY SEX",
+    "SELECT INCOME, SUM(AGE), COUNT(*) AS n FROM medical_info WHERE C_HYPERTEN = 'yes' "
+    "GROUP BY INCOME ORDER BY n DESC, INCOME LIMIT 3",
+    "SELECT AVG(AGE), TOTAL(AGE) FROM medical_info WHERE SEX = 'Female'",
+    "SELECT COUNT(*), SEX FROM medical_info GROUP BY SEX ORDER BY SEX",
+    # Aliases without AS
+    "SELECT AHRI_REGION, COUNT(*) c FROM medical_info GROUP BY AHRI_REGION ORDER BY c DESC, AHRI_REGION",
+    "SELECT SEX sex_answer, AVG(AGE) \"mean age\" FROM medical_info GROUP BY sex_answer ORDER BY 1",
+    "SELECT SUM(CASE WHEN SEX = 'Male' THEN 1 ELSE 0 END) FROM medical_info",
+])
+def test_fanout_matches_the_single_file(medical_db, fanout, sql):
+    plan = fanout.plan(sql)
+    assert plan is not None, sql
+    columns, rows = fanout.run(plan)
+    expected_columns, expected_rows = base_rows(medical_db, sql)
+    assert columns == expected_columns
+    same_rows(rows, expected_rows)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM medical_info LIMIT 5",
+    "SELECT COUNT(DISTINCT SEX) FROM medical_info",
+    "SELECT SEX, COUNT(*) FROM medical_info GROUP BY SEX HAVING COUNT(*) > 10",
+    "SELECT COUNT(*) FROM other_table",
+])
+def test_plan_refuses_what_does_not_decompose(sql):
+    assert plan_fanout(sql) is None
+
+
+def test_small_datasets_skip_the_fanout(pool):
+    assert FanOut(pool, min_bytes=pool.total_bytes() + 1).plan("SELECT COUNT(*) FROM medical_info") is None
+
+
+def test_no_fanout_inside_a_snapshot(pool, fanout):
+    sql = "SELECT COUNT(*) FROM medical_info"
+    with pool.snapshot():
+        assert fanout.plan(sql) is None
+    assert fanout.plan(sql) is not None
+
+
+@pytest.mark.parametrize("partial, error, message", [
+    ("SELECT COUNT(*) AS a0 FROM medical_info a, medical_info b", QueryRejected, "Query rejected: "),
+    ("WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r) SELECT COUNT(*) AS a0 FROM r",
+     QueryTimeout, "Query stopped: "),
+])
+def test_guardrails_on_the_partitions_reach_steps(fanout, partial, error, message):
+    plan = {"partial": partial, "final": "SELECT SUM(a0) FROM partials", "columns": ["a0"]}
+    steps = []
+    with pytest.raises(error):
+        fanout.run(plan, time_budget=0.2, steps=steps)
+    assert sum(step.startswith(message) for step in steps) == 1
+
+
+def test_worker_errors_reach_the_caller(partitions):
+    workers = WorkerPool(size=1)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="no such column"):
+            workers.submit(partitions[0], "SELECT NOPE FROM medical_info", 5).result()
+        # The worker survives a failed query
+        assert workers.submit(partitions[0], "SELECT COUNT(*) FROM medical_info", 5).result()[0][0] > 0
+    finally:
+        workers.shutdown()
+
+
+def test_a_dead_worker_is_replaced(partitions):
+    workers = WorkerPool(size=1)
+    try:
+        workers.submit(partitions[0], "SELECT 1", 5).result()
+        dead = workers._idle.get_nowait()
+        dead.kill()
+        dead.wait()
+        workers._idle.put(dead)
+        with pytest.raises(RuntimeError, match="exited"):
+            workers.submit(partitions[0], "SELECT 1", 5).result()
+        assert workers.submit(partitions[0], "SELECT 1", 5).result() == [(1,)]
+    finally:
+        workers.shutdown()
@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from db_pool import ReadOnlyConnectionPool
+from query_router import IntentClassifier, QueryRouter, TemplateParser
+
+
+@pytest.fixture(scope="module")
+def pool(medical_db):
+    pool = ReadOnlyConnectionPool(medical_db)
+    yield pool
+    pool.close_all()
+
+
+@pytest.fixture(scope="module")
+def parser(pool):
+    return TemplateParser(pool)
+
+
+@pytest.mark.parametrize("question, sql", [
+    ("How many patients have diabetes?", "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'yes'"),
+    ("How many patients do not have diabetes?", "SELECT COUNT(*) FROM medical_info WHERE C_DB = 'no'"),
+    ("How many diabetic patients live in the South?",
+     "SELECT COUNT(*) FROM medical_info WHERE AHRI_REGION = 'South' AND C_DB = 'yes'"),
+    ("How many patients have hypertension in each region?",
+     "SELECT AHRI_REGION, COUNT(*) FROM medical_info WHERE C_HYPERTEN = 'yes' GROUP BY AHRI_REGION"),
+    ("How many patients without diabetes by region?",
+     "SELECT AHRI_REGION, COUNT(*) FROM medical_info WHERE C_DB = 'no' GROUP BY AHRI_REGION"),
+    ("Number of patients per income bracket", "SELECT INCOME, COUNT(*) FROM medical_info GROUP BY INCOME"),
+])
+def test_templated_questions(parser, question, sql):
+    assert parser.sql(question) == sql
+
+
+@pytest.mark.parametrize("question", [
+    # The negation could belong to the region or to the condition
+    "how many patients with diabetes are not in the south",
+    "how many women in the west are not diabetic",
+    # "mammogram" appears in dozens of column descriptions
+    "how many patients had a mammogram",
+    # Medicaid is both an insurance type and a benefit
+    "how many patients have medicaid",
+    "how many patients are not",
+    "what is the average age of patients with diabetes",
+    "how many patients have diabetes and a pet iguana",
+])
+def test_questions_left_to_the_model(parser, question):
+    assert parser.sql(question) is None
+
+
+def test_template_counts_match_sqlite(parser, medical_db):
+    conn = sqlite3.connect(medical_db)
+    try:
+        south = conn.execute("SELECT COUNT(*) FROM medical_info "
+                             "WHERE AHRI_REGION = 'South' AND LOWER(C_DB) = 'yes'").fetchone()
+        assert conn.execute(parser.sql("how many diabetic patients live in the south")).fetchone() == south
+    finally:
+        conn.close()
+
+
+def test_chart_spec_for_a_breakdown(parser):
+    spec = parser.chart_spec("Draw a pie chart of patients with diabetes by region")
+    assert spec["chart_type"] == "pie"
+    assert spec["x"] == "AHRI_REGION"
+    assert spec["sql"] == "SELECT AHRI_REGION, COUNT(*) AS n FROM medical_info WHERE C_DB = 'yes' GROUP BY AHRI_REGION"
+    assert parser.chart_spec("Plot patients with diabetes") is None
+
+
+@pytest.mark.parametrize("question, chart", [
+    ("Plot patients with diabetes", True),
+    ("graph hypertension rates", True),
+    ("Can you visualize the income distribution?", True),
+    ("How many patients have diabetes?", False),
+    ("What is the average age per region?", False),
+])
+def test_chart_intent(question, chart):
+    assert IntentClassifier().is_chart(question) is chart
+
+
+def test_router_summary_counts_local_tiers():
+    router = QueryRouter()
+    router.record("text", 0)
+    router.record("text", 1)
+    router.record("graph", "cache")
+    summary = router.summary()
+    assert summary["total"] == 3
+    assert summary["served"]["text"]["0"] == 1
+    assert summary["llm_offload_ratio"] == round(2 / 3, 4)
@@ -0,0 +1,121 @@
+import logging
+
+import pytest
+
+import request_metrics
+from request_metrics import Histogram, Metrics, current_trace, log_slow_query, metrics, span, start_trace
+
+BUCKETS = (0.01, 0.1, 1.0)
+
+
+def test_histogram_counts_into_the_first_bucket_that_holds_the_value():
+    histogram = Histogram(BUCKETS)
+    for value in (0.005, 0.01, 0.05, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5 and histogram.sum == pytest.approx(5.565)
+
+
+def test_quantiles_interpolate_inside_the_bucket():
+    histogram = Histogram(BUCKETS)
+    assert histogram.quantile(0.5) is None
+    for _ in range(10):
+        histogram.observe(0.05)
+    # All ten in (0.01, 0.1]: the median sits halfway through the bucket
+    assert histogram.quantile(0.5) == pytest.approx(0.055)
+    assert histogram.quantile(1.0) == pytest.approx(0.1)
+    histogram.observe(60)
+    # Past the last bound the estimate is capped at it, as Prometheus does
+    assert histogram.quantile(0.99) == 1.0
+
+
+def test_render_writes_the_prometheus_text_format():
+    registry = Metrics(BUCKETS)
+    registry.inc("requests_total", 1, "Requests by route", route="/usa-health", status=200)
+    registry.inc("requests_total", 2, route="/usa-health", status=200)
+    registry.gauge_add("in_flight", 1, "Running", stage='say "hi"\n')
+    registry.observe("stage_seconds", 0.05, "Stage time", stage="sql")
+    registry.observe("stage_seconds", 2, stage="sql")
+
+    assert registry.render().splitlines() == [
+        "# HELP usa_health_in_flight Running",
+        "# TYPE usa_health_in_flight gauge",
+        'usa_health_in_flight{stage="say \\"hi\\"\\n"} 1',
+        "# HELP usa_health_requests_total Requests by route",
+        "# TYPE usa_health_requests_total counter",
+        'usa_health_requests_total{route="/usa-health",status="200"} 3',
+        "# HELP usa_health_stage_seconds Stage time",
+        "# TYPE usa_health_stage_seconds histogram",
+        'usa_health_stage_seconds_bucket{stage="sql",le="0.01"} 0',
+        'usa_health_stage_seconds_bucket{stage="sql",le="0.1"} 1',
+        'usa_health_stage_seconds_bucket{stage="sql",le="1.0"} 1',
+        'usa_health_stage_seconds_bucket{stage="sql",le="+Inf"} 2',
+        'usa_health_stage_seconds_sum{stage="sql"} 2.05',
+        'usa_health_stage_seconds_count{stage="sql"} 2',
+    ]
+
+
+def test_collectors_are_rendered_and_a_failing_one_is_skipped(caplog):
+    registry = Metrics(BUCKETS)
+    registry.add_collector(lambda: [("cache_entries", "gauge", "Entries", [({"tier": "sql"}, 4), ({}, 7)])])
+    registry.add_collector(lambda: 1 / 0)
+    with caplog.at_level(logging.ERROR):
+        lines = registry.render().splitlines()
+    assert lines[-2:] == ['usa_health_cache_entries{tier="sql"} 4', "usa_health_cache_entries 7"]
+    assert "collector failed" in caplog.text
+
+
+def test_histogram_summary_reports_milliseconds_per_label():
+    registry = Metrics(BUCKETS)
+    for seconds in (0.05, 0.05, 0.05, 0.5):
+        registry.observe("stage_seconds", seconds, stage="llm_call")
+    registry.observe("stage_seconds", 0.005, stage="sql_execute")
+    summary = registry.histogram_summary("stage_seconds", "stage")
+    assert summary["sql_execute"] == {"count": 1, "mean_ms": 5.0, "p50_ms": 5.0, "p95_ms": 9.5, "p99_ms": 9.9}
+    assert summary["llm_call"]["count"] == 4
+    assert summary["llm_call"]["mean_ms"] == 162.5
+    assert summary["llm_call"]["p50_ms"] == 70.0
+    assert summary["llm_call"]["p99_ms"] == pytest.approx(964.0)
+    assert registry.histogram_summary("missing", "stage") == {}
+
+
+def test_reset_keeps_gauges():
+    registry = Metrics(BUCKETS)
+    registry.inc("requests_total", 5)
+    registry.gauge_add("in_flight", 2)
+    registry.observe("stage_seconds", 0.1, stage="sql")
+    registry.reset()
+    assert registry.value("requests_total") == 0
+    assert registry.value("in_flight") == 2
+    assert registry.histogram_summary("stage_seconds", "stage") == {}
+
+
+def test_spans_land_in_the_trace_and_the_histogram():
+    before = metrics.histogram_summary("stage_seconds", "stage").get("test_stage", {}).get("count", 0)
+    trace = start_trace()
+    assert current_trace() is trace
+    with span("test_stage", rows=0) as record:
+        record["rows"] = 3
+    with pytest.raises(KeyError):
+        with span("test_stage"):
+            raise KeyError("x")
+
+    assert [(record["stage"], record.get("rows"), record.get("error")) for record in trace.spans] == \
+        [("test_stage", 3, None), ("test_stage", None, "KeyError")]
+    assert trace.server_timing() == ", ".join(f"test_stage;dur={record['ms']}" for record in trace.spans)
+    assert trace.describe().startswith("Timings: test_stage ")
+    assert metrics.histogram_summary("stage_seconds", "stage")["test_stage"]["count"] == before + 2
+    assert metrics.value("stage_in_flight", stage="test_stage") == 0
+
+
+def test_slow_queries_are_logged_past_the_threshold(monkeypatch, caplog):
+    monkeypatch.setattr(request_metrics, "SLOW_QUERY_LOG", "")
+    monkeypatch.setattr(request_metrics, "_slow_log_ready", False)
+    before = metrics.value("slow_queries_total")
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        assert not log_slow_query("SELECT 1", 0.5, threshold=1)
+        assert not log_slow_query("SELECT 1", 5, threshold=None)
+        assert log_slow_query("SELECT 2", 1.5, threshold=1, dataset="default")
+    assert metrics.value("slow_queries_total") == before + 1
+    assert len(caplog.records) == 1
+    assert '"sql": "SELECT 2"' in caplog.text and '"dataset": "default"' in caplog.text
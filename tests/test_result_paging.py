@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from result_paging import (PageTokenError, decode_page_token, encode_page_token, keyset_after, keyset_sql,
+                           order_key, paged_sql)
+
+
+@pytest.fixture(scope="module")
+def conn(medical_db):
+    conn = sqlite3.connect(medical_db)
+    yield conn
+    conn.close()
+
+
+def pages(conn, sql, limit):
+    """Every page of ``sql``, the way the app pages it: OFFSET for the
+    first page, then keyset pages when the query has an ORDER BY key."""
+    rows, after, offset = [], None, 0
+    while True:
+        if after:
+            cursor = conn.execute(keyset_sql(sql, after), (after["value"], limit + 1, after["ties"]))
+        else:
+            cursor = conn.execute(paged_sql(sql), (limit + 1, offset))
+        names = [column[0] for column in cursor.description]
+        page = cursor.fetchall()
+        has_more = len(page) > limit
+        page = page[:limit]
+        rows += page
+        offset += len(page)
+        if not has_more:
+            return rows
+        after = keyset_after(order_key(sql, names), names, page, after)
+        # The token round trip is part of paging
+        _, _, _, after = decode_page_token(encode_page_token(sql, offset, after=after))
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT CASE_ID, AGE FROM medical_info ORDER BY AGE",
+    "SELECT CASE_ID, AGE FROM medical_info ORDER BY AGE DESC",
+    "SELECT CASE_ID, AGE AS years FROM medical_info WHERE AHRI_REGION = 'South' ORDER BY years DESC",
+    "SELECT CASE_ID, INCOME FROM medical_info ORDER BY 2",
+    "SELECT CASE_ID, HLS_OT_TXT FROM medical_info ORDER BY HLS_OT_TXT DESC",
+    "SELECT AHRI_REGION, COUNT(*) AS n FROM medical_info GROUP BY AHRI_REGION ORDER BY n DESC",
+    "SELECT CASE_ID, AGE FROM medical_info ORDER BY AGE LIMIT 333",
+])
+@pytest.mark.parametrize("limit", [29, 250])
+def test_keyset_pages_match_the_full_result(conn, sql, limit):
+    assert pages(conn, sql, limit) == conn.execute(sql).fetchall()
+
+
+def test_keyset_is_used_only_for_a_single_result_column_key():
+    names = ["CASE_ID", "AGE"]
+    assert order_key("SELECT CASE_ID, AGE FROM medical_info ORDER BY age desc", names) == ("AGE", True)
+    assert order_key("SELECT CASE_ID, AGE FROM medical_info ORDER BY 1 LIMIT 10", names) == ("CASE_ID", False)
+    assert order_key("SELECT CASE_ID, AGE FROM medical_info ORDER BY AGE, CASE_ID", names) is None
+    assert order_key("SELECT CASE_ID, AGE FROM medical_info ORDER BY INCOME", names) is None
+    assert order_key("SELECT CASE_ID, AGE FROM medical_info ORDER BY AGE NULLS LAST", names) is None
+    assert order_key("SELECT CASE_ID, AGE FROM medical_info", names) is None
+
+
+def test_ties_carry_over_a_page_of_equal_keys():
+    key = ("AGE", False)
+    first = keyset_after(key, ["AGE"], [(40,), (45,), (45,)])
+    assert first == {"column": "AGE", "desc": False, "value": 45, "ties": 2}
+    assert keyset_after(key, ["AGE"], [(45,), (45,)], first)["ties"] == 4
+    assert keyset_after(key, ["AGE"], [(45,), (46,)], first)["ties"] == 1
+    # NULL keys can't be sought past
+    assert keyset_after(key, ["AGE"], [(40,), (None,)]) is None
+
+
+def test_tampered_token_is_rejected():
+    token = encode_page_token("SELECT 1", 100, "wave1", {"column": "AGE", "desc": False, "value": 3, "ties": 1})
+    assert decode_page_token(token) == ("SELECT 1", 100, "wave1",
+                                        {"column": "AGE", "desc": False, "value": 3, "ties": 1})
+    with pytest.raises(PageTokenError):
+        decode_page_token(token[:-4] + ("A" if token[-4] != "A" else "B") + token[-3:])
+    with pytest.raises(PageTokenError):
+        decode_page_token("not a token")
@@ -0,0 +1,76 @@
+import pytest
+
+from medical_schema import COLUMN_DESCRIPTIONS
+from schema_index import SchemaIndex, format_columns, tokenize
+
+DESCRIPTIONS = {
+    "CASE_ID": "Unique identifier of the survey response",
+    "AGE": "Age of the patient in years",
+    "C_DB": "Has a doctor ever told you that you have diabetes?",
+    "C_DB_FOLLOWON": "Is the diabetes treated with insulin?",
+    "C_HYPERTEN": "Has a doctor ever told you that you have high blood pressure?",
+    "INCOME": "Household income before taxes",
+    "EDUCATION": "Highest level of school completed",
+}
+
+
+def columns_of(columns_desc):
+    return [part.split(":")[0] for part in columns_desc.split(", ") if ":" in part]
+
+
+def ranking(index, question):
+    scores = index.score(question)
+    return [index.columns[i] for i in sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+            if scores[i] > 0]
+
+
+def test_tokenize_drops_stopwords_and_stems():
+    assert tokenize("How many patients have Diabetes and cancers?") == ["diabete", "cancer"]
+    assert tokenize("Illness") == ["illness"]
+
+
+def test_bm25_ranks_the_matching_column_first():
+    index = SchemaIndex(DESCRIPTIONS, min_confidence=0)
+    assert ranking(index, "blood pressure") == ["C_HYPERTEN"]
+    # The column name counts twice, so the parent outranks its follow-on
+    assert ranking(index, "diabetes") == ["C_DB", "C_DB_FOLLOWON"]
+    assert ranking(index, "insulin for diabetes")[0] == "C_DB_FOLLOWON"
+    # A rare term outweighs a common one
+    assert ranking(index, "doctor income")[0] == "INCOME"
+
+
+def test_select_prunes_to_the_relevant_columns():
+    index = SchemaIndex(DESCRIPTIONS, min_confidence=1.0)
+    columns_desc, info = index.select("How many patients have high blood pressure?")
+    # Always-included columns, then the match, in schema order
+    assert columns_of(columns_desc) == ["CASE_ID", "AGE", "C_HYPERTEN"]
+    assert info["fallback"] is False and info["columns"] == 3
+    assert info["tokens_pruned"] < info["tokens_full"]
+
+    # Follow-on columns come along with their parent
+    columns_desc, _ = SchemaIndex(DESCRIPTIONS, top_k=1, min_confidence=1.0).select("diabetes")
+    assert columns_of(columns_desc) == ["CASE_ID", "AGE", "C_DB", "C_DB_FOLLOWON"]
+
+
+def test_vague_questions_get_the_full_schema():
+    index = SchemaIndex(DESCRIPTIONS)
+    columns_desc, info = index.select("Tell me something interesting")
+    assert columns_desc == format_columns(DESCRIPTIONS)
+    assert info["fallback"] is True and info["tokens_pruned"] == info["tokens_full"]
+
+
+@pytest.mark.parametrize("question, expected, group_prefix", [
+    ("How many patients have diabetes by region?", {"C_DB", "C_DB_FOLLOWON", "AHRI_REGION"}, None),
+    ("What is the breakdown by race?", {"AHRI_RACE_CAT"}, "RACE1_"),
+    ("Which patients postponed care because of cost?", {"CARECOST_POSTPONE", "INS_RX_COST"}, "CARECOST_"),
+])
+def test_survey_questions_keep_the_columns_they_need(question, expected, group_prefix):
+    index = SchemaIndex(COLUMN_DESCRIPTIONS)
+    columns_desc, info = index.select(question)
+    columns = set(columns_of(columns_desc))
+    assert not info["fallback"]
+    assert expected <= columns
+    if group_prefix:
+        # Trigger words pull in every sibling column of the group
+        assert {c for c in COLUMN_DESCRIPTIONS if c.startswith(group_prefix)} <= columns
+    assert len(columns) < len(COLUMN_DESCRIPTIONS) / 4
@@ -0,0 +1,49 @@
+import pytest
+
+from sql_cache import SQLCache, normalize_question
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SQLCache(str(tmp_path / "sql_cache.db"))
+
+
+def test_exact_hit_ignores_case_and_punctuation(cache):
+    cache.store("How many patients have diabetes?", "SELECT 1")
+    assert cache.lookup("how many patients have DIABETES") == ("SELECT 1", "exact")
+    assert normalize_question("What's the count?") == "whats the count"
+
+
+def test_reordered_question_is_a_semantic_hit(cache):
+    cache.store("How many patients have diabetes in the South?", "SELECT 1")
+    assert cache.lookup("How many patients in the South have diabetes?") == ("SELECT 1", "semantic")
+
+
+@pytest.mark.parametrize("stored, asked", [
+    ("average age of patients in the south", "average age of patients in the north"),
+    ("how many female patients have diabetes", "how many male patients have diabetes"),
+    ("how many patients in the south", "how many patients in the west"),
+    ("number of patients by region", "number of patients by income"),
+    ("how many patients have copd", "how many patients have chf"),
+    ("how many patients have diabetes", "how many patients do not have diabetes"),
+    ("how many patients are older than 50", "how many patients are older than 60"),
+    ("how many patients have diabetes", "average age of patients with diabetes"),
+])
+def test_different_values_or_columns_never_share_sql(cache, stored, asked):
+    cache.store(stored, "SELECT 1")
+    assert cache.lookup(asked) == (None, "miss")
+
+
+def test_summary_counts_lookups(cache):
+    cache.store("how many patients have diabetes", "SELECT 1")
+    cache.lookup("how many patients have diabetes")
+    cache.lookup("how many patients have copd")
+    summary = cache.summary()
+    assert (summary["exact_hits"], summary["misses"], summary["entries"]) == (1, 1, 1)
+    assert summary["hit_ratio"] == 0.5
+
+
+def test_expired_entries_miss(tmp_path):
+    cache = SQLCache(str(tmp_path / "sql_cache.db"), ttl=-1)
+    cache.store("how many patients have diabetes", "SELECT 1")
+    assert cache.lookup("how many patients have diabetes") == (None, "miss")
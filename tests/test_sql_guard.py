@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from sql_guard import QueryRejected, QueryTimeout, cap_rows, guarded_query
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "guard.db"))
+    conn.execute("CREATE TABLE medical_info (CASE_ID TEXT, AGE INTEGER, AHRI_REGION TEXT)")
+    conn.executemany("INSERT INTO medical_info VALUES (?, ?, ?)",
+                     [(str(i), 20 + i % 60, ("South", "West")[i % 2]) for i in range(200)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def run(conn, sql, params=(), **kwargs):
+    steps = []
+    cursor = conn.cursor()
+    with guarded_query(cursor, sql, params, steps, slow_query_seconds=None, **kwargs):
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return rows, steps
+
+
+def test_read_only_query_runs(conn):
+    rows, steps = run(conn, "SELECT AHRI_REGION, COUNT(*) FROM medical_info WHERE AGE > ? GROUP BY 1 ORDER BY 1",
+                      (30,))
+    assert [region for region, _ in rows] == ["South", "West"]
+    assert steps == ["Query plan checked: no full cross joins."]
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM medical_info",
+    "UPDATE medical_info SET AGE = 0",
+    "INSERT INTO medical_info (AGE) VALUES (1)",
+    "DROP TABLE medical_info",
+    "CREATE TABLE copy AS SELECT * FROM medical_info",
+    "ATTACH DATABASE ':memory:' AS other",
+    "PRAGMA writable_schema = ON",
+])
+def test_writes_are_rejected(conn, sql):
+    with pytest.raises(QueryRejected):
+        run(conn, sql)
+    assert conn.execute("SELECT COUNT(*) FROM medical_info").fetchone() == (200,)
+
+
+def test_rejection_is_reported_in_steps(conn):
+    steps = []
+    with pytest.raises(QueryRejected):
+        with guarded_query(conn.cursor(), "DELETE FROM medical_info", steps=steps, slow_query_seconds=None):
+            pass
+    assert steps[-1].startswith("Query rejected:")
+
+
+def test_full_cross_join_is_rejected(conn):
+    with pytest.raises(QueryRejected, match="cross join"):
+        run(conn, "SELECT COUNT(*) FROM medical_info a, medical_info b")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT COUNT(*) FROM medical_info a JOIN medical_info b ON a.CASE_ID = b.CASE_ID",
+    "SELECT * FROM medical_info WHERE AGE = (SELECT MAX(AGE) FROM medical_info)",
+    "WITH regions AS (SELECT DISTINCT AHRI_REGION FROM medical_info) "
+    "SELECT COUNT(*) FROM medical_info JOIN regions USING (AHRI_REGION)",
+])
+def test_joins_with_a_condition_are_allowed(conn, sql):
+    rows, _ = run(conn, sql)
+    assert rows
+
+
+def test_runaway_query_is_stopped_at_the_budget(conn):
+    steps = []
+    sql = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+           "SELECT COUNT(*) FROM n")
+    cursor = conn.cursor()
+    with pytest.raises(QueryTimeout):
+        with guarded_query(cursor, sql, steps=steps, time_budget=0.05, slow_query_seconds=None):
+            cursor.execute(sql)
+    assert steps[-1].startswith("Query stopped:")
+    # The handlers are removed again, so the connection stays usable
+    assert conn.execute("SELECT COUNT(*) FROM medical_info").fetchone() == (200,)
+
+
+def test_cap_rows_limits_the_result(conn):
+    rows, _ = run(conn, cap_rows("SELECT * FROM medical_info;", cap=7))
+    assert len(rows) == 7
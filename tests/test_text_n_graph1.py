@@ -0,0 +1,19 @@
+import sqlite3
+
+
+def test_counts_in_a_snapshot_come_from_sqlite(text_app):
+    app, _ = text_app
+    dataset = app.catalog.default
+    dataset.column_store.load()
+    sql = "SELECT COUNT(*) FROM medical_info WHERE SEX = 'Female'"
+    conn = sqlite3.connect(dataset.pool.db_path)
+    expected = conn.execute(sql).fetchall()
+    conn.close()
+
+    answered = app.execute_query_with_steps(sql, dataset=dataset)
+    assert any("column store" in step for step in answered["steps"])
+    # A batch's snapshot may not be the data version the column store loaded
+    with dataset.pool.snapshot():
+        answered = app.execute_query_with_steps(sql, dataset=dataset)
+    assert not any("column store" in step for step in answered["steps"])
+    assert answered["result"] == expected
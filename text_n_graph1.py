@@ -1,366 +1,664 @@
-from flask import Flask, request, jsonify, send_file
-import os
-import requests
-import sqlite3
-from dotenv import load_dotenv
-from openai import OpenAI
-import time
-from PIL import Image
-
-
-# Load environment variables from .env file
-load_dotenv()
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-
-# Set up OpenAI client
-client = OpenAI(api_key=OPENAI_API_KEY)
-
-app = Flask(__name__)
-
-# Define the table name
-table_name = "medical_info"
-
-# Function to execute a query and return detailed execution steps (for textual queries)
-def execute_query_with_steps(query):
-    steps = []
-    try:
-        conn = sqlite3.connect('medical.db')
-        steps.append("Connected to the database 'medical.db'.")
-        
-        cursor = conn.cursor()
-
-        # Check if table exists
-        cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}';")
-        table_exists = cursor.fetchone()
-        if table_exists:
-            steps.append(f"Table '{table_name}' exists.")
-        else:
-            steps.append(f"Table '{table_name}' does not exist.")
-            return {"error": f"Table '{table_name}' does not exist.", "steps": steps}
-
-        cursor.execute(query)
-        result = cursor.fetchall()
-        steps.append(f"Query executed: {query}")
-        
-        steps.append(f"Fetched {len(result)} rows.")
-        conn.close()
-        steps.append("Database connection closed.")
-        
-        return {"result": result, "steps": steps}
-    
-    except sqlite3.Error as e:
-        steps.append(f"SQLite error occurred: {str(e)}")
-        return {"error": str(e), "steps": steps}
-    
-    except Exception as e:
-        steps.append(f"An error occurred: {str(e)}")
-        return {"error": str(e), "steps": steps}
-
-# Function to convert a question to an SQL query using OpenAI (for textual queries)
-# Function to convert question to SQL query using OpenAI
-def question_to_sql(question):
-    column_descriptions = {
-       "CASE_ID":'case id of the patient',
-        "AGE":'age of the patient.',
-        "SEX":'biological sex at birth',
-        "RACE1_AIAN":'American Indian or Alaska Native',
-        "RACE1_AS":'race is Asian',
-        "RACE1_BL":'race is Black or African American',
-        "RACE1_NH":'race is Native Hawaiian or Pacific Islander',
-        "RACE1_WH":'race is White',
-        "RACE1_OT":'Whether patient belong to other races or not- yes or no',
-        "RACE1_OT_TXT":'If race is Other the what is that race is mentioned',
-        "RACE2_AI":'race is Asian Indian',
-        "RACE2_CH":'race is Chinese',
-        "RACE2_FI":'race is Filipino',
-        "RACE2_JA":'race is Japanese',
-        "RACE2_KO":' race is Korean',
-        "RACE2_VI":' race is Vietnamese',
-        "RACE2_OT":'Whether patient belong to other races or not- yes or no',
-        "RACE2_TXT":'If race is Other the what is that race is mentioned',
-        "RACE3_AFRICAN":'race is African',
-       "RACE3_AMBIRTH":'race is African American of American origin (born in America)',
-       "RACE3_AFBIRTH":'race is African American of African origin (born in Africa)',
-       "RACE3_CABIRTH":'race is African American of Caribbean origin (born in one of the Caribbean Islands)',
-       "RACE3_CA":'race is Caribbean',
-       "RACE3_OT":'Whether patient belong to other races or not- yes or no',
-       "RACE3_OT_TXT":'If race is Other the what is that race is mentioned',
-       "HLS_YN":'Are you of Hispanic, Latina, or Spanish origin',
-       "HLS_LA":'is a Hispanic, Latina, or Spanish origin and is a Latin American',
-       "HLS_ME":'is a Hispanic, Latina, or Spanish origin and is a (Mexican,Mexican American,or Chicana)',
-       "HLS_PR":'is a Hispanic, Latina, or Spanish origin and is a Puerto Rican ',
-       "HLS_OT":' Other Hispanic, Latina, or Spanish origin (e g , Salvadoran, Dominican, Colombian, Guatemalan, Spaniard, Ecuadorian, etc )',
-       "HLS_OT_TXT":'Other Hispanic, Latina, or Spanish origin (e g , Salvadoran, Dominican, Colombian, Guatemalan, Spaniard, Ecuadorian, etc ) and what is that origin ',
-       "C_AIDS":'patient has Acquired immune-deficiency syndrome (AIDS)',
-       "C_AR":'patient has Arthritis or other rheumatic diseases',
-       "C_CN":'patient has Cancer or not yes or no',
-       "C_CN_FOLLOWON1":'has cancer, does the patient have a tumor? yes or no',
-       "C_CN_FOLLOWON3":'has cancer,is it leukemia? yes or no',
-       "C_CN_FOLLOWON2":'has cancer, is it lymphoma? yes or no',
-       "C_CVA":'Cerebral vascular accident (stroke) or transient ischemic attack (TIA) yes or no',
-       "C_CKD":' has Chronic kidney disease (CKD) yes or no',
-       "C_CKD_FOLLOWON":'has Chronic kidney disease (CKD) and status is mild, moderate, Severe (on dialysis, status post kidney transplant, uremia) any one of these',
-       "C_COPD":'has Chronic lung disease (COPD) yes or no',
-       "C_CTD":' has Connective tissue disease yes or no',
-       "C_CHF":'has Congestive heart failure (CHF) yes or no',
-       "C_DM":' has Dementia yes or no',
-       "C_DB":' has Diabetes yes or no ',
-       "C_DB_FOLLOWON":'status of Diabetes - Diet controlled,Uncomplicated (No end-organ damage, such as peripheral neuropathy, nephropathy and/or PAD),Complicated (End-organ damage, such as peripheral neuropathy, nephropathy and/or PAD)',
-       "C_HYPERLIPID":'has Hyperlipidemia (high cholesterol) yes or no',
-       "C_HYPERTEN":'has Hypertension (high blood pressure) yes or no',
-       "C_LD":'has Liver disease yes or no',
-       "C_LD_FOLLOWON":'has liver disease where status is Mild,Moderate to severe',
-       "C_HA":' has Myocardial infarction (heart attack) yes or no ',
-       "C_HP":'has Paralysis of one side of the body (hemiplegia) yes or no',
-       "C_PVD":'has Peripheral vascular disease yes or no',
-       "C_PUD":' has Peptic ulcer disease yes or no',
-       "C_NONE":'None of these yes or no',
-       "INS_YN":'currently have health insurance yes or no',
-       "INS_TYPE_EMP":'health insurance through a current or former employer-yes or no',
-       "INS_TYPE_OT_EMP":'health insurance through someone else employer (e g , your spouse, partner, or parents) yes or no',
-       "INS_TYPE_PLAN":' has Individual/family insurance plans yes or no',
-       "INS_TYPE_MEDICAID":'has Medicaid (MediCal for California residents) yes or no',
-       "INS_TYPE_VET":' has or under health insurance called Veterans administration (VA)/CHAMPUS yes or no',
-       "INS_TYPE_TRI":' health insurance  is TRICARE yes or no',
-       "INS_TYPE_MEDICARE":' health insurance is Medicare yes or no',
-       "INS_TYPE_NS":'health insurance Not sure yes or no',
-       "INS_TYPE_OT":'Other  health insurance type yes or no',
-       "INS_TYPE_OT_TXT":'has Other health insurance type and that is mentioned',
-       "INS_RX_COST":'Has the cost of prescription medication ever prevented you from taking a prescription medication yes or no or other',
-       "INS_RX_COST_TXT":'Has the cost of prescription medication ever prevented you from taking a prescription medication if other then the reason is mentioned',
-       "PCP_YN":'Do you have a regular primary care provider (e g , primary care physician, family doctor) yes or no',
-       "PCP_TYPE":'What type of health care provider is your regular primary care provider ,here the type of the provider is mentioned like family doctor,internist,nurse etc or others ignore the case sensitives in the values',
-       "PCP_TYPE_OT":'if health care provider is other ,then who are they mentioned here ignore the case sensitives in the values',
-       "PCP_GENDER":'What is the gender identity of your regular primary care provider male or female',
-       "PCP_RACE_AI":'race and ethnicity of your regular primary care provider - American Indian or Alaska Native yes or no',
-       "PCP_RACE_AS":'race and ethnicity of your regular primary care provider - Asian yes or no',
-       "PCP_RACE_BL":'race and ethnicity of your regular primary care provider - Black or African American yes or no',
-       "PCP_RACE_HLS":'race and ethnicity of your regular primary care provider - Hispanic, Latino, or Spanish origin yes or no',
-       "PCP_RACE_NH":'race and ethnicity of your regular primary care provider - Native Hawaiian or Other Pacific Islander yes or no',
-       "PCP_RACE_WH":'race and ethnicity of your regular primary care provider - White yes or no',
-       "PCP_RACE_OT":'race and ethnicity of your regular primary care provider if Other yes or no',
-       "PCP_RACE_OT_TXT":'race and ethnicity of your regular primary care provider if Other then they are mentioned',
-       "PCP_RACE_NS":'Not sure of the race and ethnicity of your regular primary care provider yes or no',
-       "CARECOST_POSTPONE":'Postponed seeking medical care due to cost yes or no',
-       "CARECOST_WENT_WITHOUT":'Went without needed medical care due to cost yes or no',
-       "CARECOST_NO_RX":'Did not take a prescription medication because of drug costs yes or no',
-       "CARECOST_NONE":' None of the reasons for the carecost that is didnot postpone seeking medical care due to cost,didnot go without needed medical care due to cost,Did not take a prescription medication because of drug costs',
-       "MENO_STATUS":'current menstrual status one of these 1.Peri-menopause / menopause transition (changes in periods, but have not gone 12 months in a row without a period),2.Post-menopause (the years after menopause, more than 12 months in a row without a period),3.Pre-menopause (before menopause having regular periods),4.VeryOften , or left blank',
-       "MENO_FOLLOWON":'menopause happened that is post menopause due to 1.chemotherapy or radiation therapy,2.Spontaneous ("natural"),3.Surgical (removal of both ovaries),4.VeryOften, or other reason',
-       "MENO_FOLLOWON_TXT":'reason for menopause happened that is post menopause is other  and that reason is specified',
-       "HRT":' in the past,or  currently, taking hormone replacement therapy (HRT) options are 1.Yes, I have been on HRT but am not currently,2.Yes, I am currently on HRT,3.No, I do not and have never been on HRT,4.Always',
-       "MMG_STATUS":'mamogram status best describes the patient options are 1.I have had a mammogram in the past 12 months,2.I have never had a mammogram,3.I have not had a mammogram in the past 12 months, but I have had a mammogram in the past 24 months,4.I have not had a mammogram in the past 24 months, but I have had a mammogram more than 24 months ago,5.VeryOften',
-       "MMG_WHY_GET_TXT":'reasons why patients have mammograms are mentioned',
-       "MMG_WHY_NEVER_GET_TXT":'reasons why patients never had mammograms are mentioned',
-       "MMG_IMPORTANCE":'How important is having a mammogram to patient- options are on ascale of 1-9,extremely important ,not at all important',
-       "MMG_IMPORTANCE_TXT":'Patient explains the importance of mamaogram to them after choosing how important it is to them ',
-       "MMG_ADVICE":'What advice about having a mammogram would patient give to other women , advices are noted',
-       "MMG_EASIER":'What are one or two things that would make it easier for the patient to have a mammogram every 12 months',
-       "BARRIER_NOTKNOW":'Not knowing what is involved with getting a mammogram,how often each of the following issues ever prevented,delayed,or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_UNSUREBENEFITS":'Unsure about the benefits of getting a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_MISSCANCER":'I heard mammograms miss a lot of cancers,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_NOHISTORY":'Unnecessary to get a mammogram since breast cancer does not run in my family,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_NORISK":'Do not have risk factors of breast cancer,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed  options are always,never,rarely,sometimes,very often',
-       "BARRIER_TOOYOUNG":'I think I am too young to have a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_TOOHEALTHY":'I think I am too healthy to have breast cancer,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no',
-       "BARRIER_NOSYMPTOMS":'Do not have any symptoms in my breasts,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_UNAWAREHOW":'Unaware of how often to get a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,do not remember',
-       "BARRIER_INSECURITY":'Insecurity about getting a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,Digital mammography in 3D (digital breast tomosynthesis)',
-       "BARRIER_LANGUAGE":'Language barriers since English is not my first/primary language,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed,options are always,never,rarely,sometimes,very often,I am likely to have a mammogram in the next 6 months',
-       "BARRIER_PRIVACY":'Concern with privacy issues such as exposure and touching of breasts by a mammogram technician, how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_PAIN":'Concerns about discomfort or pain with getting a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,50',
-       "BARRIER_PREVIOUSNEGATIVE":'Previous negative experience getting a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_FEAREXPERIENCE":'Fears about the mammogram experience,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_FEARRESULTS":'Fear of the mammogram results,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_RADIATION":'Concerns about radiation,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_LACKTRUST":'Lack of trust in the health care system, how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,Personal vehicle (car or truck)',
-       "BARRIER_ANNUAL":'Not getting annual health checkups,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_NODR":'Not having a doctor that I see on a regular basis,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,Less than 15 minutes',
-       "BARRIER_NOREFERRAL":'Not receiving a referral or recommendation for a mammogram from a doctor or other health care provider,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_NOINSURANCE":'Not having health insurance coverage for mammograms,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often',
-       "BARRIER_NOAFFORD":'Not being able to afford a mammogram,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no',
-       "BARRIER_TRANSPORTATION":'Problems with transportation,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed  options are always,never,rarely,sometimes,very often ',
-       "BARRIER_NOACCESS":'Limited or no access to a mammogram facility nearby,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,3 hours ',
-       "BARRIER_WORK":'Time away from work,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,1.2',
-       "BARRIER_SOCIALSUPPORT":'Little or no social support from family and friends,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often, No Comment',
-       "BARRIER_PRIORITIES":'Have competing priorities that are more important than screening,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,,College graduate (e g , BA, AB, BS, etc ) ',
-       "BARRIER_CLINICHRS":'Inconvenient clinic hours,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,Urban (city) ',
-       "BARRIER_SCHEDULING":'Difficulty scheduling an appointment (clinic availability),how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,Divorced or separated ',
-       "BARRIER_GOINGTOAPPT":'Difficulty going to the appointment (child or elder care, unable to leave work),how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no',
-       "BARRIER_FORGOT":'Forgot or overlooked a scheduled appointment,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no',
-       "BARRIER_NOTIME":'I dont have time,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no',
-        "BARRIER_PROCRASTINATE":'Procrastination,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no ',
-        "BARRIER_DISABILITY":'Knowing that the facilities are not disability-friendly (e g , the physical design/layout of medical rooms and equipment) ,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no',
-        "BARRIER_TOOSMALL":'I am too small to have cancer, I have small breasts,how often each of the following issues ever prevented, delayed, or interfered with your getting a mammogram when needed options are always,never,rarely,sometimes,very often,no ',
-        "BARRIER_OT":' Are there any  other issues that have ever prevented, delayed, or interfered with your getting a mammogram when needed  yes or no',
-        "BARRIER_OT_TXT":'if there are other issues that have ever prevented, delayed, or interfered with your getting a mammogram when needed what are they are mentioned',
-        "MMG_RESULTS":'results of patient(s) most recent mammogram like normal abnormal,do no remember,do not know,no etc are mentioned',
-        "MMG_TYPE":' type of mammogram was patient(s) most recent mammogram like Digital mammography in 2D,Digital mammography in 3D (digital breast tomosynthesis),no,not sure',
-        "MMG_FREQ":'How likely is the patient to have a mammogram options are likely in next 3 months,6 months,9 months,2 months,24 months,not likely in the next 24 months,likely to never have,no',
-        "MMG_FREQ_3MO":'How likely are you to have a mammogram in the next 3 months on a scale of 1-100',
-        "MMG_FREQ_6MO":'How likely are you to have a mammogram in the next 6 months on  ascale of 1-100 ,another answer can be - yes',
-        "MMG_FREQ_9MO":'How likely are you to have a mammogram in the next 9 months on a scale of 1-100 , another answer can be - Not employed, looking for work',
-        "MMG_FREQ_12MO":'How likely are you to have a mammogram in the next 12 months on a scale of 1-100 ',
-        "MMG_FREQ_24MO":'How likely are you to have a mammogram in the next 24 months on a scale of 1-100 , another answer can be - $50,000 to $74,000',
-        "MMG_FREQ_BEYOND24MO":'How likely are you to have a mammogram in but not in the next 24 months on a scale of 1-100',
-        "MMG_TRANSPORT_TYPE":'How did patient travel to  most recent mammogram screening appointment vehincle types are mentioned here',
-        "MMG_TRANSPORT_TYPE_TXT":' if Other (please specify) is given for How did patient travel to  most recent mammogram screening appointment that vehicle or transportation mode is mentioned',
-        "MMG_TRANSPORT_TIME":'How much time/long did you travel to receive your most recent mammogram - the time or duration is mentioned',
-        "MMG_TRANSPORT_TIME_TXT":'If Other (please specify) is given,How much time/long did you travel to receive your most recent mammogram -that duration or time or other time is mentioned',
-        "MMG_REASONABLE_TIME_CLASS_TXT":' if Other (please specify) is given for a reasonable time to travel to receive  next mammogram then the other reason or time/distance is mentioned',
-        "MMG_TIMEOFF_WK_YN":'Did patient have to take time off work to receive your most recent mammogram yes or no',
-        "MMG_TIMEOFF_WK_PAID":'Was the time taken off work for your most recent mammogram paid or not options are Not paid time off,Paid time off',
-        "MMG_TIMEOFF_NEEDED":'How much time did patient or would patient need to take off work to receive a mammogram on a scale of 0-7 hours or an entire day',
-        "MMG_REASONABLE_TIME":'What would be a reasonable time to travel to receive your next mammogram on a scale of 0-2400',
-        "MMG_ANYTHINGELSE":'Is there anything patient would like to tell  about his/her use of health care services in relation to mammograms ,here patients will express their opinions',
-        "EDUCATION":'What is the highest level of education completed',
-        "COMMUNITY_TYPE":'How would you describe the community where you currently live options are rural(country),suburban(suburbs),urban(city)',
-        "MARITAL_STATUS":'marital status of the patient is mentioned like married,not married,livig with partner,single,divorced,widowed',
-        "LIS_SSI":'Supplemental Security Income (SSI)-Did patient receive any in the past year yes or no',
-        "LIS_EITC":'The Earned Income Tax Credit (EITC)-Did patient receive any  in the past year yes or no',
-        "LIS_DISABILITY":'Disability income-Did patient receive any in the past year yes or no',
-        "LIS_WIC":'Food assistancelike  WIC or Supplemental Nutrition Program for Women, Infants, and Children-Did patient receive any  in the past year yes or no',
-        "LIS_HOUSING":'Housing help-Did patientreceive any  in the past year yes or no',
-        "LIS_UTILITY":'Help with utility bills-Did patient receive any in the past year yes or no',
-        "LIS_WELFARE":'Welfare -TANF, or Temporary Assistance for Needy Families-Did patient receive any in the past year yes or no',
-        "LIS_BENEFITFINDER":'Benefit finder-Did patient receive any  in the past year yes or no',
-        "LIS_MEDICAID":'Medicaid, or the Children Health Insurance Program (CHIP)-Did patient receive any  in the past year yes or no',
-        "LIS_SOCIALSERVICES":'Assistance from state social service agencies-Did patient receive any  in the past year yes or no',
-        "LIS_OT":'Other type of assistance (please specify)-Did patient receive any other assistance in the past year yes or no',
-        "LIS_OT_TXT":'Other type of assistance (please specify)- is recieved by patient in the past year then that assistance is mentioned here',
-        "LIS_NONE":'None of these-if patient has not received any assistance beneifts etc in the past year yes or no',
-        "EMPLOYMENT":'current employment situation of the patient employed or not- options are employed full time,employed part time,self-employed full time,self-employed part time,not employed looking for work,not employed not looking for work',
-        "EMPLOYMENT_OT_TXT":' if Other (please specify) is given by the patient under employment ,then that is mentioned here',
-        "INCOME":'household income before taxes -ranges are mentioned here',
-        "AHRI_AGE_CAT":'AHRI calculated age categories for comparison to US Census data - here the age ranges are given',
-        "AHRI_RACE_CAT":'AHRI calculated race categories- Black alone, White alone and Other are the options',
-        "AHRI_CCI_SCORE":'AHRI calculated Charlson Comorbidity Index score- range is from 0 to 10',
-        "AHRI_REGION":'AHRI region provided with participant ID - here the regions are south,west,northeast,midwest',
-        "AHRI_ED_HS":'AHRI calculated education categories- HS or less , more than HS are the options here HS means High school'
-    }
-
-
-# Construct a description string to include in the prompt
-    columns_desc = ", ".join([f"{col}: {desc}" for col, desc in column_descriptions.items()])
-
-
-    # prompt = f"Convert the following question to an SQLite query using the table '{table_name}': '{question}' Just give the query thats all."
-    prompt=f"Convert the following question to an SQLite query using the table '{table_name}' "f"with columns ({columns_desc}): '{question}'. Just give the query, that's all."
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {OPENAI_API_KEY}"
-    }
-    payload = {
-        "model": "gpt-4o",
-        "messages": [
-        {"role": "system", "content": "You are a sql agent,so treat a Yes as a positive value ,and a No as a negative value.Convert all values to lowercase both the prompt and the values of table and then query the table."},
-        {"role": "user", "content": prompt}
-    ],
-        "max_tokens": 1000
-    }
-
-    try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        sql_query = response.json()["choices"][0]["message"]["content"].strip()
-
-        # Clean the query if needed
-        if sql_query.startswith("```"):
-            sql_query = sql_query.split("\n", 1)[1]
-            sql_query = sql_query.rsplit("```", 1)[0]
-        
-        sql_query = sql_query.replace('Sure,', '').strip()
-        return sql_query
-    
-    except requests.exceptions.HTTPError as http_err:
-        return {"error": f"HTTP error occurred: {http_err}"}
-    except requests.exceptions.RequestException as req_err:
-        return {"error": f"Request error occurred: {req_err}"}
-    except Exception as err:
-        return {"error": f"An error occurred: {err}"}
-
-
-# Function to handle graphical queries (e.g., plotting data)
-
-
-# Function to handle graphical queries (e.g., plotting data)
-def process_graphical_query(question):
-    # Simulated graphical processing logic
-    file = client.files.create(
-        file=open("data/BrCA Dataset_N5030_lab.csv", "rb"),
-        purpose='assistants'
-    )
-
-    assistant = client.beta.assistants.create(
-        instructions="You are a personal data analyst. Generate a chart for the requested data.",
-        name="Chart Maker",
-        model="gpt-4o",
-        tools=[{"type": "code_interpreter"}],
-        tool_resources={"code_interpreter": {"file_ids": [file.id]}}
-    )
-
-    thread = client.beta.threads.create()
-    client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role='user',
-        content=question
-    )
-
-    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id=assistant.id)
-
-    while run.status not in ["completed", "failed"]:
-        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
-        time.sleep(10)
-
-    messages = client.beta.threads.messages.list(thread_id=thread.id)
-
-    for message in messages:
-        for content in message.content:
-            if content.type == 'image_file':
-                image_data = client.files.content(content.image_file.file_id)
-                image_data_bytes = image_data.read()
-
-                # Ensure the directory exists
-                image_dir = "static/images"
-                os.makedirs(image_dir, exist_ok=True)
-
-                image_filename = f"{image_dir}/{content.image_file.file_id}.png"
-                with open(image_filename, "wb") as file:
-                    file.write(image_data_bytes)
-                return image_filename
-
-    return {"error": "No image generated"}
-
-
-# Flask route to handle both textual and graphical queries
-@app.route('/usa-health', methods=['POST'])
-def ask():
-    data = request.get_json()
-    question = data.get('query')
-    if not question:
-        return jsonify({"error": "No question provided"}), 400
-
-    # Determine whether to process as text or graphical
-    if "plot" in question.lower() or "visual" in question.lower() or "graph" in question.lower() or "draw" in question.lower() or "chart" in question.lower():
-        # result = process_graphical_query(question)
-
-        image_filename = process_graphical_query(question)
-        if isinstance(image_filename, dict) and "error" in image_filename:
-            return jsonify({"error": image_filename["error"]}), 400
-
-        # Return the image file directly
-        return send_file(image_filename, mimetype='image/png')
-
-    else:
-        sql_query = question_to_sql(question)
-        if isinstance(sql_query, dict) and "error" in sql_query:
-            return jsonify({"error": sql_query["error"]}), 400
-
-        execution_result = execute_query_with_steps(sql_query)
-        if "error" in execution_result:
-            return jsonify({"error": execution_result["error"], "steps": execution_result["steps"]}), 400
-
-        return jsonify({"query": sql_query, "data": execution_result["result"], "steps": execution_result["steps"]})
-
-if __name__ == '__main__':
-    app.run(debug=True)
+from flask import Flask, Response, g, request, jsonify, send_file, stream_with_context
+import os
+import json
+import requests
+import sqlite3
+from dotenv import load_dotenv
+import time
+from PIL import Image
+
+from assistant_jobs import JobManager, job_accepted, register_job_routes, run_assistant
+from assistant_registry import AssistantRegistry
+from batch_queries import BatchError, execute_all, parse_batch, translate_all
+from chart_engine import CHART_SPEC_INSTRUCTIONS, ChartSpecError, render_chart, validate_spec
+from chart_store import MIMETYPES, ChartStore, artifact_key, clamp_width, etag_matches, mimetype
+from dataset_catalog import DatasetCatalog, DatasetError
+from openai_client import shared_client
+from query_router import QueryRouter
+from request_metrics import (CONTENT_TYPE, current_trace, metrics, request_finished, request_started, span,
+                             start_trace)
+from result_paging import (DEFAULT_PAGE_SIZE, STREAM_FORMATS, PageTokenError, clamp_page_size, column_metadata,
+                           decode_page_token, encode_page_token, keyset_after, keyset_sql, order_key, paged_sql,
+                           stream_rows)
+from sql_guard import MAX_RESULT_ROWS, STREAM_TIME_BUDGET, QueryGuardError, cap_rows, guarded_query
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Set up OpenAI client: pooled connections, timeouts, retries and a circuit breaker,
+# shared by the chat completion calls and the SDK
+openai_api = shared_client()
+client = openai_api.sdk
+
+# Uploaded dataset files and assistants are created once and reused
+registry = AssistantRegistry(client)
+
+app = Flask(__name__)
+
+# Chart requests run in the background; clients poll or subscribe for the result
+jobs = JobManager()
+register_job_routes(app, jobs)
+
+# Named datasets (datasets.json, or medical.db alone). Each has its own table,
+# read-only connection pool, column descriptions, aggregate tables, question
+# templates and SQL cache; requests without "dataset" get the default one
+catalog = DatasetCatalog.load()
+
+# Rendered and downloaded charts, kept by content and reused per question and data version
+chart_store = ChartStore()
+
+# Chart-or-text decisions, and requests served per tier
+router = QueryRouter()
+
+# Column stores load in the background; until they're ready queries run on SQLite
+for dataset in catalog.datasets.values():
+    if dataset.column_store is not None:
+        dataset.column_store.refresh()
+
+# Function to pick the dataset a request names; DatasetError when there's no such dataset
+def request_dataset(data, args):
+    return catalog.get(data.get('dataset') or args.get('dataset'))
+
+
+# Function to execute a query and return detailed execution steps (for textual queries).
+# Returns one page of at most `limit` rows starting at `offset`; `after` (from
+# the previous page) lets a query with an ORDER BY key seek to it instead.
+def execute_query_with_steps(query, limit=DEFAULT_PAGE_SIZE, offset=0, dataset=None, after=None):
+    dataset = dataset or catalog.default
+    table_name = dataset.table
+    steps = []
+    try:
+        # Check if table exists (cached until the database file changes)
+        if dataset.pool.table_exists(table_name):
+            steps.append(f"Table '{table_name}' exists.")
+        else:
+            steps.append(f"Table '{table_name}' does not exist.")
+            return {"error": f"Table '{table_name}' does not exist.", "steps": steps}
+
+        # Generated queries never produce more than MAX_RESULT_ROWS, however they're paged
+        limit = max(0, min(limit, MAX_RESULT_ROWS - offset))
+        if limit == 0:
+            steps.append(f"Row cap of {MAX_RESULT_ROWS} reached.")
+            return {"result": [], "columns": [], "has_more": False, "steps": steps}
+
+        # Simple counts are answered from the column store without touching SQLite,
+        # except in a batch: its snapshot() may be older or newer than the loaded columns
+        use_column_store = dataset.column_store is not None and not dataset.pool.in_snapshot()
+        answered = dataset.column_store.execute(query) if use_column_store else None
+        if answered is not None:
+            steps.append(f"Answered from the in-memory column store: {query}")
+            return page_rows(*answered, limit, offset, steps)
+
+        # Counts that the aggregate tables already hold skip the full table scan
+        rewrite = dataset.rewriter.rewrite(query)
+        if rewrite:
+            steps.append(f"Answered from aggregate table '{rewrite[1]}': {rewrite[0]}")
+            metrics.inc("aggregate_rewrites_total", 1, "Queries answered from the aggregate tables", table=rewrite[1])
+        else:
+            # Aggregates over a large partitioned dataset run on every file at once
+            plan = dataset.fanout.plan(query) if dataset.fanout else None
+            if plan:
+                return execute_fanout(dataset, query, plan, limit, offset, steps)
+        base_query = rewrite[0] if rewrite else query
+        if after:
+            paged_query = keyset_sql(base_query, after)
+            params = (after["value"], limit + 1, after["ties"])
+        else:
+            paged_query = paged_sql(base_query)
+            params = (limit + 1, offset)
+        with dataset.pool.cursor() as cursor:
+            steps.append(f"Using pooled read-only connection to '{', '.join(dataset.pool.database_paths())}'.")
+            # Read-only authorizer, cross-join plan check and time budget
+            with guarded_query(cursor, paged_query, params, steps):
+                # One extra row tells us whether another page exists
+                with span("sql_execute") as executed:
+                    cursor.execute(paged_query, params)
+                    columns = column_metadata(cursor.description)
+                with span("sql_fetch") as fetched:
+                    result = cursor.fetchmany(limit + 1)
+                    fetched["rows"] = len(result)
+            steps.append(f"Query executed in {executed['ms']} ms: {query}")
+
+        has_more = len(result) > limit and offset + limit < MAX_RESULT_ROWS
+        result = result[:limit]
+        if after:
+            start = f" after {after['column']} = {after['value']!r} (row {offset})"
+        else:
+            start = f" from offset {offset}" if offset else ""
+        steps.append(f"Fetched {len(result)} rows{start} in {fetched['ms']} ms"
+                     + (", more available." if has_more else "."))
+
+        names = [column["name"] for column in columns]
+        next_after = keyset_after(order_key(base_query, names), names, result, after) if has_more else None
+        return {"result": result, "columns": columns, "has_more": has_more, "after": next_after, "steps": steps}
+    
+    except QueryGuardError as e:
+        # guarded_query has already recorded the rejection or timeout in steps
+        return {"error": str(e), "steps": steps}
+
+    except sqlite3.Error as e:
+        steps.append(f"SQLite error occurred: {str(e)}")
+        return {"error": str(e), "steps": steps}
+    
+    except Exception as e:
+        steps.append(f"An error occurred: {str(e)}")
+        return {"error": str(e), "steps": steps}
+
+# Function to answer an aggregate query from every partition of a dataset in
+# parallel, merging the partial aggregates, then page the merged rows
+def execute_fanout(dataset, query, plan, limit, offset, steps):
+    partitions = len(dataset.pool.database_paths())
+    with span("sql_execute", partitions=partitions) as executed:
+        names, rows = dataset.fanout.run(plan, steps=steps)
+    steps.append(f"Query executed on {partitions} partitions in parallel and merged in {executed['ms']} ms: {query}")
+    return page_rows(names, rows, limit, offset, steps)
+
+# Function to page rows that were computed outside a SQLite cursor
+def page_rows(names, rows, limit, offset, steps):
+    result = rows[offset:offset + limit + 1]
+    has_more = len(result) > limit and offset + limit < MAX_RESULT_ROWS
+    result = result[:limit]
+    steps.append(f"Fetched {len(result)} rows" + (f" from offset {offset}" if offset else "")
+                 + (", more available." if has_more else "."))
+    return {"result": result, "columns": [{"name": name} for name in names], "has_more": has_more, "steps": steps}
+
+# Function to build the chat completion request that turns a question into SQL
+def sql_prompt_payload(question, dataset=None):
+    dataset = dataset or catalog.default
+    table_name = dataset.table
+    with span("prompt_build"):
+        # Only the columns relevant to the question (or the full schema when unsure)
+        columns_desc, schema_info = dataset.schema_index.select(question)
+    app.logger.info("Schema prompt: %s", schema_info)
+
+    # prompt = f"Convert the following question to an SQLite query using the table '{table_name}': '{question}' Just give the query thats all."
+    prompt=f"Convert the following question to an SQLite query using the table '{table_name}' "f"with columns ({columns_desc}): '{question}'. Just give the query, that's all."
+    payload = {
+        "model": "gpt-4o",
+        "messages": [
+        {"role": "system", "content": "You are a sql agent,so treat a Yes as a positive value ,and a No as a negative value.Convert all values to lowercase both the prompt and the values of table and then query the table."},
+        {"role": "user", "content": prompt}
+    ],
+        "max_tokens": 1000
+    }
+    return payload
+
+
+# Function to pull the SQL out of the model's reply
+def clean_sql_reply(response):
+    sql_query = response["choices"][0]["message"]["content"].strip()
+
+    # Clean the query if needed
+    if sql_query.startswith("```"):
+        sql_query = sql_query.split("\n", 1)[1]
+        sql_query = sql_query.rsplit("```", 1)[0]
+
+    sql_query = sql_query.replace('Sure,', '').strip()
+    return sql_query
+
+
+# Function to convert a question to an SQL query using OpenAI (for textual queries)
+# Function to convert question to SQL query using OpenAI
+def question_to_sql(question, dataset=None):
+    payload = sql_prompt_payload(question, dataset)
+
+    try:
+        response = openai_api.chat_completion(payload, label="question_to_sql")
+        return clean_sql_reply(response)
+    
+    except requests.exceptions.HTTPError as http_err:
+        return {"error": f"HTTP error occurred: {http_err}"}
+    except requests.exceptions.RequestException as req_err:
+        return {"error": f"Request error occurred: {req_err}"}
+    except Exception as err:
+        return {"error": f"An error occurred: {err}"}
+
+
+# Function to build the chat completion request for a chart spec
+def chart_spec_payload(question, dataset=None):
+    dataset = dataset or catalog.default
+    with span("prompt_build"):
+        columns_desc, _ = dataset.schema_index.select(question)
+    prompt = f"Table '{dataset.table}' has columns ({columns_desc}). Chart request: '{question}'"
+    payload = {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": CHART_SPEC_INSTRUCTIONS},
+            {"role": "user", "content": prompt}
+        ],
+        "response_format": {"type": "json_object"},
+        "max_tokens": 600
+    }
+    return payload
+
+
+# Function to turn a chart request into a chart spec (SQL + chart type + fields) using OpenAI
+def question_to_chart_spec(question, dataset=None):
+    payload = chart_spec_payload(question, dataset)
+
+    try:
+        response = openai_api.chat_completion(payload, label="question_to_chart_spec")
+        return json.loads(response["choices"][0]["message"]["content"])
+    except requests.exceptions.RequestException as req_err:
+        return {"error": f"Request error occurred: {req_err}"}
+    except Exception as err:
+        return {"error": f"An error occurred: {err}"}
+
+
+# Function to draw a count-by-category chart from the question templates, without OpenAI; None otherwise
+def template_chart(question, fmt="png", dataset=None):
+    dataset = dataset or catalog.default
+    with span("template_parse") as parsed:
+        spec = dataset.templates.chart_spec(question)
+        parsed["matched"] = spec is not None
+    return render_local_chart(spec, fmt, dataset) if spec else None
+
+
+# Function to render a chart locally from SQLite; None when Code Interpreter is needed
+def process_local_chart(question, fmt="png", dataset=None):
+    return render_local_chart(question_to_chart_spec(question, dataset), fmt, dataset)
+
+
+# Function to render a chart spec from SQLite; None when it can't be drawn here
+def render_local_chart(spec, fmt="png", dataset=None):
+    dataset = dataset or catalog.default
+    if "error" in spec:
+        app.logger.warning("Chart spec unavailable: %s", spec["error"])
+        return None
+    try:
+        artifact, cached = render_chart(validate_spec(spec), dataset.pool, chart_store, fmt, rewriter=dataset.rewriter,
+                                        column_store=dataset.column_store)
+    except (ChartSpecError, sqlite3.Error) as e:
+        app.logger.info("Falling back to Code Interpreter: %s", e)
+        return None
+    app.logger.info("Rendered chart locally (%s)", "cached" if cached else "new")
+    metrics.inc("chart_cache_total", 1, "Local chart renders by chart cache result", result="hit" if cached else "miss")
+    return artifact
+
+
+# Function to handle graphical queries (e.g., plotting data)
+def process_graphical_query(question, dataset=None, on_event=None):
+    dataset = dataset or catalog.default
+    assistant_id = registry.get_assistant_id(
+        dataset.csv_path,
+        "You are a personal data analyst. Generate a chart for the requested data.",
+        name="Chart Maker"
+    )
+
+    with span("assistant_run"):
+        messages = run_assistant(client, assistant_id, question, on_event=on_event)
+
+    for message in messages:
+        for content in message.content:
+            if content.type == 'image_file':
+                with span("file_download") as downloaded:
+                    image_data = client.files.content(content.image_file.file_id)
+                    image_data_bytes = image_data.read()
+                    downloaded["bytes"] = len(image_data_bytes)
+
+                # Kept under the question, so asking it again needs neither a run nor a download
+                artifact = chart_store.put(artifact_key(question, dataset.data_version()), image_data_bytes, "png")
+                return artifact.path
+
+    return {"error": "No image generated"}
+
+
+# Stream every row of a query as NDJSON or CSV without holding the result in memory
+def stream_query_response(sql_query, stream_format, cache_tier, dataset=None):
+    dataset = dataset or catalog.default
+    if not dataset.pool.table_exists(dataset.table):
+        return jsonify({"error": f"Table '{dataset.table}' does not exist."}), 400
+    tier = query_tier(cache_tier)
+    if tier is not None:
+        router.record("text", tier)
+    try:
+        rewrite = dataset.rewriter.rewrite(sql_query)
+        capped_query = cap_rows(rewrite[0] if rewrite else sql_query)
+        steps = []
+        # A stream lasts as long as the client takes to read it, so it isn't slow-query logged
+        guard = lambda cursor: guarded_query(cursor, capped_query, steps=steps, time_budget=STREAM_TIME_BUDGET,
+                                             slow_query_seconds=None)
+        columns, mimetype, body = stream_rows(dataset.pool.cursor, capped_query, stream_format, guard=guard)
+    except (QueryGuardError, sqlite3.Error) as e:
+        return jsonify({"error": str(e), "query": sql_query, "steps": steps}), 400
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        "X-Query-Columns": ",".join(column["name"] for column in columns),
+        "X-SQL-Cache": cache_tier,
+        "X-Query-Tier": str(tier),
+    })
+
+
+# Function to read the requested chart format and width; None keeps what is stored
+def chart_variant_args(data, args):
+    fmt = (data.get('format') or args.get('format') or '').lower()
+    return (fmt if fmt in MIMETYPES else None), clamp_width(data.get('width') or args.get('width'))
+
+
+# Function to find the chart already made for this question on the current data
+def stored_chart(question, render_fmt="png", dataset=None):
+    return chart_store.get(artifact_key(question, (dataset or catalog.default).data_version(), render_fmt))
+
+
+# Function to remember which chart answered a question on the current data
+def remember_chart(question, artifact, dataset=None):
+    chart_store.link(artifact_key(question, (dataset or catalog.default).data_version(), artifact.ext), artifact)
+
+
+# Caching headers for a chart; its ETag is the content digest
+def chart_headers(artifact, source, cache_control="no-cache", tier=None):
+    headers = {
+        "ETag": f'"{artifact.digest}"',
+        "Cache-Control": cache_control,
+        "Content-Location": f"/usa-health/charts/{artifact.digest}.{artifact.ext}",
+        "X-Chart-Source": source,
+    }
+    if tier is not None:
+        headers["X-Query-Tier"] = str(tier)
+    return headers
+
+
+# Function to send a chart in the requested format and width, or 304 when the client already has it
+def chart_response(artifact, fmt=None, width=None, source="store", cache_control="no-cache", tier=None):
+    artifact = chart_store.variant(artifact, fmt, width)
+    headers = chart_headers(artifact, source, cache_control, tier)
+    if etag_matches(request.headers.get("If-None-Match"), artifact):
+        return Response(status=304, headers=headers)
+    response = send_file(os.path.abspath(artifact.path), mimetype=mimetype(artifact))
+    response.headers.update(headers)
+    return response
+
+
+# Function to decide whether a question asks for a chart rather than an answer
+def is_chart_request(question):
+    return router.is_chart(question)
+
+
+# Function to look up SQL already generated for this (or a near-identical) question
+def cached_sql(question, dataset=None):
+    with span("sql_cache_lookup") as lookup:
+        sql_query, cache_tier = (dataset or catalog.default).sql_cache.lookup(question)
+        lookup["result"] = cache_tier
+    return sql_query, cache_tier
+
+
+# Function to find SQL without OpenAI: the question templates (tier 0), then the SQL cache.
+# A None query means question_to_sql (tier 1) has to translate it
+def local_sql(question, dataset=None):
+    dataset = dataset or catalog.default
+    with span("template_parse") as parsed:
+        sql_query = dataset.templates.sql(question)
+        parsed["matched"] = sql_query is not None
+    if sql_query is not None:
+        return sql_query, "template"
+    return cached_sql(question, dataset)
+
+
+# Function to name the tier that produced a text query's SQL; None for follow-up pages
+def query_tier(cache_tier):
+    return {"template": 0, "miss": 1, "page": None}.get(cache_tier, "cache")
+
+
+# Function to turn an executed text query into the /usa-health response body and status
+def text_query_response(question, sql_query, cache_tier, offset, execution_result, timings=True, dataset=None):
+    dataset = dataset or catalog.default
+    steps = list(execution_result["steps"])
+    tier = query_tier(cache_tier)
+    if tier is not None:
+        router.record("text", tier)
+    if cache_tier == "template":
+        steps.insert(0, "Translated from a question template without OpenAI (tier 0).")
+    elif cache_tier not in ("miss", "page"):
+        steps.insert(0, f"Reused cached SQL ({cache_tier} match).")
+    if "error" in execution_result:
+        trace = current_trace() if timings else None
+        if trace is not None:
+            steps.append(trace.describe())
+        return {"error": execution_result["error"], "steps": steps}, 400
+
+    # Only SQL that actually ran is worth replaying
+    if cache_tier == "miss":
+        dataset.sql_cache.store(question, sql_query)
+
+    next_page_token = None
+    if execution_result["has_more"]:
+        next_page_token = encode_page_token(sql_query, offset + len(execution_result["result"]),
+                                            None if dataset is catalog.default else dataset.name,
+                                            execution_result.get("after"))
+
+    body = {"query": sql_query, "columns": execution_result["columns"], "data": execution_result["result"],
+            "next_page_token": next_page_token, "steps": steps, "cache": cache_tier, "tier": tier}
+    trace = current_trace() if timings else None
+    if trace is not None:
+        steps.append(trace.describe())
+        body["timings"] = list(trace.spans)
+    return body, 200
+
+
+# Every request gets a trace of its stages and counts towards the request metrics
+@app.before_request
+def start_request_metrics():
+    g.trace = start_trace()
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_started = request_started(g.metrics_route)
+
+
+@app.after_request
+def add_server_timing(response):
+    if g.get("trace") is not None and g.trace.spans:
+        response.headers["Server-Timing"] = g.trace.server_timing()
+    g.metrics_status = response.status_code
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(_):
+    if g.get("metrics_started") is not None:
+        request_finished(g.metrics_route, g.get("metrics_status", 500), g.metrics_started)
+
+
+# Flask route to handle both textual and graphical queries
+@app.route('/usa-health', methods=['POST'])
+def ask():
+    data = request.get_json()
+    question = data.get('query')
+    page_token = data.get('page_token') or request.args.get('page_token')
+    if not question and not page_token:
+        return jsonify({"error": "No question provided"}), 400
+    try:
+        dataset = request_dataset(data, request.args)
+    except DatasetError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Determine whether to process as text or graphical
+    if not page_token and is_chart_request(question):
+        fmt, width = chart_variant_args(data, request.args)
+        render_fmt = "svg" if fmt == "svg" else "png"
+        # The same question on the same data is answered from the chart store
+        artifact = stored_chart(question, render_fmt, dataset)
+        if artifact is not None:
+            router.record("graph", "cache")
+            return chart_response(artifact, fmt, width, "store", tier="cache")
+
+        # Most charts are counts or distributions that SQLite + matplotlib can
+        # draw here, from a template spec (tier 0) or a gpt-4o one (tier 1)
+        artifact, tier = template_chart(question, render_fmt, dataset), 0
+        if artifact is None:
+            artifact, tier = process_local_chart(question, render_fmt, dataset), 1
+        if artifact:
+            remember_chart(question, artifact, dataset)
+            router.record("graph", tier)
+            return chart_response(artifact, fmt, width, "local", tier=tier)
+
+        # Code Interpreter charts only come as PNG, and may already be stored
+        artifact = stored_chart(question, "png", dataset) if render_fmt != "png" else None
+        if artifact is not None:
+            router.record("graph", "cache")
+            return chart_response(artifact, fmt, width, "store", tier="cache")
+        if not dataset.csv_path:
+            return jsonify({"error": f"Dataset '{dataset.name}' has no CSV for Code Interpreter charts"}), 400
+
+        # Anything else goes to Code Interpreter (tier 2), which takes a while,
+        # so hand back a job id and render in the background
+        router.record("graph", 2)
+        return job_accepted(jobs.submit(process_graphical_query, question, dataset))
+
+    else:
+        stream_format = (data.get('stream') or request.args.get('stream') or '').lower()
+        if stream_format and stream_format not in STREAM_FORMATS:
+            return jsonify({"error": f"Unknown stream format '{stream_format}', use one of: {', '.join(STREAM_FORMATS)}"}), 400
+        try:
+            limit = clamp_page_size(data.get('limit') or request.args.get('limit'))
+            # A page token carries the SQL and offset of the next page, so no translation is needed
+            if page_token:
+                sql_query, offset, page_dataset, after = decode_page_token(page_token)
+                dataset = catalog.get(page_dataset)
+                cache_tier = "page"
+        except (PageTokenError, DatasetError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        if not page_token:
+            offset, after = 0, None
+            sql_query, cache_tier = local_sql(question, dataset)
+            if sql_query is None:
+                sql_query = question_to_sql(question, dataset)
+                if isinstance(sql_query, dict) and "error" in sql_query:
+                    return jsonify({"error": sql_query["error"]}), 400
+
+        if stream_format:
+            return stream_query_response(sql_query, stream_format, cache_tier, dataset)
+
+        execution_result = execute_query_with_steps(sql_query, limit, offset, dataset, after)
+        body, status = text_query_response(question, sql_query, cache_tier, offset, execution_result, dataset=dataset)
+        with span("serialize"):
+            response = jsonify(body)
+        return response, status
+
+
+# Function to translate one question of a batch: the templates or the SQL cache first, then OpenAI
+def batch_translate(question, dataset=None):
+    if is_chart_request(question):
+        return {"error": "Chart questions can't be batched; send them to /usa-health"}, None
+    sql_query, cache_tier = local_sql(question, dataset)
+    if sql_query is None:
+        sql_query = question_to_sql(question, dataset)
+    return sql_query, cache_tier
+
+
+# Function to answer a batch of text questions: translated together, identical
+# SQL run once, and every query read from one snapshot of the database
+def answer_batch(questions, limit, dataset=None):
+    dataset = dataset or catalog.default
+    translations = translate_all(questions, lambda question: batch_translate(question, dataset))
+    queries = [None if isinstance(sql_query, dict) else sql_query for sql_query, _ in translations]
+    if not dataset.pool.table_exists(dataset.table):
+        return {"error": f"Table '{dataset.table}' does not exist."}, 400
+
+    executions = execute_all(queries, lambda sql_query: execute_query_with_steps(sql_query, limit, 0, dataset),
+                             dataset.pool)
+    results = []
+    for question, (sql_query, cache_tier), execution_result in zip(questions, translations, executions):
+        if isinstance(sql_query, dict):
+            results.append({"error": sql_query["error"], "status": 400})
+            continue
+        body, status = text_query_response(question, sql_query, cache_tier, 0, execution_result, timings=False,
+                                           dataset=dataset)
+        results.append(dict(body, status=status))
+
+    body = {"results": results, "dataset": dataset.name, "data_version": dataset.pool.data_version(),
+            "distinct_queries": len(set(query for query in queries if query is not None))}
+    trace = current_trace()
+    if trace is not None:
+        body["steps"] = [trace.describe()]
+        body["timings"] = list(trace.spans)
+    return body, 200
+
+
+# Flask route to answer many text questions in one request; results come back in order
+@app.route('/usa-health/batch', methods=['POST'])
+def ask_batch():
+    data = request.get_json(silent=True) or {}
+    try:
+        questions = parse_batch(data)
+        limit = clamp_page_size(data.get('limit') or request.args.get('limit'))
+        dataset = request_dataset(data, request.args)
+    except (BatchError, PageTokenError, DatasetError) as e:
+        return jsonify({"error": str(e)}), 400
+    body, status = answer_batch(questions, limit, dataset)
+    with span("serialize"):
+        response = jsonify(body)
+    return response, status
+
+
+# A stored chart by content digest; the URL never changes meaning, so it is cacheable for good
+@app.route('/usa-health/charts/<digest>.<ext>', methods=['GET'])
+def chart_artifact(digest, ext):
+    artifact = chart_store.by_digest(digest, ext)
+    if artifact is None:
+        return jsonify({"error": "Unknown chart"}), 404
+    fmt, width = chart_variant_args({}, request.args)
+    return chart_response(artifact, fmt, width, "store", cache_control="public, max-age=31536000, immutable")
+
+
+# Hit/miss counts for the question-to-SQL cache of a dataset (the default one unless ?dataset= names another)
+@app.route('/usa-health/cache-stats', methods=['GET'])
+def cache_stats():
+    try:
+        dataset = request_dataset({}, request.args)
+    except DatasetError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify(dataset.sql_cache.summary())
+
+
+# The datasets questions can be asked about, with their files and data versions
+@app.route('/usa-health/datasets', methods=['GET'])
+def datasets():
+    return jsonify(catalog.describe())
+
+
+# Latency, retries and token usage of OpenAI calls, and the circuit breaker state
+@app.route('/usa-health/openai-stats', methods=['GET'])
+def openai_stats():
+    return jsonify(openai_api.summary())
+
+
+# Requests served per tier, and the share answered without an LLM call
+@app.route('/usa-health/router-stats', methods=['GET'])
+def router_stats():
+    return jsonify(router.summary())
+
+# Values computed when /metrics is scraped
+def app_metrics():
+    cache, charts = catalog.default.sql_cache.summary(), chart_store.summary()
+    chart_hits, chart_misses = metrics.value("chart_cache_total", result="hit"), metrics.value("chart_cache_total", result="miss")
+    return [
+        ("sql_cache_lookups_total", "counter", "SQL cache lookups by result",
+         [({"result": result}, cache[result]) for result in ("exact_hits", "semantic_hits", "misses")]),
+        ("sql_cache_hit_ratio", "gauge", "Share of SQL cache lookups answered from the cache", [({}, cache["hit_ratio"])]),
+        ("chart_cache_hit_ratio", "gauge", "Share of local charts served from the chart cache",
+         [({}, round(chart_hits / (chart_hits + chart_misses), 4) if chart_hits + chart_misses else 0.0)]),
+        ("chart_store_lookups_total", "counter", "Chart store lookups by result",
+         [({"result": "hit"}, charts["hits"]), ({"result": "miss"}, charts["misses"])]),
+        ("chart_store_bytes", "gauge", "Size of the stored chart files", [({}, charts["bytes"])]),
+        ("chart_store_evicted_total", "counter", "Chart store entries evicted", [({}, charts["evicted"])]),
+        ("assistant_jobs", "gauge", "Background chart jobs by status",
+         [({"status": status}, count) for status, count in jobs.counts().items()]),
+        ("router_llm_offload_ratio", "gauge", "Share of requests answered without an LLM call",
+         [({}, router.summary()["llm_offload_ratio"])]),
+        ("column_store_rows", "gauge", "Rows held in each dataset's column store",
+         [({"dataset": name}, dataset.column_store.summary()["rows"])
+          for name, dataset in catalog.datasets.items() if dataset.column_store is not None]),
+        ("openai_circuit_open", "gauge", "1 while the OpenAI circuit breaker is open",
+         [({}, 1 if openai_api.breaker.state == "open" else 0)]),
+    ]
+
+
+metrics.add_collector(app_metrics)
+
+
+# Prometheus metrics: stage and request latency histograms, cache hit ratios, in-flight gauges
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+if __name__ == '__main__':
+    app.run(debug=True)